@@ -1,85 +1,507 @@
 #!/bin/env python3
 
+import collections
+import json
 import os
 import sys
 import re
+import threading
+import time
 import cs_db
 import cs_environment
 import cx_Oracle
 from cs_logging import logmsg
 
-def get_constant_value(constant_cd, logfile=None):
-    db = cs_db.DataBase()
-    
-    # Establish generic Oracle acct to use
-    if os.getenv("CS_PROD") == 'D':
-        db_user = 'OracleInteractive_Prod'
-    else:
-        db_user = 'OracleInteractive'
-    
-    # Connect to Oracle
-    conn, cursor = db.oracle_connect(db_user, AlwaysUseGenericID=1)
-    if conn == None:
-        logmsg("Unable to connect to database")
-        sys.exit(1)
-    
-    # Run SQL to query for constant_value
-    sql = "SELECT char_constant_tx FROM um_constants WHERE UPPER(constant_cd) = UPPER('{}')".format(constant_cd)
-    try:
-        cursor.execute(sql)
-    except cx_Oracle.DatabaseError as exc:
+# Oracle allows at most 1000 expressions in an IN list
+MAX_IN_LIST = 1000
+
+# %dest_...% token of a destination string, captured so that re.split keeps it
+DEST_TOKEN = re.compile('(%dest_[^%]*%)', re.IGNORECASE)
+
+# Maximum nesting of destination tokens inside constant values
+MAX_SUBSTITUTION_DEPTH = 10
+
+# Layout version of the preload snapshot file, snapshots of another version are ignored
+SNAPSHOT_VERSION = 1
+
+
+class ConstantLookup:
+    """
+    Looks up um_constants values and keeps them in memory.
+
+    Every lookup goes through one Oracle connection that stays open for the life of the
+    process (or through a cx_Oracle SessionPool when one is given), instead of a new login
+    per call. Queries use bind variables so Oracle reuses the parsed cursor. Values are
+    cached for ttl seconds, and the least recently used ones are evicted past max_entries.
+
+    preload() fetches the whole table, or the constants with a given prefix, in one query and
+    keeps them until the next preload. It can also save them to a snapshot file that later
+    processes load without touching Oracle while the table is unchanged.
+    """
+
+    def __init__(self, ttl=300, max_entries=1024, pool=None):
+        """
+        Construct a new ConstantLookup object.
+
+        :param ttl: seconds a constant value is reused before it is queried again (0 disables the cache)
+        :param max_entries: maximum number of cached constant values
+        :param pool: optional cx_Oracle.SessionPool to acquire connections from. By default a single
+                     cs_db connection is opened on the first lookup and shared
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.pool = pool
+        self._cache = collections.OrderedDict() # UPPER(constant_cd) -> (value, expiry time)
+        self._cache_lock = threading.Lock()
+        self._preloaded = {} # UPPER(constant_cd) -> value, replaced as a whole by preload()
+        self._conn = None
+        self._conn_lock = threading.Lock()
+
+    def close(self):
+        """
+        Closes the shared connection, it is opened again by the next lookup
+        """
+        with self._conn_lock:
+            if self._conn is not None:
+                try:
+                    self._conn.close()
+                except cx_Oracle.DatabaseError:
+                    pass
+                self._conn = None
+
+    def clear(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+    def _connect(self):
+        """
+        Opens the shared connection with the generic Oracle account
+        """
+        db = cs_db.DataBase()
+
+        # Establish generic Oracle acct to use
+        if os.getenv("CS_PROD") == 'D':
+            db_user = 'OracleInteractive_Prod'
+        else:
+            db_user = 'OracleInteractive'
+
+        # Connect to Oracle
+        conn, cursor = db.oracle_connect(db_user, AlwaysUseGenericID=1)
+        if conn == None:
+            logmsg("Unable to connect to database")
+            sys.exit(1)
+        cursor.close()
+        return conn
+
+    def _query(self, sql, binds, logfile=None, arraysize=None):
+        """
+        Runs a query and returns all rows, or None if it fails.
+        arraysize sets the number of rows fetched per round-trip.
+
+        A failure on the shared connection drops it and the query is retried once
+        on a new connection, in case the session was closed by the server.
+
+        Sessions acquired from a pool run concurrently; only the shared connection is
+        used under the lock.
+        """
+        for attempt in range(2):
+            if self.pool is not None:
+                conn = self.pool.acquire()
+                try:
+                    return self._execute(conn, sql, binds, arraysize)
+                except cx_Oracle.DatabaseError as exc:
+                    self._log_error(exc, logfile)
+                finally:
+                    self.pool.release(conn)
+                continue
+
+            with self._conn_lock:
+                if self._conn is None:
+                    self._conn = self._connect()
+                try:
+                    return self._execute(self._conn, sql, binds, arraysize)
+                except cx_Oracle.DatabaseError as exc:
+                    self._log_error(exc, logfile)
+                    try:
+                        self._conn.close()
+                    except cx_Oracle.DatabaseError:
+                        pass
+                    self._conn = None
+        return None
+
+    @staticmethod
+    def _execute(conn, sql, binds, arraysize):
+        cursor = conn.cursor()
+        try:
+            if arraysize:
+                cursor.arraysize = arraysize
+            cursor.execute(sql, binds)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _log_error(exc, logfile):
         error, = exc.args
-        logmsg("ERROR: Oracle-Error-Message: {0}\n".format(error.message), logfile)
-    
-    data = cursor.fetchall()
-    if data:
-        if len(data[0]) > 1:
+        logmsg("ERROR: Oracle-Error-Message: {0}\n".format(getattr(error, 'message', error)), logfile)
+
+    def _get_cached(self, key):
+        value = self._preloaded.get(key)
+        if value is not None:
+            return value
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return entry[0]
+
+    def _cache_value(self, key, value):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = (value, time.time() + self.ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    @staticmethod
+    def _prefix_filter(prefix):
+        """
+        Returns the WHERE clause and binds selecting the constants starting with prefix
+        """
+        if not prefix:
+            return "", {}
+        escaped = prefix.upper().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return " WHERE UPPER(constant_cd) LIKE :prefix ESCAPE '\\'", {'prefix': escaped + '%'}
+
+    def _table_version(self, prefix=None, logfile=None):
+        """
+        Returns (row count, highest ORA_ROWSCN) of the preloaded rows. Any insert, update or
+        delete changes one of them, so they tell whether a snapshot is still current.
+        """
+        where, binds = self._prefix_filter(prefix)
+        data = self._query("SELECT COUNT(*), MAX(ORA_ROWSCN) FROM um_constants" + where, binds, logfile)
+        return list(data[0]) if data else None
+
+    @staticmethod
+    def _load_snapshot(snapshot_file, prefix):
+        try:
+            with open(snapshot_file) as snapshot:
+                data = json.load(snapshot)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != SNAPSHOT_VERSION or data.get('prefix') != prefix:
+            return None
+        return data
+
+    @staticmethod
+    def _save_snapshot(snapshot_file, data):
+        """
+        Writes the snapshot atomically, readable by the owner only
+        """
+        tmp_file = '{}.{}.tmp'.format(snapshot_file, os.getpid())
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as snapshot:
+            json.dump(data, snapshot)
+        os.replace(tmp_file, snapshot_file)
+
+    def preload(self, prefix=None, snapshot_file=None, max_age=0, logfile=None):
+        """
+        Process: Loads the constants into memory with one query
+
+        With a snapshot_file, the snapshot is used instead of the query when it was taken with the
+        same prefix and the table has not changed since (same row count and highest ORA_ROWSCN).
+        The table check is skipped for snapshots younger than max_age seconds, so those load
+        without connecting to Oracle. The snapshot is rewritten whenever the table is queried.
+
+        :param prefix: only load the constants whose code starts with prefix (case-insensitive)
+        :param snapshot_file: optional local snapshot file of the preloaded constants
+        :param max_age: seconds a snapshot is trusted without checking the table
+        :param logfile: optional log file for error messages
+        :return: number of constants preloaded, or None if they could not be fetched
+        """
+        prefix = prefix.upper() if prefix else None
+        snapshot = self._load_snapshot(snapshot_file, prefix) if snapshot_file else None
+        table_version = None
+        if snapshot is not None and time.time() - snapshot['created'] >= max_age:
+            table_version = self._table_version(prefix, logfile)
+            if table_version != snapshot['table_version']:
+                snapshot = None
+
+        if snapshot is None:
+            if snapshot_file and table_version is None:
+                table_version = self._table_version(prefix, logfile)
+            where, binds = self._prefix_filter(prefix)
+            data = self._query("SELECT UPPER(constant_cd), char_constant_tx FROM um_constants" + where, binds, logfile, arraysize=5000)
+            if data is None:
+                return None
+            rows = collections.defaultdict(list)
+            for key, value in data:
+                rows[key].append(value)
+            duplicates = sorted(key for key, values in rows.items() if len(values) > 1)
+            if duplicates:
+                # Left out, so get() still reports them as ambiguous
+                logmsg("ERROR: More than 1 result for {}, unable to determine correct constant values".format(', '.join(duplicates)), logfile)
+            snapshot = {
+                'version': SNAPSHOT_VERSION,
+                'created': time.time(),
+                'prefix': prefix,
+                'table_version': table_version,
+                'constants': {key: values[0] for key, values in rows.items() if len(values) == 1},
+            }
+            if snapshot_file:
+                try:
+                    self._save_snapshot(snapshot_file, snapshot)
+                except OSError as err:
+                    logmsg("ERROR: Unable to save the constants snapshot {}: {}".format(snapshot_file, err), logfile)
+
+        # Snapshots hold the raw values, so a change of the path conversion applies to them too
+        self._preloaded = {key: convert_windows_path_to_unix(value) for key, value in snapshot['constants'].items() if value is not None}
+        logmsg("Preloaded {} constants".format(len(self._preloaded)), logfile)
+        return len(self._preloaded)
+
+    def get(self, constant_cd, logfile=None):
+        """
+        Process: Returns the value of a constant, converted to a UNIX path
+
+        :param constant_cd: constant code (case-insensitive)
+        :param logfile: optional log file for error messages
+        :return: the constant value, or None if it is not found, not unique or NULL
+        """
+        key = constant_cd.upper()
+        value = self._get_cached(key)
+        if value is not None:
+            return value
+
+        data = self._query("SELECT char_constant_tx FROM um_constants WHERE UPPER(constant_cd) = :constant_cd", {'constant_cd': key}, logfile)
+        if not data:
+            logmsg("ERROR: No constant value found for {}".format(constant_cd), logfile)
+            return None
+        if len(data) > 1:
             logmsg("ERROR: More than 1 result, unable to determine correct constant value", logfile)
             return None
+        if data[0][0] is None:
+            logmsg("ERROR: Constant {} has no value".format(constant_cd), logfile)
+            return None
+
+        # Change from Windows format to UNIX format
+        value = convert_windows_path_to_unix(data[0][0])
+        self._cache_value(key, value)
+        return value
+
+    def get_many(self, constant_cds, logfile=None):
+        """
+        Process: Returns the values of several constants, querying the uncached ones together
+
+        :param constant_cds: iterable of constant codes (case-insensitive)
+        :param logfile: optional log file for error messages
+        :return: dictionary of constant code (as given) -> value converted to a UNIX path.
+                 Constants that are not found, not unique or NULL are left out
+        """
+        constant_cds = list(dict.fromkeys(constant_cds))
+        values = {}
+        missing = []
+        for key in dict.fromkeys(constant_cd.upper() for constant_cd in constant_cds):
+            value = self._get_cached(key)
+            if value is None:
+                missing.append(key)
+            else:
+                values[key] = value
+
+        for start in range(0, len(missing), MAX_IN_LIST):
+            chunk = missing[start:start + MAX_IN_LIST]
+            # Pad the bind list to a power of two so a handful of statements cover every chunk size
+            size = 1
+            while size < len(chunk):
+                size *= 2
+            size = min(size, MAX_IN_LIST)
+            binds = {'c{}'.format(i): chunk[i] if i < len(chunk) else None for i in range(size)}
+            sql = "SELECT UPPER(constant_cd), char_constant_tx FROM um_constants WHERE UPPER(constant_cd) IN ({})"\
+                .format(', '.join(':c{}'.format(i) for i in range(size)))
+            data = self._query(sql, binds, logfile)
+            if data is None:
+                continue
+
+            rows = collections.defaultdict(list)
+            for key, value in data:
+                rows[key].append(value)
+            for key, matches in rows.items():
+                if len(matches) > 1:
+                    logmsg("ERROR: More than 1 result for {}, unable to determine correct constant value".format(key), logfile)
+                    continue
+                if matches[0] is None:
+                    logmsg("ERROR: Constant {} has no value".format(key), logfile)
+                    continue
+                values[key] = convert_windows_path_to_unix(matches[0])
+                self._cache_value(key, values[key])
+
+        return {constant_cd: values[constant_cd.upper()] for constant_cd in constant_cds if constant_cd.upper() in values}
+
+
+_default_lookup = ConstantLookup()
+
+
+def get_constant_value(constant_cd, logfile=None):
+    return _default_lookup.get(constant_cd, logfile)
+
+
+def preload_constants(prefix=None, snapshot_file=None, max_age=0, logfile=None):
+    """
+    Loads um_constants into memory for get_constant_value, see ConstantLookup.preload
+    """
+    return _default_lookup.preload(prefix, snapshot_file, max_age, logfile)
+
+class PathTranslator:
+    """
+    Translates Windows UNC paths to UNIX paths with a table of UNC host -> mount point prefixes.
+
+    The backslashes are turned into slashes and every prefix is replaced in one scan of a
+    single compiled regex. The table is applied as a series of replacements in its order,
+    so when a replacement could chain into another one (two UNC hosts back to back) the path
+    falls back to replacing each prefix in turn and the result stays the same.
+    """
+
+    def __init__(self, mapping=None):
+        """
+        Construct a new PathTranslator object.
+
+        :param mapping: ordered dictionary (or list of pairs) of UNC prefix -> UNIX prefix, written with
+                        forward slashes, e.g. {'//sicrops.schwab.com/': '/NAS/'}. By default the file named
+                        by CS_UNC_PATH_MAP is loaded, or DEFAULT_UNC_PATH_MAP if that is not set
+        """
+        if mapping is None:
+            config_file = os.getenv('CS_UNC_PATH_MAP')
+            mapping = self.load_mapping(config_file) if config_file else DEFAULT_UNC_PATH_MAP
+        self.mapping = collections.OrderedDict(mapping)
+        self._pattern = re.compile('|'.join(re.escape(prefix) for prefix in self.mapping))
+        # Every UNC prefix contains '//', so a path without it can skip the regex
+        self._marker = '//' if all('//' in prefix for prefix in self.mapping) else ''
+        mounts = set(self.mapping.values())
+        if len(mounts) == 1:
+            # One mount point for every host (the usual case), let re substitute it without a callback
+            self._replacement = mounts.pop().replace('\\', '\\\\')
+        else:
+            self._replacement = lambda match: self.mapping[match.group(0)]
+
+    @staticmethod
+    def load_mapping(config_file):
+        """
+        Reads a mapping from a JSON file holding an object of UNC prefix -> UNIX prefix
+        """
+        with open(config_file) as mapping_file:
+            return json.load(mapping_file, object_pairs_hook=collections.OrderedDict)
+
+    def _replace_in_turn(self, path):
+        for prefix, mount in self.mapping.items():
+            path = path.replace(prefix, mount)
+        return path
+
+    def translate(self, path):
+        """
+        Process: Converts a path from Windows format to UNIX format
+        """
+        path = path.replace('\\', '/')
+        if self._marker not in path or not self.mapping:
+            return path
+        unix_path = self._pattern.sub(self._replacement, path)
+        if self._marker in unix_path and self._pattern.search(unix_path):
+            return self._replace_in_turn(path)
+        return unix_path
+
+    def translate_many(self, paths):
+        """
+        Process: Converts an iterable of paths, yielding the results in order
+        """
+        translate = self.translate
+        for path in paths:
+            yield translate(path)
+
+    def translate_file(self, input_file, output_file, encoding='utf-8'):
+        """
+        Process: Converts a file with one path per line into another file, streaming line by line
+
+        :return: number of paths converted
+        """
+        count = 0
+        translate = self.translate
+        with open(input_file, encoding=encoding, newline='') as source, open(output_file, 'w', encoding=encoding, newline='') as target:
+            for line in source:
+                path = line.rstrip('\r\n')
+                target.write(translate(path) + line[len(path):])
+                count += 1
+        return count
+
+
+# UNC prefixes used when CS_UNC_PATH_MAP does not name a mapping file
+DEFAULT_UNC_PATH_MAP = [
+    ('//sicrops.schwab.com/', '/NAS/'),
+    ('//nas30u0pdv.dev.schwab.com/', '/NAS/'),
+    ('//nas30u0a2b.cdc.schwab.com/', '/NAS/'),
+    ('//nas30u0cdc.cdc.schwab.com/', '/NAS/'),
+]
+
+_default_translator = None
+
+
+def get_path_translator():
+    """
+    Returns the PathTranslator used by convert_windows_path_to_unix, created on first use
+    """
+    global _default_translator
+    if _default_translator is None:
+        _default_translator = PathTranslator()
+    return _default_translator
 
-        constant_value = data[0][0]
-    
-    # Change from Windows format to UNIX format
-    constant_value = convert_windows_path_to_unix(constant_value)
-    return constant_value
 
 def convert_windows_path_to_unix(path):
-    unix_path = re.sub(r'\\', '/', path)
-    unix_path = unix_path.replace('//sicrops.schwab.com/', '/NAS/')
-    unix_path = unix_path.replace('//nas30u0pdv.dev.schwab.com/', '/NAS/')
-    unix_path = unix_path.replace('//nas30u0a2b.cdc.schwab.com/', '/NAS/')
-    unix_path = unix_path.replace('//nas30u0cdc.cdc.schwab.com/', '/NAS/')
-    return unix_path
+    return get_path_translator().translate(path)
     
     
 def substitute_destination(dest_variable_string, logfile=None):
-    if '%dest_' not in dest_variable_string.lower():
-        return dest_variable_string
-    if dest_variable_string.lower().index('%dest_') < 0:
-        return dest_variable_string
-    
-    while dest_variable_string.lower().index('%dest_') >= 0:
-        # Get the start position of the first occurance of %dest_
-        start = dest_variable_string.lower().index('%dest_')
-        # Get the end position of the first occurance of %dest_
-        end = dest_variable_string.lower().index('%', start+1)
-        # Compute the difference of the end position and the start position
-        diff = end - start
-        # Save the full string to be replaced, including the '%' signs
-        dyn_dest_string = dest_variable_string[start:diff+1]
-        # Get the destination value
-        str_replace = get_constant_value(dyn_dest_string)
-        
-        if not str_replace:
-            logmsg("ERROR: Unable to get constant value for the provided string: {}".format(dest_variable_string), logfile)
-            return
-        
-        # Replace the dynamic destination string with the proper value from the database, and return
-        new_string = re.sub(dyn_dest_string, str_replace, dest_variable_string)
-        dest_variable_string = new_string
-        
-        # Break loop if dest_variable_string no longer contains '%dest'
-        if '%dest_' not in dest_variable_string.lower():
+    return substitute_destinations([dest_variable_string], logfile)[0]
+
+
+def substitute_destinations(dest_variable_strings, logfile=None):
+    """
+    Process: Replaces the %dest_...% tokens of many strings with their constant values
+
+    Every string is split into text and tokens in one pass and all distinct tokens are resolved
+    with one batched query. Values that contain tokens themselves are expanded again, up to
+    MAX_SUBSTITUTION_DEPTH levels.
+
+    :param dest_variable_strings: iterable of destination strings, e.g. all the destinations of a job
+    :param logfile: optional log file for error messages
+    :return: list of the substituted strings in the same order. A string with a token that
+             cannot be resolved is returned as None
+    """
+    results = list(dest_variable_strings)
+    pending = [i for i, dest in enumerate(results) if dest and '%dest_' in dest.lower()]
+    for depth in range(MAX_SUBSTITUTION_DEPTH):
+        if not pending:
             break
-        
-    return dest_variable_string
\ No newline at end of file
+        # Odd items are the tokens, even items the text between them
+        parts = {i: DEST_TOKEN.split(results[i]) for i in pending}
+        tokens = set(token for pieces in parts.values() for token in pieces[1::2])
+        values = _default_lookup.get_many(tokens, logfile) if tokens else {}
+
+        still_pending = []
+        for i, pieces in parts.items():
+            # An unterminated token is left in the text and cannot be resolved
+            if any(token not in values for token in pieces[1::2]) or any('%dest_' in text.lower() for text in pieces[0::2]):
+                logmsg("ERROR: Unable to get constant value for the provided string: {}".format(results[i]), logfile)
+                results[i] = None
+                continue
+            pieces[1::2] = [values[token] for token in pieces[1::2]]
+            results[i] = ''.join(pieces)
+            if '%dest_' in results[i].lower():
+                still_pending.append(i)
+        pending = still_pending
+
+    for i in pending:
+        logmsg("ERROR: Destination tokens nested more than {} levels deep in: {}".format(MAX_SUBSTITUTION_DEPTH, results[i]), logfile)
+        results[i] = None
+    return results
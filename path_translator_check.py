@@ -0,0 +1,90 @@
+#!/bin/env python3
+
+"""
+Equivalence check of get_constant_value.PathTranslator against the ordered str.replace chain
+convert_windows_path_to_unix used before it.
+
+Translates generated paths, built from the prefixes of the mapping with backslashes, repeated
+and back to back hosts, case variants and near misses, plus the lines of any --paths files,
+with both and reports every path where they differ. Run it after each change to the mapping
+table or to PathTranslator:
+
+    python path_translator_check.py --count 200000 --mapping unc_path_map.json --paths paths.txt
+
+Exits with code 1 if any path is translated differently.
+"""
+
+import argparse
+import random
+import sys
+
+from get_constant_value import PathTranslator
+
+SEGMENTS = ('data', 'Reports', 'shared', 'app_01', 'x', '', '.', '..', 'a b', '%dest_dir%', 'NAS')
+
+
+def replace_chain(path, mapping):
+    """
+    The translation as convert_windows_path_to_unix did it: backslashes to slashes, then one
+    str.replace per prefix in table order.
+    """
+    path = path.replace('\\', '/')
+    for prefix, mount in mapping.items():
+        path = path.replace(prefix, mount)
+    return path
+
+
+def generate_paths(mapping, count, seed):
+    """
+    Yields count random paths exercising the prefixes of the mapping.
+    """
+    rng = random.Random(seed)
+    prefixes = list(mapping)
+    mounts = list(mapping.values())
+    # Fragments that overlap a prefix or can join with their neighbours into one
+    pieces = prefixes + mounts + [prefix.upper() for prefix in prefixes] + [prefix[:-1] for prefix in prefixes] + \
+             [prefix[1:] for prefix in prefixes] + ['/', '//', '\\', '\\\\'] + list(SEGMENTS)
+    for i in range(count):
+        path = ''.join(rng.choice(pieces) + rng.choice(('', '/', '\\')) for j in range(rng.randint(1, 6)))
+        if rng.random() < 0.5:
+            # Windows spelling of the whole path
+            path = path.replace('/', '\\')
+        yield path
+
+
+def read_paths(path_files):
+    for path_file in path_files:
+        with open(path_file, encoding='utf-8') as paths:
+            for line in paths:
+                yield line.rstrip('\r\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check PathTranslator against the ordered str.replace chain')
+    parser.add_argument('--count', type=int, default=100000, help='number of generated paths')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the path generator')
+    parser.add_argument('--mapping', help='JSON mapping file to check (default: CS_UNC_PATH_MAP or the built-in table)')
+    parser.add_argument('--paths', action='append', default=[], help='file with one path per line to check as well')
+    parser.add_argument('--show', type=int, default=20, help='number of differences printed')
+    args = parser.parse_args()
+
+    translator = PathTranslator(PathTranslator.load_mapping(args.mapping) if args.mapping else None)
+    checked = 0
+    differences = 0
+    for paths in (generate_paths(translator.mapping, args.count, args.seed), read_paths(args.paths)):
+        for path in paths:
+            checked += 1
+            expected = replace_chain(path, translator.mapping)
+            actual = translator.translate(path)
+            if actual != expected:
+                differences += 1
+                if differences <= args.show:
+                    print('DIFFERENT: {0!r}\n  str.replace chain: {1!r}\n  PathTranslator:    {2!r}'.format(path, expected, actual))
+
+    print('{0} paths checked, {1} translated differently'.format(checked, differences))
+    if differences:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+#!/bin/env python3
+
+"""
+Latency benchmark of safeguard_library.py against the local Safeguard stand-in server.
+
+For each inventory size, starts safeguard_mock_server in process and times get_password,
+get_account_id and update_password, reporting p50/p99/mean latency and the number of
+requests the appliance served per call. The A2A metadata caches are cleared before each
+operation, so the first call of every run pays for the metadata fetch.
+
+    python safeguard_benchmark.py --sizes 100,1000,10000,100000 --iterations 200 --json results.json
+
+With --baseline, the run fails (exit code 1) when an operation is slower or makes more
+requests than the baseline results allow, so caching and indexing gains are kept in CI.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import requests  # Contains methods used to make HTTP requests
+
+from safeguard_mock_server import start_server
+
+# Safeguard reads its appliance and certificate settings from the environment
+for name, value in (('CS_SG_DEV', 'https://localhost'), ('CS_SG', 'https://localhost'), ('CS_CERT_LOC', ''),
+                    ('CS_CERT_CA', 'ca.pem'), ('CS_CERT_DAI_DEV', 'benchmark'), ('CS_CERT_DAI', 'benchmark')):
+    os.environ.setdefault(name, value)
+
+import safeguard_library
+from safeguard_library import Safeguard
+
+OPERATIONS = ('get_password', 'get_account_id', 'update_password')
+
+
+class LocalConnection:
+    """
+    Stand-in for a logged in PySafeguardConnection that talks plain HTTP to the mock server,
+    so the benchmark needs neither certificates nor TLS.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def invoke(self, httpMethod, httpService, endpoint=None, query={}, body=None, additionalHeaders={}, host=None, cert=None, apiVersion='v4'):
+        url = '{}/service/{}/{}/{}'.format(self.base_url, httpService, apiVersion, endpoint)
+        data = json.dumps(body) if body is not None else None
+        return self.session.request(httpMethod, url, params=query, data=data, headers=dict(additionalHeaders, **{'Content-Type': 'application/json'}))
+
+    def a2a_get_credential(self, host, apiKey, cert, key, verify=None, a2aType='Password', apiVersion='v4'):
+        url = '{}/service/a2a/{}/Credentials'.format(self.base_url, apiVersion)
+        response = self.session.get(url, params={'type': a2aType}, headers={'Authorization': 'A2A {}'.format(apiKey)})
+        if response.status_code != 200:
+            raise safeguard_library.WebRequestError(response)
+        return response.json()
+
+    def get_remaining_token_lifetime(self):
+        return 1440
+
+
+def percentile(timings, percent):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(round(percent / 100.0 * (len(ordered) - 1))))]
+
+
+def run_size(size, iterations, latency):
+    """
+    Benchmarks every operation against an inventory of size accounts.
+
+    :return: dictionary of operation -> dictionary of p50, p99 and mean latency (seconds),
+             calls, requests, requests_per_call and requests per endpoint
+    """
+    server = start_server(accounts=size, latency=latency)
+    base_url = 'http://127.0.0.1:{}'.format(server.server_port)
+    try:
+        safeguard = Safeguard()
+        safeguard.connection = LocalConnection(base_url)
+        accounts = [server.mock.asset_accounts[random.randrange(size)] for i in range(iterations)]
+
+        calls = {
+            'get_password': lambda account: safeguard.get_password(account['Name'], account['Asset']['Name']),
+            'get_account_id': lambda account: safeguard.get_account_id(account['Name'], account['Asset']['Name']),
+            'update_password': lambda account: safeguard.update_password(account['Name'], 'rotated-{}'.format(account['Id']), account['Asset']['Name']),
+        }
+        results = {}
+        for operation in OPERATIONS:
+            safeguard.invalidate_cache()
+            requests.post(base_url + '/_stats/reset')
+            timings = []
+            for account in accounts:
+                start = time.perf_counter()
+                if not calls[operation](account):
+                    raise RuntimeError('{} failed for {}'.format(operation, account['Name']))
+                timings.append(time.perf_counter() - start)
+            endpoints = requests.get(base_url + '/_stats').json()
+            total = sum(endpoints.values())
+            results[operation] = {
+                'p50': percentile(timings, 50),
+                'p99': percentile(timings, 99),
+                'mean': sum(timings) / len(timings),
+                'calls': len(timings),
+                'requests': total,
+                'requests_per_call': total / float(len(timings)),
+                'endpoints': endpoints,
+            }
+        return results
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def find_regressions(results, baseline, tolerance):
+    """
+    Compares results with baseline results of the same layout.
+
+    :param tolerance: allowed ratio over the baseline, e.g. 1.5 for 50% slower
+    :return: list of messages, one per regression
+    """
+    regressions = []
+    for size, operations in results.items():
+        for operation, result in operations.items():
+            expected = baseline.get(size, {}).get(operation)
+            if not expected:
+                continue
+            for metric in ('p50', 'p99', 'requests_per_call'):
+                if result[metric] > expected[metric] * tolerance:
+                    regressions.append('{} accounts, {}: {} {:.6g} exceeds baseline {:.6g} x {}'.format(
+                        size, operation, metric, result[metric], expected[metric], tolerance))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark safeguard_library against a local Safeguard stand-in')
+    parser.add_argument('--sizes', default='100,1000,10000,100000', help='comma separated inventory sizes')
+    parser.add_argument('--iterations', type=int, default=200, help='calls per operation and size')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every mock response')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='results file of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='allowed ratio over the baseline')
+    args = parser.parse_args()
+
+    results = {}
+    print('{:>8} {:<16} {:>10} {:>10} {:>10} {:>10}'.format('accounts', 'operation', 'p50 ms', 'p99 ms', 'mean ms', 'req/call'))
+    for size in [int(size) for size in args.sizes.split(',')]:
+        results[str(size)] = run_size(size, args.iterations, args.latency)
+        for operation, result in results[str(size)].items():
+            print('{:>8} {:<16} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+                size, operation, result['p50'] * 1000, result['p99'] * 1000, result['mean'] * 1000, result['requests_per_call']))
+
+    if args.json:
+        with open(args.json, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION: ' + regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
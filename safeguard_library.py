@@ -4,16 +4,192 @@ from pysafeguard import *
 from urllib.parse import urlparse
 import os
 import json
+import threading
+import time
+import concurrent.futures
+import random
+
+import requests  # pysafeguard sends its requests through the requests library
 
 from cs_logging import (logmsg, logerr)
+
+# A2A metadata rarely changes, so it is fetched once per process and shared by every
+# Safeguard object using the same appliance and certificate. Keyed by (hostname, user_cert_file).
+_a2a_id_cache = {}
+_retrievable_accounts_cache = {}
+_cache_lock = threading.Lock()
+
+# Logged in connections shared by every Safeguard object, keyed by (hostname, user_cert_file, is_bde)
+_connection_pool = {}
+_connection_pool_lock = threading.Lock()
+
+
+class PooledConnection:
+    """
+    A logged in PySafeguardConnection shared by every Safeguard object using the same
+    appliance and certificate.
+
+    The login happens on the first call to get(). A daemon thread then logs in again
+    shortly before the token expires and swaps the new connection in, so callers
+    never pay for a login once the pool is warm. A failed refresh is retried every
+    retry_interval seconds, and get() logs in itself once the token has expired.
+    """
+
+    def __init__(self, hostname, ca_file, user_cert_file, user_key_file, refresh_margin=300, default_lifetime=3600, retry_interval=30):
+        """
+        Construct a new PooledConnection object
+
+        :param refresh_margin: seconds before token expiry at which the token is renewed
+        :param default_lifetime: token lifetime in seconds assumed when the appliance does not report it
+        :param retry_interval: seconds between attempts after a failed refresh
+        """
+        self.hostname = hostname
+        self.ca_file = ca_file
+        self.user_cert_file = user_cert_file
+        self.user_key_file = user_key_file
+        self.refresh_margin = refresh_margin
+        self.default_lifetime = default_lifetime
+        self.retry_interval = retry_interval
+        self.connection = None
+        self.expires_at = 0 # time.time() at which the token of connection expires
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.refresher = None
+
+    def _login(self):
+        """
+        Returns a newly logged in connection and the time its token expires
+        """
+        # connect to safeguard
+        logmsg('Connecting to Safeguard {}'.format(self.hostname))
+        connection = PySafeguardConnection(self.hostname, self.ca_file)
+
+        # login to safeguard
+        logmsg('Logging into safeguard')
+        connection.connect_certificate(self.user_cert_file, self.user_key_file)
+        try:
+            # the appliance reports the remaining lifetime in minutes
+            lifetime = int(connection.get_remaining_token_lifetime()) * 60
+        except Exception:
+            lifetime = self.default_lifetime
+        return connection, time.time() + lifetime
+
+    def get(self):
+        """
+        Returns the logged in connection, logging in on first use and once the token has expired
+        """
+        with self.lock:
+            if self.connection is None or time.time() >= self.expires_at:
+                self.connection, self.expires_at = self._login()
+            if self.refresher is None:
+                self.refresher = threading.Thread(target=self._refresh_loop, name='safeguard-token-refresh', daemon=True)
+                self.refresher.start()
+            return self.connection
+
+    def renew(self, rejected_connection):
+        """
+        Logs in again after the appliance rejected the token of rejected_connection (401),
+        unless another thread already replaced that connection
+
+        :return: the logged in connection
+        """
+        with self.lock:
+            if self.connection is rejected_connection:
+                logmsg('Safeguard token rejected, logging in again')
+                self.connection, self.expires_at = self._login()
+            return self.connection
+
+    def _refresh_delay(self):
+        return max(self.expires_at - self.refresh_margin - time.time(), self.retry_interval)
+
+    def _refresh_loop(self):
+        delay = self._refresh_delay()
+        while not self.closed.wait(delay):
+            try:
+                connection, expires_at = self._login()
+            except Exception as err:
+                logerr('Unable to refresh the safeguard token, retrying in {}s: {}'.format(self.retry_interval, err))
+                delay = self.retry_interval
+                continue
+            with self.lock:
+                self.connection, self.expires_at = connection, expires_at
+            delay = self._refresh_delay()
+
+    def close(self):
+        self.closed.set()
+        with self.lock:
+            self.connection = None
+
+
+
+class AccountDirectory:
+    """
+    Case-insensitive index of a safeguard account listing, built once and then
+    looked up in constant time
+    """
+
+    def __init__(self, accounts, account_name, asset_name):
+        """
+        Construct a new AccountDirectory object
+
+        :param accounts: list of account dictionaries returned by safeguard
+        :param account_name: function returning the account name of an entry
+        :param asset_name: function returning the asset (system) name of an entry
+        """
+        self.accounts = accounts
+        self.by_name = {} # account name -> first account with that name
+        self.by_asset_and_name = {} # (asset name, account name) -> first account on that asset with that name
+        self.duplicate_names = set() # account names that appear more than once
+        for account in accounts:
+            name = account_name(account).lower()
+            asset = (asset_name(account) or '').lower()
+            if name in self.by_name:
+                self.duplicate_names.add(name)
+            else:
+                self.by_name[name] = account
+            self.by_asset_and_name.setdefault((asset, name), account)
+
+    @classmethod
+    def from_retrievable_accounts(cls, accounts):
+        return cls(accounts, lambda account: account["AccountName"], lambda account: account["AssetName"])
+
+    @classmethod
+    def from_asset_accounts(cls, accounts):
+        return cls(accounts, lambda account: account["Name"], lambda account: account["Asset"]["Name"])
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def lookup(self, username, system_name=None):
+        """
+        Find an account
+
+        :param username: The account name
+        :param system_name: Optional input that contains the sytem name the accout is for ie. TSSIDM
+        :return: the account dictionary, or None if it is not found or the name is ambiguous without a system name
+        """
+        if system_name:
+            return self.by_asset_and_name.get((system_name.lower(), username.lower()))
+
+        # if the system name is empty check if there is more than one entry for the account name and log an error
+        if username.lower() in self.duplicate_names:
+            logerr('The account name {} appears in safeguard multiple times please specify a system name'.format(username))
+            return None
+        return self.by_name.get(username.lower())
+
+
 class Safeguard:
     """
     This class constructor allows us to setup safeguard class variables.
     """
 
-    def __init__(self, is_bde=False):
+    def __init__(self, is_bde=False, password_ttl=0):
         """
         Construct a new Safeguard object
+
+        :param is_bde: use the BDE certificate instead of the DAI one
+        :param password_ttl: seconds fetched passwords are kept in memory and reused (0 disables the cache).
+                             Cached passwords are never written to disk and are zeroed when evicted
         """
         self.hostname = None
         self.ca_file = None
@@ -21,8 +197,19 @@ class Safeguard:
         self.user_key_file = None
         self.prod = True if os.getenv('CS_PROD') == "P" else False
         self.is_bde = is_bde
-        self.connection = None
-        self._connect()
+        self._connection = None
+        self._pooled_connection = None
+        self.password_ttl = password_ttl
+        self._password_cache = {} # (username, system_name) -> (bytearray password, expiry time)
+        self._password_cache_lock = threading.Lock()
+
+        # populate fields needed to interact with the safeguard api. The login itself is
+        # deferred until the first call and shared with other Safeguard objects
+        self._get_hostname()
+        self._get_cert_file_details()
+
+    def __del__(self):
+        self.clear_password_cache()
 
     def _get_hostname(self):
         """
@@ -55,33 +242,142 @@ class Safeguard:
 
     def _connect(self):
         """
-        Login to safeguard server
+        Login to safeguard server, reusing the pooled connection of this appliance and certificate
         """
-        # populate fields needed to interact with the safeguard api
-        self._get_hostname()
-        self._get_cert_file_details()
+        key = (self.hostname, self.user_cert_file, self.is_bde)
+        with _connection_pool_lock:
+            pooled_connection = _connection_pool.get(key)
+            if pooled_connection is None:
+                pooled_connection = PooledConnection(self.hostname, self.ca_file, self.user_cert_file, self.user_key_file)
+                _connection_pool[key] = pooled_connection
+        self._pooled_connection = pooled_connection
+        pooled_connection.get()
 
-        # connect to safeguard
-        logmsg('Connecting to Safeguard {}'.format(self.hostname))
-        self.connection = PySafeguardConnection(self.hostname, self.ca_file)
+    @property
+    def connection(self):
+        """
+        The logged in PySafeguardConnection, connecting on first use
+        """
+        if self._connection is not None:
+            return self._connection
+        if self._pooled_connection is None:
+            self._connect()
+        return self._pooled_connection.get()
 
-        # login to safeguard
-        logmsg('Logging into safeguard')
-        self.connection.connect_certificate(self.user_cert_file, self.user_key_file)
+    @connection.setter
+    def connection(self, connection):
+        self._connection = connection
+
+    def _invoke(self, *args, **kwargs):
+        """
+        Calls invoke on the connection. If the appliance rejects the pooled token (401),
+        logs in again and retries once
+        """
+        connection = self.connection
+        try:
+            result = connection.invoke(*args, **kwargs)
+            status_code = result.status_code
+        except WebRequestError as err:
+            status_code = err.req.status_code
+            if status_code != 401 or self._connection is not None:
+                raise
+        if status_code != 401 or self._connection is not None:
+            return result
+        return self._pooled_connection.renew(connection).invoke(*args, **kwargs)
+
+    @staticmethod
+    def close_connection_pool():
+        """
+        Stop the token refresh threads and drop every pooled connection
+        """
+        with _connection_pool_lock:
+            for pooled_connection in _connection_pool.values():
+                pooled_connection.close()
+            _connection_pool.clear()
+
+    def _cache_key(self):
+        return (self.hostname, self.user_cert_file)
+
+    def invalidate_cache(self):
+        """
+        Forget the cached A2A id and retrievable accounts of this appliance and certificate
+        so the next lookup fetches them again
+        """
+        with _cache_lock:
+            _a2a_id_cache.pop(self._cache_key(), None)
+            _retrievable_accounts_cache.pop(self._cache_key(), None)
+
+    @staticmethod
+    def _zero(buffer):
+        buffer[:] = bytes(len(buffer))
+
+    def clear_password_cache(self):
+        """
+        Zero and drop every cached password
+        """
+        with self._password_cache_lock:
+            for password, expires_at in self._password_cache.values():
+                self._zero(password)
+            self._password_cache.clear()
+
+    def _get_cached_password(self, key):
+        """
+        Returns the cached password for key, evicting (and zeroing) expired entries
+        """
+        now = time.time()
+        with self._password_cache_lock:
+            for expired_key in [cache_key for cache_key, (password, expires_at) in self._password_cache.items() if expires_at <= now]:
+                self._zero(self._password_cache.pop(expired_key)[0])
+            if key in self._password_cache:
+                return self._password_cache[key][0].decode('utf-8')
+        return None
+
+    def _cache_password(self, key, password):
+        with self._password_cache_lock:
+            if key in self._password_cache:
+                self._zero(self._password_cache[key][0])
+            self._password_cache[key] = (bytearray(password.encode('utf-8')), time.time() + self.password_ttl)
 
     def get_a2a_id(self):
         """
-        Get the a2a_id
+        Get the a2a_id. It is fetched once per process, see invalidate_cache
         """
-        result = self.connection.invoke(HttpMethods.GET, Services.CORE, endpoint='A2ARegistrations', cert=(self.user_cert_file,self.user_key_file))
+        with _cache_lock:
+            a2a_id = _a2a_id_cache.get(self._cache_key())
+        if a2a_id:
+            return a2a_id
+
+        result = self._invoke(HttpMethods.GET, Services.CORE, endpoint='A2ARegistrations', cert=(self.user_cert_file,self.user_key_file))
         result_json = result.json()
         if result_json:
             result_dict = result_json[0]
+            with _cache_lock:
+                _a2a_id_cache[self._cache_key()] = result_dict["Id"]
             return result_dict["Id"]
         else:
             logerr('Could not fetch A2A id.')
             return
 
+    def _get_retrievable_accounts(self, a2a_id):
+        """
+        Get the AccountDirectory of the accounts retrievable through the a2a registration.
+        They are fetched once per process, see invalidate_cache
+        """
+        key = self._cache_key()
+        with _cache_lock:
+            cached = _retrievable_accounts_cache.get(key)
+        if cached and cached[0] == a2a_id:
+            return cached[1]
+
+        accounts_list_result = self._invoke(HttpMethods.GET, Services.CORE, endpoint='A2ARegistrations/{}/RetrievableAccounts'.format(a2a_id), cert=(self.user_cert_file,self.user_key_file))
+        accounts_json = accounts_list_result.json()
+        if not accounts_json:
+            return None
+        directory = AccountDirectory.from_retrievable_accounts(accounts_json)
+        with _cache_lock:
+            _retrievable_accounts_cache[key] = (a2a_id, directory)
+        return directory
+
     def get_api_key(self, a2a_id, username, system_name=None):
         """
         Get the api key for the account
@@ -91,59 +387,77 @@ class Safeguard:
         :param system_name: Optional input that contains the sytem name the accout is for ie. TSSIDM
         :return: returns the password fetched from safeguard
         """
-        api_key = None
-        accounts_list_result = self.connection.invoke(HttpMethods.GET, Services.CORE, endpoint='A2ARegistrations/{}/RetrievableAccounts'.format(a2a_id), cert=(self.user_cert_file,self.user_key_file))
-        accounts_json = accounts_list_result.json()
-        if accounts_json:
-            # if the system name is empty check if there is more than one entry for the account name and log an error
-            # and return if both conditions are met
-            account_name_list = [acct_name["AccountName"].lower() for acct_name in accounts_json]
-            if system_name == None and account_name_list.count(username.lower()) > 1:
-                logerr('The account name {} appears in safeguard multiple times please specify a system name'.format(username))
-                return
+        directory = self._get_retrievable_accounts(a2a_id)
+        if directory is None:
+            return None
+        account = directory.lookup(username, system_name)
+        return account["ApiKey"] if account else None
 
-            # loop through the list of accounts to find the api key of the account you need the password for
-            for account in accounts_json:
-                if system_name:
-                    if account["AssetName"].lower() == system_name.lower() and account["AccountName"].lower() == username.lower():
-                        api_key = account["ApiKey"]
-                        break
-                else:
-                    if account["AccountName"].lower() == username.lower():
-                        api_key = account["ApiKey"]
-                        break
-        return api_key
+    @staticmethod
+    def _filter_value(value):
+        """
+        Quote a string for use in a safeguard filter expression
+        """
+        return "'{}'".format(value.replace('\\', '\\\\').replace("'", "\\'"))
 
     def get_account_id(self, username, system_name=None):
         """
         Get the unique id for the account
 
+        Only the matching accounts, and only the fields needed to identify them, are requested from safeguard.
+
         :param username: The username/account password you need to fetch
         :param system_name: Optional input that contains the sytem name the accout is for ie. TSSIDM
         :return: returns the account id fetched from safeguard
         """
-        account_id = None
-        accounts_list_result = self.connection.invoke(HttpMethods.GET, Services.CORE, endpoint='AssetAccounts', cert=(self.user_cert_file,self.user_key_file))
-        accounts_json = accounts_list_result.json()
-        if accounts_json:
-            # if the system name is empty check if there is more than one entry for the account name and log an error
-            # and return if both conditions are met
-            account_name_list = [acct_name["Name"].lower() for acct_name in accounts_json]
-            if system_name == None and account_name_list.count(username.lower()) > 1:
-                logerr('The account name {} appears in safeguard multiple times please specify a system name'.format(username))
-                return
+        account_filter = 'Name ieq {}'.format(self._filter_value(username))
+        if system_name:
+            account_filter += ' and Asset.Name ieq {}'.format(self._filter_value(system_name))
+        accounts_json = list(self.iter_asset_accounts(account_filter=account_filter))
+        if not accounts_json:
+            return None
+        account = AccountDirectory.from_asset_accounts(accounts_json).lookup(username, system_name)
+        return account["Id"] if account else None
+
+    def iter_asset_accounts(self, account_filter=None, fields='Id,Name,Asset.Name', page_size=1000):
+        """
+        Iterate over asset accounts one page at a time
+
+        :param account_filter: safeguard filter expression, e.g. "Name ieq 'svc.batch'"
+        :param fields: comma separated fields to return (None returns every field)
+        :param page_size: number of accounts requested per page
+        :return: generator of account dictionaries
+        """
+        query = {'limit': page_size}
+        if account_filter:
+            query['filter'] = account_filter
+        if fields:
+            query['fields'] = fields
 
-            # loop through the list of accounts to find the api key of the account you need the password for
+        page = 0
+        while True:
+            query['page'] = page
+            accounts_list_result = self._invoke(HttpMethods.GET, Services.CORE, endpoint='AssetAccounts', query=dict(query), cert=(self.user_cert_file,self.user_key_file))
+            accounts_json = accounts_list_result.json()
+            if not accounts_json:
+                return
             for account in accounts_json:
-                if system_name:
-                    if account["Asset"]["Name"].lower() == system_name.lower() and account["Name"].lower() == username.lower():
-                        account_id = account["Id"]
-                        break
-                else:
-                    if account["Name"].lower() == username.lower():
-                        account_id = account["Id"]
-                        break
-        return account_id
+                yield account
+            if len(accounts_json) < page_size:
+                return
+            page += 1
+
+    def get_asset_account_directory(self, account_filter=None):
+        """
+        Get an AccountDirectory of the asset accounts, for callers that look up many accounts
+
+        :param account_filter: Optional safeguard filter expression limiting the accounts
+        :return: AccountDirectory, or None if no accounts were returned
+        """
+        accounts_json = list(self.iter_asset_accounts(account_filter=account_filter))
+        if not accounts_json:
+            return None
+        return AccountDirectory.from_asset_accounts(accounts_json)
 
 
     def get_password(self, username, system_name=None):
@@ -154,6 +468,13 @@ class Safeguard:
         :param system_name: Optional input that contains the sytem name the accout is for ie. TSSIDM
         :return: returns the password fetched from safeguard
         """
+        key = (username.lower(), system_name.lower() if system_name else None)
+        if self.password_ttl > 0:
+            password = self._get_cached_password(key)
+            if password is not None:
+                logmsg('Using cached password')
+                return password
+
         # get A2A id
         logmsg('Getting A2A id')
         a2a_id = self.get_a2a_id()
@@ -167,13 +488,84 @@ class Safeguard:
         password = None
         # if we were able to get the api key from safeguard get the password otherwise throw an error.
         if api_key != None:
-            password = self.connection.a2a_get_credential(self.hostname, api_key, self.user_cert_file, self.user_key_file, verify=self.ca_file)
+            try:
+                password = self.connection.a2a_get_credential(self.hostname, api_key, self.user_cert_file, self.user_key_file, verify=self.ca_file)
+            except WebRequestError:
+                # The cached api key may be stale, fetch the account list again and retry once
+                logmsg('Password fetch failed, refreshing cached A2A metadata')
+                self.invalidate_cache()
+                a2a_id = self.get_a2a_id()
+                api_key = self.get_api_key(a2a_id, username, system_name) if a2a_id else None
+                if api_key == None:
+                    logerr('Api key required.  Could not fetch password')
+                    return
+                password = self.connection.a2a_get_credential(self.hostname, api_key, self.user_cert_file, self.user_key_file, verify=self.ca_file)
+            if self.password_ttl > 0 and password:
+                self._cache_password(key, password)
             return password
         else:
             logerr('Api key required.  Could not fetch password')
             return
 
 
+    def get_passwords(self, accounts, max_workers=8):
+        """
+        Fetches the passwords of many accounts from safeguard at once
+
+        The api keys of every account are resolved from a single RetrievableAccounts fetch and
+        the passwords are then retrieved concurrently.
+
+        :param accounts: list of (username, system_name) pairs. system_name may be None, and a plain
+                         username string is treated as (username, None)
+        :param max_workers: maximum number of passwords fetched at the same time
+        :return: (passwords, errors): dictionaries keyed by the (username, system_name) pair holding
+                 the password or the reason it could not be fetched
+        """
+        accounts = list(dict.fromkeys((account, None) if isinstance(account, str) else tuple(account) for account in accounts))
+        passwords = {}
+        errors = {}
+
+        logmsg('Getting A2A id')
+        a2a_id = self.get_a2a_id()
+        if not a2a_id:
+            return passwords, dict.fromkeys(accounts, 'Could not fetch A2A id')
+
+        logmsg('Getting api keys for {} accounts'.format(len(accounts)))
+        api_keys = {}
+        for username, system_name in accounts:
+            key = (username.lower(), system_name.lower() if system_name else None)
+            password = self._get_cached_password(key) if self.password_ttl > 0 else None
+            if password is not None:
+                passwords[(username, system_name)] = password
+                continue
+            api_key = self.get_api_key(a2a_id, username, system_name)
+            if api_key is None:
+                errors[(username, system_name)] = 'Api key required.  Could not fetch password'
+            else:
+                api_keys[(username, system_name)] = api_key
+
+        def fetch(account):
+            return self.connection.a2a_get_credential(self.hostname, api_keys[account], self.user_cert_file, self.user_key_file, verify=self.ca_file)
+
+        logmsg('Getting {} passwords'.format(len(api_keys)))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(fetch, account): account for account in api_keys}
+            for future in concurrent.futures.as_completed(futures):
+                username, system_name = account = futures[future]
+                try:
+                    passwords[account] = future.result()
+                except Exception as err:
+                    errors[account] = 'Could not fetch password: {}'.format(err)
+                    continue
+                if self.password_ttl > 0 and passwords[account]:
+                    self._cache_password((username.lower(), system_name.lower() if system_name else None), passwords[account])
+
+        for username, system_name in errors:
+            logerr('Could not fetch password for {}: {}'.format(username if system_name is None else '{}@{}'.format(username, system_name),
+                                                                errors[(username, system_name)]))
+        return passwords, errors
+
+
     def update_password(self, username, password, system_name=None):
         """
         Updates the password in safeguard for the specified user
@@ -192,11 +584,133 @@ class Safeguard:
             return False
 
         # update password
-        results = self.connection.invoke(HttpMethods.PUT, Services.CORE, endpoint='AssetAccounts/{}/Password'.format(account_id), body=password, cert=(self.user_cert_file,self.user_key_file))
+        results = self._put_password(account_id, password)
 
         if results.status_code == 204:
             logmsg('Successfully updated password')
             return True
         else:
-            logmsg('Failed to update password: {}'.format(results.message))
+            logmsg('Failed to update password: {}'.format(results.text))
             return False
+
+    def _put_password(self, account_id, password):
+        return self._invoke(HttpMethods.PUT, Services.CORE, endpoint='AssetAccounts/{}/Password'.format(account_id), body=password, cert=(self.user_cert_file,self.user_key_file))
+
+    @staticmethod
+    def _load_checkpoint(checkpoint_file):
+        """
+        Returns the set of account keys completed by a previous run
+        """
+        if not checkpoint_file or not os.path.isfile(checkpoint_file):
+            return set()
+        with open(checkpoint_file) as checkpoint:
+            return set(json.load(checkpoint).get('completed', []))
+
+    @staticmethod
+    def _save_checkpoint(checkpoint_file, completed):
+        """
+        Atomically records the completed account keys. Passwords are never written
+        """
+        temp_file = '{}.tmp'.format(checkpoint_file)
+        file_descriptor = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(file_descriptor, 'w') as checkpoint:
+            json.dump({'completed': sorted(completed)}, checkpoint)
+        os.replace(temp_file, checkpoint_file)
+
+    def update_passwords(self, manifest, max_workers=4, max_per_second=None, max_retries=3, checkpoint_file=None):
+        """
+        Rotates the passwords of many accounts
+
+        Account ids are resolved from one AssetAccounts listing, then the passwords are updated
+        concurrently. Failed updates are retried with backoff when the failure looks transient
+        (connection errors, 429 and 5xx responses). With a checkpoint_file every successful
+        update is recorded as it happens, and a rerun with the same file skips those accounts,
+        so an interrupted rotation continues where it left off.
+
+        :param manifest: list of dictionaries with 'username', 'password' and optional 'system_name' keys
+        :param max_workers: maximum number of updates in flight
+        :param max_per_second: maximum number of update requests started per second (None is unlimited)
+        :param max_retries: attempts per account
+        :param checkpoint_file: Optional file recording the completed accounts
+        :return: dictionary with 'updated', 'skipped', 'failed' (account -> reason), 'elapsed' and 'per_second'
+        """
+        start = time.time()
+        completed = self._load_checkpoint(checkpoint_file)
+        failed = {}
+        skipped = 0
+        lock = threading.Lock()
+
+        def account_key(entry):
+            return '{}/{}'.format((entry.get('system_name') or '').lower(), entry['username'].lower())
+
+        todo = []
+        for entry in manifest:
+            if account_key(entry) in completed:
+                skipped += 1
+            else:
+                todo.append(entry)
+        logmsg('Rotating {} passwords ({} already done)'.format(len(todo), skipped))
+
+        # resolve every account id in one pass
+        directory = self.get_asset_account_directory() if todo else None
+        account_ids = {}
+        for entry in todo:
+            account = directory.lookup(entry['username'], entry.get('system_name')) if directory else None
+            if account:
+                account_ids[account_key(entry)] = account["Id"]
+            else:
+                failed[account_key(entry)] = 'Unable to find a unique account id'
+
+        # space out request starts to respect max_per_second
+        next_start = [time.time()]
+        def wait_for_rate_limit():
+            if not max_per_second:
+                return
+            with lock:
+                delay = next_start[0] - time.time()
+                next_start[0] = max(next_start[0], time.time()) + 1.0 / max_per_second
+            if delay > 0:
+                time.sleep(delay)
+
+        def rotate(entry):
+            key = account_key(entry)
+            reason = None
+            for attempt in range(1, max_retries + 1):
+                wait_for_rate_limit()
+                try:
+                    results = self._put_password(account_ids[key], entry['password'])
+                    if results.status_code == 204:
+                        with lock:
+                            completed.add(key)
+                            if checkpoint_file:
+                                self._save_checkpoint(checkpoint_file, completed)
+                        return None
+                    status_code = results.status_code
+                    reason = 'HTTP {}: {}'.format(status_code, results.text)
+                except WebRequestError as err:
+                    # pysafeguard raises for non-2xx responses instead of returning them
+                    status_code = err.req.status_code
+                    reason = 'HTTP {}: {}'.format(status_code, err.req.text)
+                except requests.exceptions.RequestException as err:
+                    status_code = None # connection error or timeout
+                    reason = str(err)
+                except Exception as err:
+                    return str(err)
+                if status_code is not None and status_code != 429 and status_code < 500:
+                    return reason
+                if attempt < max_retries:
+                    time.sleep(2 ** attempt * random.uniform(0.5, 1.5))
+            return reason
+
+        entries = [entry for entry in todo if account_key(entry) in account_ids]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for entry, reason in zip(entries, executor.map(rotate, entries)):
+                if reason is not None:
+                    failed[account_key(entry)] = reason
+
+        elapsed = time.time() - start
+        updated = len(entries) - len([entry for entry in entries if account_key(entry) in failed])
+        for key, reason in sorted(failed.items()):
+            logerr('Failed to update password for {}: {}'.format(key, reason))
+        logmsg('Updated {} passwords in {:.1f}s ({:.1f}/s), {} failed, {} skipped'.format(updated, elapsed, updated / elapsed if elapsed else 0, len(failed), skipped))
+        return {'updated': updated, 'skipped': skipped, 'failed': failed, 'elapsed': elapsed, 'per_second': updated / elapsed if elapsed else 0}
@@ -0,0 +1,235 @@
+#!/bin/env python3
+
+"""
+Local stand-in for the Safeguard endpoints used by safeguard_library.py.
+
+Serves a generated inventory of accounts with optional injected latency, so that
+safeguard_library can be benchmarked and regression tested without an appliance:
+
+    A2ARegistrations, A2ARegistrations/{id}/RetrievableAccounts,
+    AssetAccounts (with filter, fields, page and limit), AssetAccounts/{id}/Password,
+    A2A Credentials, certificate login and SystemTime.
+
+GET /_stats returns the number of requests served per endpoint and POST /_stats/reset clears them.
+
+    python safeguard_mock_server.py --accounts 10000 --latency 0.02 --port 8443
+"""
+
+import argparse
+import collections
+import json
+import re
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+A2A_ID = 1
+
+FILTER_CONDITION = re.compile(r"([\w.]+)\s+(ieq|eq)\s+'((?:[^'\\]|\\.)*)'")
+
+
+class MockSafeguard:
+    """
+    Inventory and request counters of the stand-in appliance.
+    """
+
+    def __init__(self, accounts=1000, latency=0.0, accounts_per_asset=10):
+        """
+        Construct a new MockSafeguard object.
+
+        :param accounts: number of accounts in the inventory
+        :param latency: seconds added to every response
+        :param accounts_per_asset: accounts generated per asset (system)
+        """
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.stats = collections.Counter()
+        self.asset_accounts = []
+        self.passwords = {}
+        for account_id in range(1, accounts + 1):
+            asset_id = (account_id - 1) // accounts_per_asset + 1
+            self.asset_accounts.append({
+                'Id': account_id,
+                'Name': 'svc.account{}'.format(account_id),
+                'Description': 'Generated service account {} for benchmarking'.format(account_id),
+                'DistinguishedName': 'CN=svc.account{},OU=Service Accounts,DC=example,DC=com'.format(account_id),
+                'Asset': {'Id': asset_id, 'Name': 'SYSTEM{}'.format(asset_id), 'NetworkAddress': 'system{}.example.com'.format(asset_id)},
+                'HasPassword': True,
+            })
+            self.passwords[account_id] = 'password{}'.format(account_id)
+        self.retrievable_accounts = [{
+            'AccountId': account['Id'],
+            'AccountName': account['Name'],
+            'AssetName': account['Asset']['Name'],
+            'ApiKey': 'apikey-{}'.format(account['Id']),
+        } for account in self.asset_accounts]
+        self.accounts_by_api_key = {account['ApiKey']: account['AccountId'] for account in self.retrievable_accounts}
+
+    def count(self, endpoint):
+        with self.lock:
+            self.stats[endpoint] += 1
+
+    @staticmethod
+    def _field(account, name):
+        for part in name.split('.'):
+            account = account.get(part) if isinstance(account, dict) else None
+        return account
+
+    def query_asset_accounts(self, query):
+        """
+        Applies the filter, fields, page and limit query parameters to the asset accounts.
+        Only "<field> eq|ieq '<value>'" conditions joined by "and" are understood.
+        """
+        accounts = self.asset_accounts
+        if 'filter' in query:
+            for field, operator, value in FILTER_CONDITION.findall(query['filter']):
+                value = re.sub(r'\\(.)', r'\1', value)
+                if operator == 'ieq':
+                    accounts = [account for account in accounts if str(self._field(account, field)).lower() == value.lower()]
+                else:
+                    accounts = [account for account in accounts if str(self._field(account, field)) == value]
+        if 'limit' in query:
+            limit = int(query['limit'])
+            page = int(query.get('page', 0))
+            accounts = accounts[page * limit:(page + 1) * limit]
+        if 'fields' in query:
+            selected = []
+            for account in accounts:
+                row = {}
+                for field in query['fields'].split(','):
+                    parts = field.strip().split('.')
+                    target = row
+                    for part in parts[:-1]:
+                        target = target.setdefault(part, {})
+                    target[parts[-1]] = self._field(account, field.strip())
+                selected.append(row)
+            accounts = selected
+        return accounts
+
+
+class MockSafeguardHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True # keep-alive responses are two writes, avoid the delayed ACK stall
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None, headers=None):
+        payload = b'' if body is None else json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _route(self, method):
+        mock = self.server.mock
+        url = urlparse(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        path = url.path.rstrip('/')
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        if path == '/_stats' and method == 'GET':
+            with mock.lock:
+                return self._send(200, dict(mock.stats))
+        if path == '/_stats/reset' and method == 'POST':
+            with mock.lock:
+                mock.stats.clear()
+            return self._send(204)
+
+        if mock.latency:
+            time.sleep(mock.latency)
+
+        if path == '/RSTS/oauth2/token' and method == 'POST':
+            mock.count('login')
+            return self._send(200, {'access_token': 'rsts-token', 'token_type': 'Bearer'})
+        if path == '/service/core/v4/Token/LoginResponse' and method == 'POST':
+            mock.count('login')
+            return self._send(200, {'Status': 'Success', 'UserToken': 'user-token'})
+        if path == '/service/appliance/v4/SystemTime':
+            mock.count('SystemTime')
+            return self._send(200, {'Time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}, {'X-TokenLifetimeRemaining': '1440'})
+        if path == '/service/core/v4/A2ARegistrations':
+            mock.count('A2ARegistrations')
+            return self._send(200, [{'Id': A2A_ID, 'AppName': 'Benchmark'}])
+        if path == '/service/core/v4/A2ARegistrations/{}/RetrievableAccounts'.format(A2A_ID):
+            mock.count('RetrievableAccounts')
+            return self._send(200, mock.retrievable_accounts)
+        if path == '/service/core/v4/AssetAccounts' and method == 'GET':
+            mock.count('AssetAccounts')
+            return self._send(200, mock.query_asset_accounts(query))
+        match = re.match(r'^/service/core/v4/AssetAccounts/(\d+)/Password$', path)
+        if match and method == 'PUT':
+            mock.count('Password')
+            account_id = int(match.group(1))
+            if account_id not in mock.passwords:
+                return self._send(404, {'Message': 'Account not found'})
+            try:
+                mock.passwords[account_id] = json.loads(body)
+            except ValueError:
+                mock.passwords[account_id] = body.decode('utf-8')
+            return self._send(204)
+        if path == '/service/a2a/v4/Credentials':
+            mock.count('Credentials')
+            api_key = self.headers.get('Authorization', '').replace('A2A', '', 1).strip()
+            account_id = mock.accounts_by_api_key.get(api_key)
+            if account_id is None:
+                return self._send(404, {'Message': 'Unknown api key'})
+            return self._send(200, mock.passwords[account_id])
+        return self._send(404, {'Message': 'Unknown endpoint {} {}'.format(method, path)})
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_POST(self):
+        self._route('POST')
+
+    def do_PUT(self):
+        self._route('PUT')
+
+
+def start_server(accounts=1000, latency=0.0, host='127.0.0.1', port=0, certfile=None, keyfile=None):
+    """
+    Starts the stand-in server on a background thread.
+
+    :param certfile, keyfile: serve HTTPS with this certificate (HTTP when omitted)
+    :return: the running server. server.mock is its MockSafeguard, server.server_port its port.
+             Call server.shutdown() to stop it
+    """
+    server = ThreadingHTTPServer((host, port), MockSafeguardHandler)
+    server.daemon_threads = True
+    server.mock = MockSafeguard(accounts, latency)
+    if certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, name='safeguard-mock', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Safeguard stand-in server')
+    parser.add_argument('--accounts', type=int, default=1000, help='number of accounts in the inventory')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--certfile', help='serve HTTPS with this certificate')
+    parser.add_argument('--keyfile', help='private key of --certfile')
+    args = parser.parse_args()
+
+    server = start_server(args.accounts, args.latency, args.host, args.port, args.certfile, args.keyfile)
+    print('Mock Safeguard serving {} accounts on {}://{}:{}'.format(args.accounts, 'https' if args.certfile else 'http', args.host, server.server_port))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
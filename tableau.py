@@ -11,6 +11,14 @@ import re
 import json
 import datetime
 import time
+import collections
+import random
+import concurrent.futures
+import threading
+import hashlib
+import io
+import shutil
+import urllib.parse
 
 # The following packages are used to build a multi-part/mixed request.
 # They are contained in the 'requests' library.
@@ -26,22 +34,348 @@ import cs_properties as prop
 import cs_directory_services as dir_svcs
 import cs_db
 from cs_environment import current_user_is_production
+from tableau_models import Job, Credentials, Site, Workbook, EMPTY_TS_REQUEST, TABLEAU_NS, JOB, WORKBOOK, FILE_UPLOAD, PAGINATION, WEBHOOK, ERROR, DETAIL
+from tableau_webhooks import WEBHOOK_FALLBACK_INTERVAL
 
 
 api_version = os.environ['CS_TABLEAU_API_VER'] # Environment variable
 api_version_number = api_version.split('/')[2]
 
+# Tableau object IDs (LUIDs) look like 9ae2a4ef-5a1f-4c5b-9f73-47bcd8a2e1b1
+LUID_PATTERN = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+
+# The namespace for the REST API is 'http://tableausoftware.com/api' for Tableau Server 9.0 or 'http://tableau.com/api' for Tableau Server 9.1 or later
+TABLEAU_XMLNS = {'t': 'http://tableau.com/api'}
+
+# Seconds the Tableau Server clock may be behind the local one when comparing job timestamps
+CLOCK_SKEW = 300
+
+def _parse_timestamp(value):
+    """
+    Parses a Tableau timestamp such as 2020-01-31T18:45:04Z into a datetime (None if it cannot be parsed).
+    """
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%SZ')
+    except (TypeError, ValueError):
+        return None
+
+
+class PollingStrategy:
+    """
+    Decides how long to wait between status checks of a job and between refresh retries.
+
+    Subclasses implement poll_delay() and retry_delay(). 'deadline' is the number of seconds after
+    submission at which the caller stops waiting for a job (None waits indefinitely); next_delay()
+    never sleeps past it.
+    """
+
+    def __init__(self, deadline=None):
+        self.deadline = deadline
+
+    def poll_delay(self, job, checks, elapsed):
+        """
+        :param job: latest query_job response for the job, or None before the first check
+        :param checks: number of status checks made so far
+        :param elapsed: seconds since the job was submitted
+        :return: seconds to wait before the next status check
+        """
+        raise NotImplementedError
+
+    def retry_delay(self, attempt):
+        """
+        :param attempt: number of 403/409 responses received before this one
+        :return: seconds to wait before resubmitting a refresh that is already in process
+        """
+        raise NotImplementedError
+
+    def next_delay(self, job, checks, elapsed):
+        delay = self.poll_delay(job, checks, elapsed)
+        if self.deadline is not None:
+            delay = min(delay, max(0, self.deadline - elapsed))
+        return delay
+
+    def expired(self, elapsed):
+        return self.deadline is not None and elapsed >= self.deadline
+
+
+class FixedPolling(PollingStrategy):
+    """
+    Checks every 'interval' seconds and retries every 'retry_interval' seconds.
+    The defaults are the original refresh_tableau_extract timings.
+    """
+
+    def __init__(self, interval=30, retry_interval=60, deadline=None):
+        PollingStrategy.__init__(self, deadline)
+        self.interval = interval
+        self.retry_interval = retry_interval
+
+    def poll_delay(self, job, checks, elapsed):
+        return self.interval
+
+    def retry_delay(self, attempt):
+        return self.retry_interval
+
+
+class AdaptivePolling(PollingStrategy):
+    """
+    Checks often while a job is young and backs off exponentially while it runs.
+
+    When the job reports progress, the time to completion is estimated from the progress and
+    the createdAt/updatedAt stamps (or the local elapsed time) and the next check is scheduled
+    for then. Delays stay between min_interval and max_interval and are randomised by +/- jitter
+    so that many jobs do not poll in lock step.
+    """
+
+    def __init__(self, min_interval=5, max_interval=120, backoff=1.5, jitter=0.1, retry_interval=15, max_retry_interval=300, deadline=None):
+        PollingStrategy.__init__(self, deadline)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+
+    def _jittered(self, delay):
+        return max(0, delay * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    @staticmethod
+    def estimate_remaining(job, elapsed):
+        """
+        Estimates the seconds until a job finishes from its progress, or None if it cannot be estimated.
+        """
+        try:
+            progress = float(job['progress'])
+        except (TypeError, KeyError, ValueError):
+            return None
+        if not 0 < progress < 100:
+            return None
+
+        created_at = _parse_timestamp(job.get('created_at'))
+        updated_at = _parse_timestamp(job.get('updated_at'))
+        run_time = elapsed
+        if created_at is not None and updated_at is not None and updated_at > created_at:
+            run_time = (updated_at - created_at).total_seconds()
+        if run_time <= 0:
+            return None
+        return run_time * (100 - progress) / progress
+
+    def poll_delay(self, job, checks, elapsed):
+        delay = self.min_interval * self.backoff ** checks
+        remaining = self.estimate_remaining(job, elapsed) if job else None
+        if remaining is not None:
+            delay = remaining
+        return self._jittered(min(max(delay, self.min_interval), self.max_interval))
+
+    def retry_delay(self, attempt):
+        return self._jittered(min(self.retry_interval * self.backoff ** attempt, self.max_retry_interval))
+
+
+class TableauMetrics:
+    """
+    Request and wait statistics of a Tableau session.
+
+    record() is installed as a response hook on the requests session, so every REST call is
+    counted per endpoint with its status codes, bytes and a latency histogram. Endpoints are
+    named by method and path with the object IDs replaced, e.g. "GET /sites/{id}/jobs/{id}".
+    Latency is the time until the response headers arrived, and received bytes come from the
+    Content-Length header. record_sleep() accounts for the time spent waiting in retry and
+    polling loops.
+
+    summary() returns everything as a dictionary, to_json() and to_prometheus() export it
+    (the latter in the Prometheus text format, for the node exporter textfile collector).
+    """
+
+    # Upper bounds in seconds of the latency histogram buckets
+    LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    # Path segments following these are object IDs
+    ID_COLLECTIONS = frozenset(['sites', 'workbooks', 'views', 'datasources', 'projects', 'users', 'groups',
+                                'jobs', 'tasks', 'schedules', 'fileUploads', 'webhooks', 'flows', 'extractRefreshes'])
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.endpoints = {}
+        self.sleeps = {}
+
+    @classmethod
+    def endpoint_name(cls, method, url):
+        path = re.sub(r'^/api/[\d.]+', '', requests.utils.urlparse(url).path)
+        segments = path.split('/')
+        for i in range(1, len(segments)):
+            if segments[i - 1] in cls.ID_COLLECTIONS and segments[i]:
+                segments[i] = '{id}'
+        return '{0} {1}'.format(method, '/'.join(segments))
+
+    def record(self, response, *args, **kwargs):
+        """
+        Response hook of the session. Returns nothing so the response is left unchanged.
+        """
+        request = response.request
+        name = self.endpoint_name(request.method, request.url)
+        latency = response.elapsed.total_seconds()
+        body = request.body
+        sent = len(body) if isinstance(body, (bytes, str)) else 0
+        try:
+            received = int(response.headers.get('Content-Length', 0))
+        except ValueError:
+            received = 0
+
+        with self._lock:
+            endpoint = self.endpoints.get(name)
+            if endpoint is None:
+                endpoint = self.endpoints[name] = {
+                    'count': 0, 'statuses': collections.Counter(), 'bytes_sent': 0, 'bytes_received': 0,
+                    'latency_sum': 0.0, 'latency_max': 0.0, 'buckets': [0] * (len(self.LATENCY_BUCKETS) + 1),
+                }
+            endpoint['count'] += 1
+            endpoint['statuses'][response.status_code] += 1
+            endpoint['bytes_sent'] += sent
+            endpoint['bytes_received'] += received
+            endpoint['latency_sum'] += latency
+            endpoint['latency_max'] = max(endpoint['latency_max'], latency)
+            bucket = 0
+            while bucket < len(self.LATENCY_BUCKETS) and latency > self.LATENCY_BUCKETS[bucket]:
+                bucket += 1
+            endpoint['buckets'][bucket] += 1
+
+    def record_sleep(self, seconds, reason):
+        with self._lock:
+            sleep = self.sleeps.setdefault(reason, {'count': 0, 'seconds': 0.0})
+            sleep['count'] += 1
+            sleep['seconds'] += seconds
+
+    def summary(self):
+        """
+        :return: dictionary with 'elapsed', 'requests', 'request_seconds', 'sleep_seconds',
+                 'endpoints' (name -> count, statuses, bytes_sent, bytes_received, latency_sum,
+                 latency_max, latency_mean and cumulative latency_buckets) and 'sleeps' (reason -> count, seconds)
+        """
+        with self._lock:
+            endpoints = {}
+            for name, endpoint in self.endpoints.items():
+                cumulative = 0
+                buckets = {}
+                for bound, count in zip([str(bound) for bound in self.LATENCY_BUCKETS] + ['+Inf'], endpoint['buckets']):
+                    cumulative += count
+                    buckets[bound] = cumulative
+                endpoints[name] = {
+                    'count': endpoint['count'],
+                    'statuses': {str(status): count for status, count in endpoint['statuses'].items()},
+                    'bytes_sent': endpoint['bytes_sent'],
+                    'bytes_received': endpoint['bytes_received'],
+                    'latency_sum': endpoint['latency_sum'],
+                    'latency_max': endpoint['latency_max'],
+                    'latency_mean': endpoint['latency_sum'] / endpoint['count'],
+                    'latency_buckets': buckets,
+                }
+            sleeps = {reason: dict(sleep) for reason, sleep in self.sleeps.items()}
+        return {
+            'elapsed': time.time() - self.started,
+            'requests': sum(endpoint['count'] for endpoint in endpoints.values()),
+            'request_seconds': sum(endpoint['latency_sum'] for endpoint in endpoints.values()),
+            'sleep_seconds': sum(sleep['seconds'] for sleep in sleeps.values()),
+            'endpoints': endpoints,
+            'sleeps': sleeps,
+        }
+
+    def log_summary(self):
+        """
+        Logs the request and sleep totals, slowest endpoints (by total latency) first
+        """
+        summary = self.summary()
+        if not summary['requests'] and not summary['sleeps']:
+            return
+        logmsg("Tableau requests: {0} in {1:.1f}s, sleeping: {2:.1f}s, elapsed: {3:.1f}s".format(
+            summary['requests'], summary['request_seconds'], summary['sleep_seconds'], summary['elapsed']))
+        for name, endpoint in sorted(summary['endpoints'].items(), key=lambda item: -item[1]['latency_sum']):
+            logmsg("  {0}: {1} requests, {2:.1f}s total, {3:.3f}s mean, {4:.3f}s max, statuses {5}, {6} bytes received".format(
+                name, endpoint['count'], endpoint['latency_sum'], endpoint['latency_mean'], endpoint['latency_max'],
+                endpoint['statuses'], endpoint['bytes_received']))
+        for reason, sleep in sorted(summary['sleeps'].items()):
+            logmsg("  sleep {0}: {1} times, {2:.1f}s".format(reason, sleep['count'], sleep['seconds']))
+
+    @staticmethod
+    def _write(path, text):
+        # Written to a temporary file first so that collectors never read a partial file
+        tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'w') as output_file:
+            output_file.write(text)
+        os.replace(tmp_path, path)
+
+    def to_json(self, path=None):
+        """
+        :param path: optional file to write the metrics to
+        :return: the metrics as a JSON string
+        """
+        text = json.dumps(self.summary(), indent=2, sort_keys=True)
+        if path:
+            self._write(path, text)
+        return text
+
+    def to_prometheus(self, path=None, labels=None):
+        """
+        :param path: optional file to write the metrics to, e.g. <textfile collector dir>/tableau.prom
+        :param labels: optional dictionary of labels added to every sample, e.g. {'job': 'nightly_refresh'}
+        :return: the metrics in the Prometheus text exposition format
+        """
+        def escape(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        def format_labels(**sample_labels):
+            merged = dict(labels or {}, **sample_labels)
+            return '{' + ','.join('{0}="{1}"'.format(name, escape(value)) for name, value in sorted(merged.items())) + '}'
+
+        summary = self.summary()
+        lines = ['# HELP tableau_requests_total Tableau REST API requests by endpoint and status code',
+                 '# TYPE tableau_requests_total counter']
+        for name, endpoint in sorted(summary['endpoints'].items()):
+            for status, count in sorted(endpoint['statuses'].items()):
+                lines.append('tableau_requests_total{0} {1}'.format(format_labels(endpoint=name, status=status), count))
+
+        lines += ['# HELP tableau_request_duration_seconds Time until the response headers of Tableau REST API requests',
+                  '# TYPE tableau_request_duration_seconds histogram']
+        for name, endpoint in sorted(summary['endpoints'].items()):
+            for bound, count in endpoint['latency_buckets'].items():
+                lines.append('tableau_request_duration_seconds_bucket{0} {1}'.format(format_labels(endpoint=name, le=bound), count))
+            lines.append('tableau_request_duration_seconds_sum{0} {1}'.format(format_labels(endpoint=name), endpoint['latency_sum']))
+            lines.append('tableau_request_duration_seconds_count{0} {1}'.format(format_labels(endpoint=name), endpoint['count']))
+
+        for metric, key, help_text in (('tableau_request_bytes_total', 'bytes_sent', 'Bytes sent in Tableau REST API request bodies'),
+                                       ('tableau_response_bytes_total', 'bytes_received', 'Bytes received in Tableau REST API responses')):
+            lines += ['# HELP {0} {1}'.format(metric, help_text), '# TYPE {0} counter'.format(metric)]
+            for name, endpoint in sorted(summary['endpoints'].items()):
+                lines.append('{0}{1} {2}'.format(metric, format_labels(endpoint=name), endpoint[key]))
+
+        lines += ['# HELP tableau_sleep_seconds_total Time spent waiting in Tableau retry and polling loops',
+                  '# TYPE tableau_sleep_seconds_total counter']
+        for reason, sleep in sorted(summary['sleeps'].items()):
+            lines.append('tableau_sleep_seconds_total{0} {1}'.format(format_labels(reason=reason), sleep['seconds']))
+        lines += ['# HELP tableau_sleeps_total Number of waits in Tableau retry and polling loops',
+                  '# TYPE tableau_sleeps_total counter']
+        for reason, sleep in sorted(summary['sleeps'].items()):
+            lines.append('tableau_sleeps_total{0} {1}'.format(format_labels(reason=reason), sleep['count']))
+
+        text = '\n'.join(lines) + '\n'
+        if path:
+            self._write(path, text)
+        return text
+
+
 class Tableau:
     """
     This class constructor allows us to setup tableau class variables.
     """
 
-    def __init__(self):
+    def __init__(self, token_cache=False, token_ttl=7200):
         """
         Contruct a new Tableau object.
+
+        :param token_cache: reuse sign in tokens across processes. True caches them in ~/.tableau_tokens,
+                            a string caches them in that directory, False (default) disables the cache
+        :param token_ttl: seconds a cached token is reused before signing in again
         """
-        # The namespace for the REST API is 'http://tableausoftware.com/api' for Tableau Server 9.0 or 'http://tableau.com/api' for Tableau Server 9.1 or later
-        self.xmlns = {'t': 'http://tableau.com/api'}
+        self.xmlns = TABLEAU_XMLNS
         self.server = ''
         self.server_name = None
         self.token = None
@@ -53,13 +387,174 @@ class Tableau:
         self.site_content_url = None
         self.session = requests.Session() # for connection pooling
         self.session.verify = False
+        self.metrics = TableauMetrics() # request and sleep statistics, logged at sign out
+        self.session.hooks['response'].append(self.metrics.record)
+        self.last_upload = None # progress of the latest chunked upload, see _upload_file
+        self.site = ''
+        self.token_ttl = token_ttl
+        self.token_cache_dir = None
+        if token_cache:
+            self.token_cache_dir = token_cache if isinstance(token_cache, str) else os.path.join(os.path.expanduser('~'), '.tableau_tokens')
+        self._auth_lock = threading.Lock()
+        self._local = threading.local() # per thread: reauthenticating, set while this thread signs in again
+        self.index = None # optional TableauIndex used to accept names in place of IDs, see _resolve_id
+        self.render_cache = None # optional RenderCache of exports, see _cached_export
 
     def __del__(self):
         """
         Sign out of Tableau and release any other allocated resources.
+
+        Cached tokens are left signed in so that the next process can reuse them.
         """
-        if self.token is not None:
+        if self.token is not None and self.token_cache_dir is None:
             self.sign_out()
+        elif self.token is not None:
+            self.metrics.log_summary()
+
+
+    def _token_cache_file(self):
+        """
+        Returns the cache file of the current server, site and user.
+        """
+        key = hashlib.sha256("{0}|{1}|{2}".format(self.server, self.site, self.user).lower().encode('utf-8')).hexdigest()
+        return os.path.join(self.token_cache_dir, key + '.json')
+
+
+    def _load_cached_token(self):
+        """
+        Loads a cached token for the current server, site and user.
+
+        The file is ignored unless it is owned by the current user, is not readable by
+        anyone else and has not expired.
+
+        Returns True if a valid token was loaded.
+        """
+        cache_file = self._token_cache_file()
+        try:
+            file_stat = os.stat(cache_file)
+            if file_stat.st_uid != os.getuid() or file_stat.st_mode & 0o077:
+                logmsg("WARNING: Ignoring token cache file {} with unsafe ownership or permissions".format(cache_file))
+                return False
+            with open(cache_file) as token_file:
+                cached = json.load(token_file)
+        except (OSError, ValueError):
+            return False
+
+        if cached.get('expires_at', 0) <= time.time():
+            return False
+        self.token = cached['token']
+        self.site_id = cached['site_id']
+        self.site_content_url = cached['site_content_url']
+        self.user_id = cached['user_id']
+        self.site_name = cached['site_name']
+        return True
+
+
+    def _save_cached_token(self):
+        """
+        Writes the current token to the cache with owner-only permissions.
+        """
+        cached = {'token': self.token, 'site_id': self.site_id, 'site_content_url': self.site_content_url,
+                  'user_id': self.user_id, 'site_name': self.site_name, 'expires_at': time.time() + self.token_ttl}
+        try:
+            os.makedirs(self.token_cache_dir, mode=0o700, exist_ok=True)
+            os.chmod(self.token_cache_dir, 0o700)
+            cache_file = self._token_cache_file()
+            # Write to a private temporary file and rename it so readers never see a partial file
+            temp_file = "{0}.{1}.tmp".format(cache_file, os.getpid())
+            file_descriptor = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(file_descriptor, 'w') as token_file:
+                json.dump(cached, token_file)
+            os.replace(temp_file, cache_file)
+        except OSError as err:
+            logmsg("WARNING: Unable to write token cache: {}".format(err))
+
+
+    def _remove_cached_token(self):
+        try:
+            os.remove(self._token_cache_file())
+        except OSError:
+            pass
+
+
+    def _resolve_id(self, object_type, value):
+        """
+        Returns the ID of a workbook or view given either its ID or, when a TableauIndex
+        is attached as self.index, its name. Names that cannot be resolved are returned
+        unchanged so the request reports the error.
+
+        :param object_type: 'workbooks' or 'views'
+        :param value: ID or name
+        """
+        if self.index is None or value is None or LUID_PATTERN.match(value):
+            return value
+        matches = self.index.find(object_type, name=value)
+        if len(matches) == 1:
+            return matches[0]['id']
+        logmsg("ERROR: Unable to resolve {0} name '{1}' using the Tableau index ({2} matches)".format(object_type[:-1], value, len(matches)))
+        return value
+
+
+    def _sleep(self, seconds, reason):
+        """
+        Waits in a retry or polling loop, accounting the time to self.metrics under reason.
+        """
+        self.metrics.record_sleep(seconds, reason)
+        time.sleep(seconds)
+
+
+    def _wait_for_event(self, receiver, workbook_luids, since, timeout):
+        """
+        Waits on a WebhookReceiver for a refresh event of one of the workbooks, accounting
+        the time to self.metrics as webhook_wait.
+
+        :return: the event, or None if the timeout expired first
+        """
+        start = time.time()
+        event = receiver.wait(workbook_luids, since=since, timeout=timeout)
+        self.metrics.record_sleep(time.time() - start, 'webhook_wait')
+        return event
+
+
+    def _request(self, method, url, **kwargs):
+        """
+        Sends an authenticated request on the session.
+
+        If the server rejects the token (401), for instance because a cached token has
+        expired on the server, signs in again with the same credentials and retries once.
+        Threads that get a 401 while another thread signs in wait for it and retry with
+        the new token.
+
+        Returns the server response.
+        """
+        token = self.token
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers['x-tableau-auth'] = token
+        server_response = self.session.request(method, url, headers=headers, **kwargs)
+        # The sign in of this thread's own re-authentication is not retried
+        if server_response.status_code != 401 or not self.passwd or getattr(self._local, 'reauthenticating', False):
+            return server_response
+
+        with self._auth_lock:
+            # Another thread may already have signed in again while this one waited
+            if self.token == token:
+                logmsg("Tableau token rejected. Signing in to {0} again".format(self.server))
+                self._local.reauthenticating = True
+                try:
+                    self.token = None
+                    if self.token_cache_dir is not None:
+                        self._remove_cached_token()
+                    self.sign_in(self.server, self.user, self.passwd, self.site)
+                finally:
+                    self._local.reauthenticating = False
+            new_token = self.token
+        if new_token is None or new_token == token:
+            return server_response
+        # Release the connection of the rejected response, it may have been requested with stream=True
+        server_response.close()
+        headers['x-tableau-auth'] = new_token
+        # The site ID is part of most URLs; it only changes if the site itself was recreated
+        return self.session.request(method, url, headers=headers, **kwargs)
 
 
     @staticmethod
@@ -117,27 +612,78 @@ class Tableau:
 
         Returns the error code and error message.
         """
-        xml_response = ET.fromstring(server_response.text)
-        error_code = xml_response.find('t:error', namespaces=self.xmlns).attrib.get('code')
-        error_detail = xml_response.find('.//t:detail', namespaces=self.xmlns).text
+        error_code, error_detail = self._parse_error(server_response.text)
         logmsg("ERROR: {0}: {1}".format(error_code, error_detail))
         return error_code, error_detail
 
 
-    def sign_in_user(self, server, site=""):
+    @staticmethod
+    def _parse_error(xml_text):
+        """
+        Returns the error code and error detail of a tsResponse error body.
+        """
+        error = ET.fromstring(xml_text).find(ERROR)
+        error_code = error.get('code')
+        error_detail = error.find(DETAIL).text
+        return error_code, error_detail
+
+
+    @staticmethod
+    def _parse_credentials(xml_text):
+        """
+        Returns the Credentials of a signin response (token, site_id, site_content_url, user_id).
+        """
+        return Credentials.from_response(xml_text)
+
+
+    @staticmethod
+    def _parse_job_id(xml_text):
+        """
+        Returns the ID of the job element in a response, such as the one returned by a refresh request.
+        """
+        xml_response = ET.fromstring(xml_text)
+        job = xml_response.find(JOB)
+        if job is None:
+            job = next(xml_response.iter(JOB), None)
+        return job.get('id') if job is not None else None
+
+
+    @staticmethod
+    def _parse_job(xml_text):
+        """
+        Returns the Job of a Query Job response, the dictionary of job attributes (id, mode, type,
+        progress, created_at, updated_at, completed_at, finish_code, workbook_id, name,
+        schema_location). It is empty if the response holds no job element.
+        """
+        return Job.from_response(xml_text)
+
+
+    @staticmethod
+    def _get_user_credentials():
+        """
+        Reads the current user's username and password from ~/.windows.sec
+
+        Returns (username, password), or (None, None) if they cannot be read.
+        """
         win_sec_filename=os.path.join(os.getenv("HOME") + '/.windows.sec')
         if ( not os.path.isfile(win_sec_filename) ):
             logmsg('ERROR: {} : No file found'.format(win_sec_filename))
-            return
+            return None, None
         username, win_pass_enc = cs_crypt.get_sec_file_user_pass(win_sec_filename)
         win_pass = cs_crypt.decrypt_AES('MISd1g1tal!', win_pass_enc)
         if (len(username) < 2) or (len(win_pass) < 2):
             logmsg('ERROR: {} : No username or password found'.format(win_sec_filename))
-            return 
-        return self.sign_in(server, username, win_pass, site)
+            return None, None
+        return username, win_pass
 
 
-    def sign_in_site_admin(self, server, site=""):
+    @staticmethod
+    def _get_site_admin_credentials(server):
+        """
+        Reads the batch service account username and password for the given server.
+
+        Returns (username, password).
+        """
         sec_filename = "/NAS/mis/auth/dev/ad/svc.tableau.batch.dv.sec"
         if os.path.isfile("/NAS/mis/auth/prod/ad/svc.tableau.batch.sec") and not "dev" in server:
             sec_filename = "/NAS/mis/auth/prod/ad/svc.tableau.batch.sec"
@@ -148,6 +694,18 @@ class Tableau:
         username = props.get_property("username")
         enc_pass = props.get_property("password_aes")
         win_pass = cs_crypt.decrypt_AES("MISd1g1tal!", enc_pass)
+        return username, win_pass
+
+
+    def sign_in_user(self, server, site=""):
+        username, win_pass = self._get_user_credentials()
+        if username is None:
+            return
+        return self.sign_in(server, username, win_pass, site)
+
+
+    def sign_in_site_admin(self, server, site=""):
+        username, win_pass = self._get_site_admin_credentials(server)
         return self.sign_in(server, username, win_pass, site)
 
 
@@ -167,6 +725,15 @@ class Tableau:
         self.server = server
         self.server_name = re.sub('^https?://', '', server)
         self.server_name = re.sub('/.*$', '', self.server_name)
+        # Kept to sign in again when the token expires
+        self.user = name
+        self.passwd = password
+        self.site = site
+
+        if self.token_cache_dir is not None and self._load_cached_token():
+            logmsg("Reusing cached session for Tableau server {0}/{1} as {2}".format(server, site, name))
+            return True
+
         url = server + '/'.join(api_version.split('/')[:3]) + "/auth/signin"
         logmsg("Logging in to server: {0}".format(server))
 
@@ -193,25 +760,42 @@ class Tableau:
                 return False
             logmsg("ERROR: " + server_response.text)
             return False
-        # Reads and parses the response
-        xml_response = ET.fromstring(server_response.text)
-
-        # Gets the token and site ID
-        self.token = xml_response.find('t:credentials', namespaces=self.xmlns).attrib.get('token')
-        self.site_id = xml_response.find('.//t:site', namespaces=self.xmlns).attrib.get('id')
-        self.site_content_url = xml_response.find('.//t:site', namespaces=self.xmlns).attrib.get('contentUrl')
-        self.user_id = xml_response.find('.//t:user', namespaces=self.xmlns).attrib.get('id')
+        # Reads and parses the response to get the token and site ID
+        credentials = self._parse_credentials(server_response.text)
+        self.token, self.site_id, self.site_content_url, self.user_id = \
+            credentials.token, credentials.site_id, credentials.site_content_url, credentials.user_id
         
         # Query the site and get more details such as the name and site URL
         site_data = self.query_site(self.site_id)
         if site_data is not None:
-            self.site_name = site_data.attrib.get('name')
+            self.site_name = site_data.name
         
         if self.site_name is not None:
             logmsg("  Site Name: " + self.site_name)
+
+        if self.token_cache_dir is not None:
+            self._save_cached_token()
         return True
 
 
+    def query_site(self, site_id):
+        """
+        Process: Returns information about the specified site
+
+        :param site_id: ID of the site
+        :return: Site (its attrib and get() work like the site element), or None if the request fails
+        """
+        url = self.server + api_version + "{0}".format(site_id)
+
+        server_response = self._request('GET', url)
+
+        if server_response.status_code != 200:
+            logmsg("ERROR:\nServer Response: {}".format(server_response.text))
+            return None
+
+        return Site.from_response(server_response.content)
+
+
     def sign_out(self):
         """
         Destroys the active session
@@ -223,21 +807,65 @@ class Tableau:
                 server_response = self.session.post(url, headers={'x-tableau-auth': self.token})
             except:
                 print("ERROR: Failed to sign out: " + str(sys.exc_info()[0]))
+            if self.token_cache_dir is not None:
+                self._remove_cached_token()
             self.token = None
+            self.metrics.log_summary()
         return
-	def refresh_tableau_extract(self, workbook_id):
+
+
+    def _submit_refresh(self, workbook_id):
+        """
+        Process: Sends a single refresh request for a workbook extract
+
+        :param workbook_id: ID of workbook
+        :return: (server_response, job_id). job_id is None unless the server accepted the refresh (202)
+        """
+        url = self.server + api_version + "{0}/workbooks/{1}/refresh".format(self.site_id, self._resolve_id('workbooks', workbook_id))
+
+        server_response = self._request('POST', url, data=EMPTY_TS_REQUEST)
+        if server_response.status_code != 202:
+            return server_response, None
+        return server_response, self._parse_job_id(server_response.text)
+
+
+    @staticmethod
+    def _job_status(finish_code):
+        """
+        Translates a job finishCode into a readable status
+        """
+        if finish_code == None:
+            return 'In Progress'
+        elif finish_code == '1':
+            return 'Error'
+        elif finish_code == '2':
+            return 'Cancelled'
+        elif finish_code == '0':
+            return 'Complete'
+        return 'Unknown'
+
+
+    def refresh_tableau_extract(self, workbook_id, polling=None, receiver=None):
         """
         Process: Refreshes an extract
 
+        With a receiver, the job is checked as soon as the receiver gets a refresh event for
+        the workbook, and otherwise only every WEBHOOK_FALLBACK_INTERVAL seconds in case an
+        event is lost.
+
         :param workbook_id: ID of workbook
+        :param polling: PollingStrategy deciding the wait between status checks and retries
+                        (default FixedPolling(), the original 30s checks and 60s retries, or
+                        FixedPolling(WEBHOOK_FALLBACK_INTERVAL) with a receiver). Pass AdaptivePolling()
+                        to check young jobs sooner and back off while they run
+        :param receiver: started tableau_webhooks.WebhookReceiver registered for the refresh events of this site
         :return: refresh_job_response: dictionary of response attributes
         """
+        if polling is None:
+            polling = FixedPolling(interval=WEBHOOK_FALLBACK_INTERVAL) if receiver is not None else FixedPolling()
+        workbook_luid = self._resolve_id('workbooks', workbook_id)
         logmsg("Initiating refresh for workbook_id: {}".format(workbook_id))
-        url = self.server + api_version + "{0}/workbooks/{1}/refresh".format(self.site_id, workbook_id)
 
-        xml_payload_for_request = ET.Element('tsRequest')
-        xml_payload_for_request = ET.tostring(xml_payload_for_request)
-        
         # Loop while process is awaiting completion of existing extract
         max_retries = 10
         i = 0
@@ -245,168 +873,727 @@ class Tableau:
             if i == max_retries:
                 logmsg("ERROR: max_retries of {} reached. Exiting loop...".format(max_retries))
                 return None
-            server_response = self.session.post(url, data=xml_payload_for_request, headers={'x-tableau-auth': self.token})
+            # Events received from here on may be for this refresh
+            since = time.time()
+            server_response, job_id = self._submit_refresh(workbook_id)
             if server_response.status_code == 202:
                 break
             elif server_response.status_code in [403, 409]: # Existing extract already in progress
                 logmsg("Refresh already in process. Retrying refresh up to {} times".format(max_retries))
+                self._sleep(polling.retry_delay(i), 'refresh_retry')
                 i += 1
-                time.sleep(60)
                 continue
             else:
                 logmsg("ERROR:\nServer Response: {}".format(server_response.text))
                 return None
-        
-        xml_response = ET.fromstring(server_response.text)
-        response_data = {}
-        for child in xml_response.iter():
-            if child.tag == '{http://tableau.com/api}job':
-                response_data['job_id'] = child.get('id')
-        
+
+        submitted = time.time()
         refresh_job_response = None
         max_retries = 600 # Allow for >= 5 hour runtime
         i = 1
         # Use refresh_job_response to check whether job is complete
-        if server_response.status_code == 202:
-            while i <= max_retries:
-                if i == max_retries:
-                    logmsg("ERROR: max_retries of {} reached. Exiting loop...".format(max_retries))
-                    return None
-                refresh_job_response = self.query_job(response_data['job_id'])
-                if not refresh_job_response:
-                    logmsg("ERROR: Unable to retrieve refresh job status for workbook id '{}'. Exiting...".format(workbook_id))
-                    return None
-                progress = refresh_job_response['progress']
-
-                if refresh_job_response['finish_code'] == None:
-                    job_status = 'In Progress'
-                elif refresh_job_response['finish_code'] == '1':
-                    job_status = 'Error'
-                elif refresh_job_response['finish_code'] == '2':
-                    job_status = 'Cancelled'
-                elif refresh_job_response['finish_code'] == '0':
-                    job_status = 'Complete'
-
-                logmsg("Current progress: {}%, Job status: {}, Status check: {} of {}".format(progress if progress != None else 0, job_status, i, max_retries))
-                if refresh_job_response['finish_code'] is not None: # successful := 0
-                    break
-                else:
-                    time.sleep(30)
-                i += 1
- 
+        while i <= max_retries:
+            if i == max_retries:
+                logmsg("ERROR: max_retries of {} reached. Exiting loop...".format(max_retries))
+                return None
+            delay = polling.next_delay(refresh_job_response, i - 1, time.time() - submitted)
+            if receiver is None:
+                self._sleep(delay, 'job_poll')
+            else:
+                # The event may belong to another refresh of the workbook, query_job tells
+                event = self._wait_for_event(receiver, workbook_luid, since, delay)
+                if event is not None:
+                    since = event['received_at']
+            refresh_job_response = self.query_job(job_id)
+            if not refresh_job_response:
+                logmsg("ERROR: Unable to retrieve refresh job status for workbook id '{}'. Exiting...".format(workbook_id))
+                return None
+            progress = refresh_job_response['progress']
+            job_status = self._job_status(refresh_job_response['finish_code'])
+
+            logmsg("Current progress: {}%, Job status: {}, Status check: {} of {}".format(progress if progress != None else 0, job_status, i, max_retries))
+            if refresh_job_response['finish_code'] is not None: # successful := 0
+                break
+            if polling.expired(time.time() - submitted):
+                logmsg("ERROR: Polling deadline of {}s reached for workbook id '{}'. Exiting...".format(polling.deadline, workbook_id))
+                return None
+            i += 1
+
         return refresh_job_response
-            
- 
-    def query_job(self, job_id):
-        """
-        Process: Returns status information about an asynchronous process that is tracked using a job
 
-        :param job_id: ID of a job
-        :return: response_data: dictionary of response attributes
-        """
-        # URI Format for Query Job: /api/api-version/sites/site-id/jobs/job-id
-        url = self.server + api_version + "{0}/jobs/{1}".format(self.site_id, job_id)
-        
-        # Capture the refresh_job_id from the response of the refresh_tableau_extract(workbook_id) request
-        xml_payload_for_request = ET.Element('tsRequest')
-        xml_payload_for_request = ET.tostring(xml_payload_for_request)
-        
-        server_response = self.session.get(url, data=xml_payload_for_request, headers={'x-tableau-auth': self.token})
-        
-        # Fail out if server_response is something other than 200
-        if server_response.status_code != 200:
-            return None
-        
-        xml_response = ET.fromstring(server_response.text)
-        response_data = {}
-
-        for child in xml_response.iter():
-
-            if child.tag == '{http://tableau.com/api}tsResponse':
-                response_data['schema_location'] = child.get('{http://www.w3.org/2001/XMLSchema-instance}schemaLocation')
-            if child.tag == '{http://tableau.com/api}job':
-                response_data['id'] = child.get('id')
-                response_data['mode'] = child.get('mode')
-                response_data['type'] = child.get('type')
-                response_data['progress'] = child.get('progress')
-                response_data['created_at'] = child.get('createdAt')
-                response_data['updated_at'] = child.get('updatedAt')
-                response_data['completed_at'] = child.get('completedAt')
-                response_data['finish_code'] = child.get('finishCode')
-            if child.tag == '{http://tableau.com/api}workbook':
-                response_data['workbook_id'] = child.get('id')
-                response_data['name'] = child.get('name')
-        
-        return response_data
 
-    def cancel_job(self, job_id):
+    def refresh_tableau_extracts(self, workbook_ids, max_concurrent=5, max_retries=10, max_checks=600, polling=None, bulk_threshold=5, receiver=None):
         """
-        Process: Cancels a job if it exists
+        Process: Refreshes the extracts of several workbooks at once
 
-        :param job_id: ID of a job
-        :return: response_data: dictionary of response attributes
-        """
-        # URI Format for Query Job: /api/api-version/sites/site-id/jobs/job-id
-        url = self.server + api_version + "{0}/jobs/{1}".format(self.site_id, job_id)
+        Refreshes are submitted up to max_concurrent at a time and every running job is
+        checked from a single polling loop, so the batch takes roughly as long as its
+        slowest refresh instead of the sum of all of them. When a job finishes the next
+        queued workbook is submitted. Workbooks that already have a refresh in progress
+        (403/409) are re-queued and retried after polling.retry_delay().
 
-        # Capture the refresh_job_id from the response of the refresh_tableau_extract(workbook_id) request
-        xml_payload_for_request = ET.Element('tsRequest')
-        xml_payload_for_request = ET.tostring(xml_payload_for_request)
+        Each job is checked on its own schedule from polling.next_delay(). When at least
+        bulk_threshold jobs are due at once their status is read from a single query_jobs
+        call instead of one query_job call each.
 
-        server_response = self.session.put(url, data=xml_payload_for_request, headers={'x-tableau-auth': self.token})
+        With a receiver, a job is also due as soon as the receiver gets a refresh event for
+        its workbook, and the polling schedule is only a fallback in case an event is lost.
+
+        :param workbook_ids: list of workbook IDs
+        :param max_concurrent: maximum number of refresh jobs running at the same time
+        :param max_retries: number of 403/409 responses tolerated per workbook before giving up
+        :param max_checks: maximum number of status checks per job
+        :param polling: PollingStrategy deciding the wait between status checks and retries
+                        (default AdaptivePolling(), or FixedPolling(WEBHOOK_FALLBACK_INTERVAL) with a receiver)
+        :param bulk_threshold: number of due jobs at which query_jobs is used (None never uses it)
+        :param receiver: started tableau_webhooks.WebhookReceiver registered for the refresh events of this site
+        :return: results: dictionary of workbook_id -> query_job response (None if the refresh failed)
+        """
+        if polling is None:
+            polling = FixedPolling(interval=WEBHOOK_FALLBACK_INTERVAL) if receiver is not None else AdaptivePolling()
+        # Preserve the caller's order but only refresh each workbook once
+        workbook_ids = list(dict.fromkeys(workbook_ids))
+        results = dict.fromkeys(workbook_ids)
+        attempts = dict.fromkeys(workbook_ids, 0)
+        pending = collections.deque((workbook_id, 0) for workbook_id in workbook_ids) # (workbook_id, not_before)
+        active = {} # job_id -> {'workbook_id', 'luid', 'submitted', 'checks', 'due'}
+        since = time.time() # events received before this time have been handled
+        logmsg("Initiating refresh for {} workbooks, up to {} at a time".format(len(workbook_ids), max_concurrent))
+
+        while pending or active:
+            # Fill the free slots with queued workbooks whose retry delay has elapsed
+            deferred = []
+            while pending and len(active) < max_concurrent:
+                workbook_id, not_before = pending.popleft()
+                if not_before > time.time():
+                    deferred.append((workbook_id, not_before))
+                    continue
+                logmsg("Initiating refresh for workbook_id: {}".format(workbook_id))
+                server_response, job_id = self._submit_refresh(workbook_id)
+                if server_response.status_code == 202:
+                    submitted = time.time()
+                    active[job_id] = {'workbook_id': workbook_id, 'luid': self._resolve_id('workbooks', workbook_id), 'submitted': submitted, 'checks': 0,
+                                      'due': submitted + polling.next_delay(None, 0, 0)}
+                elif server_response.status_code in [403, 409]: # Existing extract already in progress
+                    attempts[workbook_id] += 1
+                    if attempts[workbook_id] >= max_retries:
+                        logmsg("ERROR: max_retries of {} reached for workbook_id: {}".format(max_retries, workbook_id))
+                        continue
+                    logmsg("Refresh already in process for workbook_id: {}. Retry {} of {}".format(workbook_id, attempts[workbook_id], max_retries))
+                    deferred.append((workbook_id, time.time() + polling.retry_delay(attempts[workbook_id] - 1)))
+                else:
+                    logmsg("ERROR: Refresh failed for workbook_id: {}\nServer Response: {}".format(workbook_id, server_response.text))
+            pending.extendleft(reversed(deferred))
+
+            due = [job_id for job_id, job in active.items() if job['due'] <= time.time()]
+            if due:
+                statuses = {}
+                if bulk_threshold is not None and len(due) >= bulk_threshold:
+                    statuses = self.query_jobs(due, filter='jobType:eq:refresh_extracts',
+                                               created_after=min(active[job_id]['submitted'] for job_id in due))
+                    if statuses is None:
+                        logmsg("Unable to query the job list. Falling back to checking jobs one at a time")
+                        bulk_threshold = None
+                        statuses = {}
+                for job_id in due:
+                    job = active[job_id]
+                    workbook_id = job['workbook_id']
+                    refresh_job_response = statuses.get(job_id)
+                    if refresh_job_response is None or refresh_job_response['finish_code'] is not None:
+                        # Jobs missing from the job list, and finished ones, need the full job details
+                        refresh_job_response = self.query_job(job_id)
+                    job['checks'] += 1
+                    elapsed = time.time() - job['submitted']
+                    if not refresh_job_response:
+                        logmsg("ERROR: Unable to retrieve refresh job status for workbook id '{}'".format(workbook_id))
+                        del active[job_id]
+                    elif refresh_job_response['finish_code'] is not None: # successful := 0
+                        logmsg("Workbook {} finished, Job status: {}".format(workbook_id, self._job_status(refresh_job_response['finish_code'])))
+                        results[workbook_id] = refresh_job_response
+                        del active[job_id]
+                    elif job['checks'] >= max_checks or polling.expired(elapsed):
+                        logmsg("ERROR: Gave up waiting for workbook id '{}' after {} checks".format(workbook_id, job['checks']))
+                        del active[job_id]
+                    else:
+                        job['due'] = time.time() + polling.next_delay(refresh_job_response, job['checks'], elapsed)
+                logmsg("Checked {} jobs: {} running, {} queued".format(len(due), len(active), len(pending)))
+
+            # Sleep until the next job check or queued retry is due
+            wake_times = [job['due'] for job in active.values()]
+            if len(active) < max_concurrent:
+                wake_times += [not_before for _, not_before in pending]
+            if wake_times and receiver is not None and active:
+                event = self._wait_for_event(receiver, [job['luid'] for job in active.values()], since, max(0, min(wake_times) - time.time()))
+                if event is not None:
+                    since = event['received_at']
+                    for job in active.values():
+                        if job['luid'] == event['resource_luid']:
+                            job['due'] = since
+            elif wake_times:
+                self._sleep(max(0, min(wake_times) - time.time()), 'batch_poll')
+
+        return results
+
+
+    ### Below methods iterate over the paginated list endpoints ###
+    @staticmethod
+    def _element_to_dict(element):
+        """
+        Converts a list item element into a dictionary of its attributes.
+
+        Child elements are added under their tag name: a child holding a list of same-named
+        elements (e.g. <tags><tag label=""/></tags>) becomes a list of attribute dictionaries,
+        any other child becomes a dictionary of its attributes.
+        """
+        item = dict(element.attrib)
+        for child in element:
+            name = child.tag.rpartition('}')[2]
+            if len(child) and len(set(grandchild.tag for grandchild in child)) == 1:
+                item[name] = [dict(grandchild.attrib) for grandchild in child]
+            else:
+                item[name] = dict(child.attrib)
+        return item
+
+
+    def _get_page(self, url, params, page_number):
+        """
+        Downloads one page of a list endpoint, raising requests.exceptions.HTTPError if it fails.
+        """
+        params = dict(params, pageNumber=page_number)
+        server_response = self._request('GET', url, params=params)
+        if server_response.status_code != 200:
+            logmsg("ERROR:\nServer Response: {}".format(server_response.text))
+            server_response.raise_for_status()
+        return server_response.content
+
+
+    def iter_list(self, endpoint, tag, filter=None, sort=None, fields=None, page_size=100, params=None):
+        """
+        Process: Iterates over every item of a paginated list endpoint such as workbooks or users
+
+        Each page is parsed incrementally with iterparse and every item is released once it has
+        been yielded. As soon as the pagination element of a page has been read the next page is
+        requested in the background, so it downloads while the caller consumes the current page.
+        Memory use is bounded by two pages however many items the list holds.
+
+        :param endpoint: path below the site, e.g. 'workbooks'
+        :param tag: tag of the list items, e.g. 'workbook'
+        :param filter: server-side filter expression, e.g. 'updatedAt:gte:2020-01-01T00:00:00Z'
+        :param sort: server-side sort expression, e.g. 'name:asc'
+        :param fields: server-side field selection, e.g. '_default_,owner.name'
+        :param page_size: number of items requested per page (Tableau allows up to 1000)
+        :param params: additional query parameters
+        :return: generator of item dictionaries (see _element_to_dict). Raises requests.exceptions.HTTPError
+                 if a page cannot be retrieved, so a partial list is never mistaken for a complete one
+        """
+        url = self.server + api_version + "{0}/{1}".format(self.site_id, endpoint)
+        params = dict(params or {}, pageSize=page_size)
+        if filter:
+            params['filter'] = filter
+        if sort:
+            params['sort'] = sort
+        if fields:
+            params['fields'] = fields
+        qualified_tag = TABLEAU_NS + tag
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            page_number = 1
+            next_page = executor.submit(self._get_page, url, params, page_number)
+            while next_page is not None:
+                content = next_page.result()
+                next_page = None
+                depth = 0
+                for event, element in ET.iterparse(io.BytesIO(content), events=('start', 'end')):
+                    if event == 'start':
+                        depth += 1
+                        continue
+                    depth -= 1
+                    if element.tag == PAGINATION:
+                        total_available = int(element.get('totalAvailable', 0))
+                        if page_number * page_size < total_available:
+                            next_page = executor.submit(self._get_page, url, params, page_number + 1)
+                    # Items are the children of the collection element: tsResponse > workbooks > workbook
+                    elif depth == 2 and element.tag == qualified_tag:
+                        yield self._element_to_dict(element)
+                        element.clear()
+                page_number += 1
+
+
+    def iter_workbooks(self, **kwargs):
+        return self.iter_list('workbooks', 'workbook', **kwargs)
+
+
+    def iter_views(self, **kwargs):
+        return self.iter_list('views', 'view', **kwargs)
+
+
+    def iter_datasources(self, **kwargs):
+        return self.iter_list('datasources', 'datasource', **kwargs)
+
+
+    def iter_projects(self, **kwargs):
+        return self.iter_list('projects', 'project', **kwargs)
+
+
+    def iter_users(self, **kwargs):
+        return self.iter_list('users', 'user', **kwargs)
+
+
+    def iter_groups(self, **kwargs):
+        return self.iter_list('groups', 'group', **kwargs)
+
+
+    def iter_jobs(self, **kwargs):
+        return self.iter_list('jobs', 'backgroundJob', **kwargs)
+
+
+    def query_jobs(self, job_ids=None, filter=None, page_size=1000, created_after=None):
+        """
+        Process: Returns the status of many jobs from the site's job list (Query Jobs) instead of one request per job
+
+        The job list does not report progress, so in-progress jobs have a progress of None and
+        finished jobs a progress of '100'. It does not include the workbook either.
+
+        With created_after only jobs created since then are requested, newest first, and the
+        list is read no further than the first older job, so the cost does not grow with the
+        site's job history. The bound is moved back by CLOCK_SKEW seconds to allow for the
+        server clock being behind the local one.
+
+        :param job_ids: IDs of the jobs to return. None returns every job in the list
+        :param filter: server-side filter expression, e.g. 'jobType:eq:refresh_extracts'
+        :param page_size: number of jobs requested per page
+        :param created_after: time.time() value, e.g. the submission time of the oldest job in job_ids
+        :return: jobs: dictionary of job_id -> dictionary in the same shape as query_job, or None if the request fails
+        """
+        wanted = set(job_ids) if job_ids is not None else None
+        sort = oldest = None
+        if created_after is not None:
+            oldest = datetime.datetime(*time.gmtime(created_after - CLOCK_SKEW)[:6])
+            created_filter = 'createdAt:gte:' + oldest.strftime('%Y-%m-%dT%H:%M:%SZ')
+            filter = '{0},{1}'.format(filter, created_filter) if filter else created_filter
+            sort = 'createdAt:desc'
+
+        jobs = {}
+        try:
+            for background_job in self.iter_jobs(filter=filter, sort=sort, page_size=page_size):
+                created_at = _parse_timestamp(background_job.get('createdAt'))
+                # Sorted newest first, every job after this one is older than the jobs asked for
+                if oldest is not None and created_at is not None and created_at < oldest:
+                    break
+                if wanted is None or background_job.get('id') in wanted:
+                    jobs[background_job.get('id')] = self._parse_background_job(background_job)
+                    # Stop once every requested job has been seen
+                    if wanted is not None and wanted.issubset(jobs):
+                        break
+        except requests.exceptions.RequestException:
+            return None
+
+        return jobs
+
+
+    @staticmethod
+    def _parse_background_job(child):
+        """
+        Converts a backgroundJob of the job list into the Job returned by query_job.
+        """
+        return Job.from_background_job(child)
+
+
+    def find_workbook_by_name(self, workbook_name):
+        """
+        Process: Finds the workbooks on the site with the given name
+
+        :param workbook_name: name of the workbook
+        :return: list of dictionaries of workbook attributes plus project_id and project_name, or None if the request fails
+        """
+        workbooks = []
+        try:
+            for workbook_data in self.iter_workbooks(filter='name:eq:{0}'.format(workbook_name)):
+                project = workbook_data.pop('project', {})
+                workbook_data['project_id'] = project.get('id')
+                workbook_data['project_name'] = project.get('name')
+                workbooks.append(workbook_data)
+        except requests.exceptions.RequestException:
+            return None
+        return workbooks
+
+
+    def query_workbook(self, workbook_id):
+        """
+        Process: Returns information about a workbook
+
+        :param workbook_id: ID of workbook
+        :return: Workbook, readable as a dictionary of the workbook attributes, or None if the request fails
+        """
+        # URI Format for Query Workbook: /api/api-version/sites/site-id/workbooks/workbook-id
+        url = self.server + api_version + "{0}/workbooks/{1}".format(self.site_id, self._resolve_id('workbooks', workbook_id))
+
+        server_response = self._request('GET', url)
+        if server_response.status_code != 200:
+            return None
+        workbook = ET.fromstring(server_response.content).find(WORKBOOK)
+        return Workbook.from_element(workbook) if workbook is not None else None
+
+
+    def query_view(self, view_id):
+        """
+        Process: Returns information about a view
+
+        :param view_id: ID of view
+        :return: dictionary of the view attributes plus workbook_id, or None if the request fails
+        """
+        # URI Format for Get View: /api/api-version/sites/site-id/views/view-id
+        url = self.server + api_version + "{0}/views/{1}".format(self.site_id, self._resolve_id('views', view_id))
+
+        server_response = self._request('GET', url)
+        if server_response.status_code != 200:
+            return None
+        view_element = ET.fromstring(server_response.content).find(TABLEAU_NS + 'view')
+        if view_element is None:
+            return None
+        view = self._element_to_dict(view_element)
+        view['workbook_id'] = view.pop('workbook', {}).get('id')
+        return view
+
+
+    def query_metadata(self, query, variables=None, raise_for_status=False):
+        """
+        Process: Runs a GraphQL query against the Metadata API
+
+        :param query: GraphQL query
+        :param variables: dictionary of query variables
+        :param raise_for_status: raise requests.exceptions.HTTPError when the server does not answer 200,
+                                 so the caller can tell a missing or disabled Metadata API (404, 401, 403)
+                                 from a transient failure
+        :return: the data of the response, or None if the Metadata API is unavailable or reports errors
+        """
+        url = self.server + "/api/metadata/graphql"
+
+        server_response = self._request('POST', url, json={'query': query, 'variables': variables or {}})
+        if server_response.status_code != 200:
+            if raise_for_status:
+                server_response.raise_for_status()
+            return None
+        try:
+            response_data = server_response.json()
+        except ValueError:
+            return None
+        if response_data.get('errors'):
+            logmsg("ERROR: Metadata API query failed: {0}".format(response_data['errors']))
+            return None
+        return response_data.get('data')
+
+
+    def query_job(self, job_id):
+        """
+        Process: Returns status information about an asynchronous process that is tracked using a job
+
+        :param job_id: ID of a job
+        :return: response_data: Job, a dictionary of response attributes (see _parse_job). Empty if the response holds no job
+        """
+        # URI Format for Query Job: /api/api-version/sites/site-id/jobs/job-id
+        url = self.server + api_version + "{0}/jobs/{1}".format(self.site_id, job_id)
+        
+        server_response = self._request('GET', url)
+        
+        # Fail out if server_response is something other than 200
+        if server_response.status_code != 200:
+            return None
+
+        return self._parse_job(server_response.content)
+
+    def cancel_job(self, job_id):
+        """
+        Process: Cancels a job if it exists
+
+        :param job_id: ID of a job
+        :return: response_data: dictionary of response attributes
+        """
+        # URI Format for Query Job: /api/api-version/sites/site-id/jobs/job-id
+        url = self.server + api_version + "{0}/jobs/{1}".format(self.site_id, job_id)
+
+        server_response = self._request('PUT', url, data=EMPTY_TS_REQUEST)
 
         logmsg(str(server_response.status_code))
         logmsg(str(server_response.headers))
         logmsg(str(server_response.text))
 
         return
-    
+
+
+    ### Below methods manage the webhooks used by tableau_webhooks.WebhookReceiver ###
+    def create_webhook(self, name, event, url):
+        """
+        Process: Creates a webhook posting an event of the site to a URL
+
+        :param name: name of the webhook
+        :param event: webhook event, e.g. 'WorkbookRefreshSucceeded'
+        :param url: destination URL, reachable from Tableau Server
+        :return: webhook: dictionary of the webhook element attributes (id, name), or None if the request fails
+        """
+        # URI Format for Create a Webhook: /api/api-version/sites/site-id/webhooks
+        url_webhooks = self.server + api_version + "{0}/webhooks".format(self.site_id)
+        # WorkbookRefreshSucceeded -> webhook-source-event-workbook-refresh-succeeded
+        source_event = 'webhook-source-event-' + re.sub(r'(?<!^)(?=[A-Z])', '-', event).lower()
+
+        xml_payload_for_request = ET.Element('tsRequest')
+        webhook_element = ET.SubElement(xml_payload_for_request, 'webhook', name=name)
+        ET.SubElement(ET.SubElement(webhook_element, 'webhook-source'), source_event)
+        ET.SubElement(ET.SubElement(webhook_element, 'webhook-destination'), 'webhook-destination-http', method='POST', url=url)
+
+        server_response = self._request('POST', url_webhooks, data=ET.tostring(xml_payload_for_request))
+        if server_response.status_code != 201:
+            logmsg("ERROR: Unable to create webhook '{0}'\nServer Response: {1}".format(name, server_response.text))
+            return None
+        webhook = ET.fromstring(server_response.content).find(WEBHOOK)
+        return dict(webhook.attrib) if webhook is not None else None
+
+
+    def delete_webhook(self, webhook_id):
+        """
+        Process: Deletes a webhook
+
+        :param webhook_id: ID of the webhook
+        :return: True if the webhook was deleted
+        """
+        # URI Format for Delete a Webhook: /api/api-version/sites/site-id/webhooks/webhook-id
+        url = self.server + api_version + "{0}/webhooks/{1}".format(self.site_id, webhook_id)
+
+        server_response = self._request('DELETE', url)
+        if server_response.status_code != 204:
+            logmsg("ERROR: Unable to delete webhook '{0}'\nServer Response: {1}".format(webhook_id, server_response.text))
+            return False
+        return True
+
+    ### Below methods publish workbooks and datasources through a chunked file upload session ###
+    def _initiate_file_upload(self):
+        """
+        Process: Starts a file upload session
+
+        :return: upload_session_id, or None if the request fails
+        """
+        url = self.server + api_version + "{0}/fileUploads".format(self.site_id)
+
+        server_response = self._request('POST', url)
+
+        if server_response.status_code != 201:
+            logmsg("ERROR:\nServer Response: {}".format(server_response.text))
+            return None
+
+        xml_response = ET.fromstring(server_response.text)
+        return xml_response.find(FILE_UPLOAD).get('uploadSessionId')
+
+
+    @staticmethod
+    def _upload_size_matches(xml_text, expected_size):
+        """
+        Checks the fileSize of an Append to File Upload response against the number of bytes the
+        session should hold. Tableau reports the size in whole megabytes, so a chunk appended twice
+        is detected as long as chunks are at least 1 MB. Responses without a fileSize are accepted.
+        """
+        file_upload = ET.fromstring(xml_text).find(FILE_UPLOAD)
+        file_size = file_upload.get('fileSize') if file_upload is not None else None
+        if file_size is None:
+            return True
+        return abs(float(file_size) - expected_size / float(1024 * 1024)) < 1
+
+
+    def _append_to_file_upload(self, upload_session_id, chunk, max_retries=3, expected_size=None):
+        """
+        Process: Appends one chunk of a file to an upload session, retrying transient failures
+
+        An append is not idempotent, so it is only retried when the chunk cannot have been
+        appended: the server answered with an error, or the connection could not be opened.
+        Any other failure (connection reset, read timeout) may have happened after the server
+        appended the chunk and is returned to the caller without a retry.
+
+        :param upload_session_id: ID returned by _initiate_file_upload
+        :param chunk: bytes to append
+        :param max_retries: number of attempts before giving up
+        :param expected_size: bytes the session holds once the chunk is appended, checked against
+                              the fileSize of the response (None skips the check)
+        :return: True if the chunk was appended, otherwise False
+        """
+        url = self.server + api_version + "{0}/fileUploads/{1}".format(self.site_id, upload_session_id)
+        payload, content_type = self._make_multipart({'request_payload': ('', '', 'text/xml'),
+                                                      'tableau_file': ('file', chunk, 'application/octet-stream')})
+
+        for attempt in range(1, max_retries + 1):
+            try:
+                server_response = self._request('PUT', url, data=payload, headers={'content-type': content_type})
+                if server_response.status_code == 200:
+                    if expected_size is not None and not self._upload_size_matches(server_response.content, expected_size):
+                        logmsg("ERROR: Upload session {} does not hold the expected {} bytes, a chunk was appended twice. Start a new upload session"\
+                            .format(upload_session_id, expected_size))
+                        return False
+                    return True
+                logmsg("ERROR: Chunk upload attempt {} of {} failed:\nServer Response: {}".format(attempt, max_retries, server_response.text))
+            except requests.exceptions.ConnectTimeout as err:
+                logmsg("ERROR: Chunk upload attempt {} of {} failed: {}".format(attempt, max_retries, err))
+            except requests.exceptions.RequestException as err:
+                # The server may have appended the chunk before the failure, retrying could append it twice
+                logmsg("ERROR: Chunk upload failed, the chunk may or may not have been appended: {}".format(err))
+                return False
+            if attempt < max_retries:
+                self._sleep(2 ** attempt, 'upload_retry')
+        return False
+
+
+    def _upload_file(self, file_path, chunk_size, upload_session_id=None, resume_offset=0, max_retries=3):
+        """
+        Process: Uploads a file in chunk_size pieces read lazily from disk
+
+        Only one chunk is held in memory at a time. Progress is kept in self.last_upload
+        ({'upload_session_id', 'file_path', 'offset'}) so that a failed upload can be resumed
+        by passing its upload_session_id and offset back in. Every append is checked against
+        the size the server reports for the session, so a resume after a chunk that was in fact
+        appended fails instead of silently corrupting the file.
+
+        :param file_path: file to upload
+        :param chunk_size: bytes sent per request
+        :param upload_session_id: existing upload session to resume (None starts a new one)
+        :param resume_offset: byte offset in the file to resume from
+        :param max_retries: attempts per chunk
+        :return: upload_session_id once the whole file is uploaded, or None on failure
+        """
+        if upload_session_id is None:
+            upload_session_id = self._initiate_file_upload()
+            if upload_session_id is None:
+                return None
+            resume_offset = 0
+
+        file_size = os.path.getsize(file_path)
+        offset = resume_offset
+        self.last_upload = {'upload_session_id': upload_session_id, 'file_path': file_path, 'offset': offset}
+        logmsg("Uploading {} ({} bytes) from offset {} in upload session {}".format(file_path, file_size, offset, upload_session_id))
+
+        with open(file_path, 'rb') as upload_file:
+            upload_file.seek(offset)
+            while offset < file_size:
+                chunk = upload_file.read(chunk_size)
+                if not self._append_to_file_upload(upload_session_id, chunk, max_retries, expected_size=offset + len(chunk)):
+                    logmsg("ERROR: Upload of {} stopped at byte {} of {}. Resume with upload_session_id='{}', resume_offset={}"\
+                        .format(file_path, offset, file_size, upload_session_id, offset))
+                    return None
+                offset += len(chunk)
+                self.last_upload['offset'] = offset
+                logmsg("  Uploaded {} of {} bytes".format(offset, file_size))
+
+        return upload_session_id
+
+
+    def _publish(self, content_type, type_param, xml_payload_for_request, file_path, overwrite, chunk_size, upload_session_id, resume_offset, max_retries):
+        """
+        Process: Uploads a file and commits it as a workbook or datasource
+
+        :param content_type: 'workbook' or 'datasource'
+        :param type_param: name of the file type query parameter, e.g. workbookType
+        :param xml_payload_for_request: tsRequest element describing the content
+        :return: dictionary of the published content's attributes, or None on failure
+        """
+        upload_session_id = self._upload_file(file_path, chunk_size, upload_session_id, resume_offset, max_retries)
+        if upload_session_id is None:
+            return None
+
+        file_type = os.path.splitext(file_path)[1][1:].lower()
+        url = self.server + api_version + "{0}/{1}s?uploadSessionId={2}&{3}={4}&overwrite={5}"\
+            .format(self.site_id, content_type, upload_session_id, type_param, file_type, str(overwrite).lower())
+        payload, multipart_content_type = self._make_multipart({'request_payload': ('', ET.tostring(xml_payload_for_request), 'text/xml')})
+
+        logmsg("Committing upload session {} as {} {}".format(upload_session_id, content_type, file_path))
+        server_response = self._request('POST', url, data=payload, headers={'content-type': multipart_content_type})
+
+        if server_response.status_code != 201:
+            logmsg("ERROR:\nServer Response: {}".format(server_response.text))
+            return None
+
+        element = ET.fromstring(server_response.text).find(TABLEAU_NS + content_type)
+        if content_type == 'workbook':
+            return Workbook.from_element(element)
+        return dict(element.attrib)
+
+
+    def publish_workbook(self, file_path, workbook_name, project_id, overwrite=False, show_tabs=False,
+                         chunk_size=5 * 1024 * 1024, upload_session_id=None, resume_offset=0, max_retries=3):
+        """
+        Process: Publishes a .twb/.twbx workbook using a chunked file upload
+
+        :param file_path: workbook file to publish
+        :param workbook_name: name of the workbook on the server
+        :param project_id: ID of the project to publish to
+        :param overwrite: replace an existing workbook of the same name
+        :param show_tabs: show views as tabs
+        :param chunk_size: bytes sent per upload request (Tableau accepts up to 64MB)
+        :param upload_session_id, resume_offset: resume a failed upload (see self.last_upload)
+        :param max_retries: attempts per chunk
+        :return: Workbook, readable as a dictionary of the published workbook's attributes, or None on failure
+        """
+        if os.path.splitext(file_path)[1].lower() not in ('.twb', '.twbx'):
+            logmsg("ERROR: {} is not a .twb or .twbx file".format(file_path))
+            return None
+
+        xml_payload_for_request = ET.Element('tsRequest')
+        workbook_element = ET.SubElement(xml_payload_for_request, 'workbook', name=workbook_name, showTabs=str(show_tabs).lower())
+        ET.SubElement(workbook_element, 'project', id=project_id)
+
+        return self._publish('workbook', 'workbookType', xml_payload_for_request, file_path, overwrite, chunk_size, upload_session_id, resume_offset, max_retries)
+
+
+    def publish_datasource(self, file_path, datasource_name, project_id, overwrite=False,
+                           chunk_size=5 * 1024 * 1024, upload_session_id=None, resume_offset=0, max_retries=3):
+        """
+        Process: Publishes a .hyper/.tde/.tds/.tdsx datasource using a chunked file upload
+
+        :param file_path: datasource file to publish
+        :param datasource_name: name of the datasource on the server
+        :param project_id: ID of the project to publish to
+        :param overwrite: replace an existing datasource of the same name
+        :param chunk_size: bytes sent per upload request (Tableau accepts up to 64MB)
+        :param upload_session_id, resume_offset: resume a failed upload (see self.last_upload)
+        :param max_retries: attempts per chunk
+        :return: dictionary of the published datasource's attributes, or None on failure
+        """
+        if os.path.splitext(file_path)[1].lower() not in ('.hyper', '.tde', '.tds', '.tdsx'):
+            logmsg("ERROR: {} is not a .hyper, .tde, .tds or .tdsx file".format(file_path))
+            return None
+
+        xml_payload_for_request = ET.Element('tsRequest')
+        datasource_element = ET.SubElement(xml_payload_for_request, 'datasource', name=datasource_name)
+        ET.SubElement(datasource_element, 'project', id=project_id)
+
+        return self._publish('datasource', 'datasourceType', xml_payload_for_request, file_path, overwrite, chunk_size, upload_session_id, resume_offset, max_retries)
+
+
     ### Below 3 methods are to facilitate .tableau_extract, where a view is exported to a file of user-specified type (PNG, PDF, FULLPDF) ###
     # Endpoint 1: Query View Image
-    def query_view_image(self, view_id):
+    def query_view_image(self, view_id, filters=None):
         """
         Process: Extracts Tableau view to PNG
 
         :param view_id
+        :param filters: optional dictionary of field name -> value, sent as vf_<field name> view filters
         :return: server_response.content (PNG image of the provided view)
         """
-        url = self.server + api_version + "{0}/views/{1}/image".format(self.site_id, view_id)
+        url = self._view_image_url(view_id, filters)
         logmsg("URI " + url)
 
-        xml_payload_for_request = ET.Element('tsRequest')
-        xml_payload_for_request = ET.tostring(xml_payload_for_request)
-        
-        server_response = self.session.get(url, data=xml_payload_for_request, headers={'x-tableau-auth': self.token})
-        
-        if server_response.status_code != 200:
-            logmsg("ERROR:\nServer Response: {}".format(server_response.text))
-            return None
-        
-        return server_response.content
+        return self._cached_export(url, 'view_image', self._resolve_id('views', view_id), filters=filters)
         
         
     # Endpoint 2: Query View PDF
     #   - for option PDF, the user can specify: $page_orientation (portrait || landscape), $page_type (pageType in API docs), $width (vizWidth), $height (vizHeight)
-    def query_view_pdf(self, view_id, page_orientation, page_type, width, height):
+    def query_view_pdf(self, view_id, page_orientation, page_type, width, height, filters=None):
         """
         Process: Extracts Tableau view to PDF
 
         :param view_id, page_orientation, page_type, width, height. Latter 4 are set to defaults in directive if not otherwise specified
+        :param filters: optional dictionary of field name -> value, sent as vf_<field name> view filters
         :return: server_response.content (PDF of the provided view)
         """
-        url = self.server + api_version + "{0}/views/{1}/pdf?orientation={2}&type={3}&vizWidth={4}&vizHeight={5}"\
-            .format(self.site_id, view_id, page_orientation, page_type, width, height)
-            
-        xml_payload_for_request = ET.Element('tsRequest')
-        xml_payload_for_request = ET.tostring(xml_payload_for_request)
-        
-        server_response = self.session.get(url, data=xml_payload_for_request, headers={'x-tableau-auth': self.token})
-        
-        if server_response.status_code != 200:
-            logmsg("ERROR:\nServer Response: {}".format(server_response.text))
-            return None
-            
-        return server_response.content
+        url = self._view_pdf_url(view_id, page_orientation, page_type, width, height, filters)
+
+        return self._cached_export(url, 'view_pdf', self._resolve_id('views', view_id), orientation=page_orientation,
+                                   page_type=page_type, width=width, height=height, filters=filters)
         
         
     # Endpoint 3: Download Workbook PDF
@@ -417,15 +1604,333 @@ class Tableau:
         :param workbook_id, page_orientation, page_type. Latter 2 are set to defaults in directive if not otherwise specified
         :return: server_response.content (PDF of the provided workbook)
         """
-        url = self.server + api_version + "{0}/workbooks/{1}/pdf?orientation={2}&type={3}".format(self.site_id, workbook_id, page_orientation, page_type)
-        
-        xml_payload_for_request = ET.Element('tsRequest')
-        xml_payload_for_request = ET.tostring(xml_payload_for_request)
-        
-        server_response = self.session.get(url, data=xml_payload_for_request, headers={'x-tableau-auth': self.token})
-        
+        url = self._workbook_pdf_url(workbook_id, page_orientation, page_type)
+
+        return self._cached_export(url, 'workbook_pdf', self._resolve_id('workbooks', workbook_id),
+                                   orientation=page_orientation, page_type=page_type)
+
+
+    def _cached_export(self, url, kind, object_id, **options):
+        """
+        Downloads an export, reading it from self.render_cache instead while the workbook it is
+        rendered from is unchanged.
+
+        :param kind, object_id, options: export description, see RenderCache.key
+        :return: content of the export, or None if the request fails
+        """
+        cache = self.render_cache
+        version = None
+        if cache is not None:
+            key = cache.key(kind, object_id, **options)
+            version = cache.version(kind, object_id)
+            content = cache.get(key, version) if version is not None else None
+            if content is not None:
+                return content
+
+        server_response = self._request('GET', url)
+
         if server_response.status_code != 200:
             logmsg("ERROR:\nServer Response: {}".format(server_response.text))
             return None
-        
-        return server_response.content
\ No newline at end of file
+
+        if version is not None:
+            cache.put(key, version, content=server_response.content)
+        return server_response.content
+
+
+    @staticmethod
+    def _view_filters(filters):
+        """
+        Returns the vf_ query parameters of a dictionary of view filters
+        """
+        return '&'.join('vf_{0}={1}'.format(urllib.parse.quote(str(name)), urllib.parse.quote(str(value))) for name, value in (filters or {}).items())
+
+
+    def _view_image_url(self, view_id, filters=None):
+        url = self.server + api_version + "{0}/views/{1}/image".format(self.site_id, self._resolve_id('views', view_id))
+        if filters:
+            url += "?" + self._view_filters(filters)
+        return url
+
+
+    def _view_pdf_url(self, view_id, page_orientation, page_type, width=None, height=None, filters=None):
+        url = self.server + api_version + "{0}/views/{1}/pdf?orientation={2}&type={3}".format(self.site_id, self._resolve_id('views', view_id), page_orientation, page_type)
+        if width is not None:
+            url += "&vizWidth={0}".format(width)
+        if height is not None:
+            url += "&vizHeight={0}".format(height)
+        if filters:
+            url += "&" + self._view_filters(filters)
+        return url
+
+
+    def _workbook_pdf_url(self, workbook_id, page_orientation, page_type):
+        return self.server + api_version + "{0}/workbooks/{1}/pdf?orientation={2}&type={3}".format(self.site_id, self._resolve_id('workbooks', workbook_id), page_orientation, page_type)
+
+
+    def _export_url(self, item):
+        """
+        Builds the export URL of one export_views manifest item.
+        """
+        export_format = item.get('format', 'PNG').upper()
+        page_orientation = item.get('orientation', 'Portrait')
+        page_type = item.get('page_type', 'Letter')
+        if export_format == 'PNG':
+            return self._view_image_url(item['id'], item.get('filters'))
+        elif export_format == 'PDF':
+            return self._view_pdf_url(item['id'], page_orientation, page_type, item.get('width'), item.get('height'), item.get('filters'))
+        elif export_format == 'FULLPDF':
+            return self._workbook_pdf_url(item['id'], page_orientation, page_type)
+        raise ValueError("Unknown export format: {}".format(item.get('format')))
+
+
+    def _export_cache_key(self, item):
+        """
+        Returns (key, version) of one export_views manifest item in self.render_cache, or (None, None)
+        if the item is not cacheable.
+        """
+        export_format = item.get('format', 'PNG').upper()
+        if export_format == 'PNG':
+            kind, object_id, options = 'view_image', self._resolve_id('views', item['id']), {'filters': item.get('filters')}
+        elif export_format == 'PDF':
+            kind, object_id = 'view_pdf', self._resolve_id('views', item['id'])
+            options = {'orientation': item.get('orientation', 'Portrait'), 'page_type': item.get('page_type', 'Letter'),
+                       'width': item.get('width'), 'height': item.get('height'), 'filters': item.get('filters')}
+        elif export_format == 'FULLPDF':
+            kind, object_id = 'workbook_pdf', self._resolve_id('workbooks', item['id'])
+            options = {'orientation': item.get('orientation', 'Portrait'), 'page_type': item.get('page_type', 'Letter')}
+        else:
+            return None, None
+        version = self.render_cache.version(kind, object_id)
+        if version is None:
+            return None, None
+        return self.render_cache.key(kind, object_id, **options), version
+
+
+    def _export_to_file(self, item, chunk_size):
+        """
+        Streams one export_views manifest item to its destination path.
+
+        The download is written to '<path>.part' and renamed once complete, so a failed
+        export never leaves a truncated file at the destination.
+        """
+        path = item['path']
+        result = {'id': item['id'], 'format': item.get('format', 'PNG').upper(), 'path': path,
+                  'status_code': None, 'bytes': 0, 'latency': None, 'error': None, 'cached': False}
+        part_path = path + '.part'
+        start = time.time()
+        key = version = None
+        try:
+            if self.render_cache is not None:
+                key, version = self._export_cache_key(item)
+                cached_path = self.render_cache.get_path(key, version) if key is not None else None
+                if cached_path is not None:
+                    try:
+                        shutil.copyfile(cached_path, part_path)
+                        os.replace(part_path, path)
+                        result.update(status_code=200, bytes=os.path.getsize(path), latency=time.time() - start, cached=True)
+                        logmsg("Exported {} {} to {} from the render cache".format(result['format'], result['id'], path))
+                        return result
+                    except OSError: # evicted by another thread or process in the meantime, render it again
+                        pass
+            url = self._export_url(item)
+            with self._request('GET', url, stream=True) as server_response:
+                result['status_code'] = server_response.status_code
+                if server_response.status_code != 200:
+                    result['error'] = server_response.text
+                else:
+                    with open(part_path, 'wb') as export_file:
+                        for chunk in server_response.iter_content(chunk_size=chunk_size):
+                            export_file.write(chunk)
+                            result['bytes'] += len(chunk)
+                    os.replace(part_path, path)
+                    if key is not None:
+                        self.render_cache.put(key, version, source_path=path)
+        except (requests.exceptions.RequestException, OSError, ValueError) as err:
+            result['error'] = str(err)
+        result['latency'] = time.time() - start
+
+        if result['error'] is not None:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            logmsg("ERROR: Export of {} {} failed:\nServer Response: {}".format(result['format'], result['id'], result['error']))
+        else:
+            logmsg("Exported {} {} to {} ({} bytes in {:.1f}s)".format(result['format'], result['id'], path, result['bytes'], result['latency']))
+        return result
+
+
+    def export_views(self, manifest, max_workers=4, chunk_size=1024 * 1024):
+        """
+        Process: Exports many views/workbooks in parallel, streaming each one straight to disk
+
+        Downloads run on a thread pool that shares this object's session and are written in
+        chunk_size pieces, so memory use does not grow with the size of the exports.
+        With a RenderCache attached as self.render_cache, exports whose workbook is unchanged
+        are copied from the cache instead of being rendered again.
+
+        :param manifest: list of dictionaries with the keys
+                         'id'          view ID (PNG, PDF) or workbook ID (FULLPDF)
+                         'format'      PNG, PDF or FULLPDF (default PNG)
+                         'orientation' Portrait or Landscape (default Portrait, PDF/FULLPDF only)
+                         'page_type'   e.g. Letter, A4 (default Letter, PDF/FULLPDF only)
+                         'width'       optional vizWidth (PDF only)
+                         'height'      optional vizHeight (PDF only)
+                         'filters'     optional dictionary of field name -> value view filters (PNG, PDF)
+                         'path'        destination file
+        :param max_workers: number of exports downloaded at the same time
+        :param chunk_size: bytes read from the response per write
+        :return: results: list of dictionaries with 'id', 'format', 'path', 'status_code', 'bytes',
+                 'latency', 'error' (None on success) and 'cached' (True if copied from self.render_cache),
+                 in manifest order
+        """
+        # The default adapter keeps at most 10 connections per host; keep one per worker instead
+        if max_workers > 10:
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_workers)
+            self.session.mount(self.server, adapter)
+
+        logmsg("Exporting {} items using {} workers".format(len(manifest), max_workers))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(lambda item: self._export_to_file(item, chunk_size), manifest))
+
+        failed = [result for result in results if result['error'] is not None]
+        logmsg("Exported {} of {} items, {} bytes".format(len(results) - len(failed), len(results), sum(result['bytes'] for result in results)))
+        return results
+
+
+class TableauFleet:
+    """
+    Signs in to every Tableau server/site pair we run against and runs the same
+    operation on all of them in parallel.
+
+    A failure on one server never stops the others; it is reported per (server, site).
+    """
+
+    def __init__(self, server_sites=None, max_workers=8, token_cache=False):
+        """
+        Construct a new TableauFleet object.
+
+        :param server_sites: list of (server, site) pairs. Defaults to every site of
+                             Tableau._get_group_server_list() from Tableau._get_server_sites()
+        :param max_workers: number of servers contacted at the same time
+        :param token_cache: passed to each Tableau object
+        """
+        if server_sites is None:
+            sites_by_server = Tableau._get_server_sites()
+            server_sites = [(server, site) for server in Tableau._get_group_server_list() for site in sites_by_server.get(server, [""])]
+        self.server_sites = server_sites
+        self.max_workers = max_workers
+        self.token_cache = token_cache
+        self.tableaus = {} # (server, site) -> signed in Tableau object
+        self.sign_in_errors = {} # (server, site) -> error message
+
+    def _map(self, function, keys):
+        """
+        Calls function(key) for every key in parallel.
+
+        Returns (results, errors) dictionaries keyed by key.
+        """
+        results = {}
+        errors = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(function, key): key for key in keys}
+            for future in concurrent.futures.as_completed(futures):
+                key = futures[future]
+                try:
+                    results[key] = future.result()
+                except Exception as err:
+                    errors[key] = "{0}: {1}".format(type(err).__name__, err)
+        return results, errors
+
+    def _sign_in(self, sign_in):
+        """
+        Signs in to every server/site pair using sign_in(tableau, server, site).
+
+        Returns the number of pairs signed in.
+        """
+        def connect(server_site):
+            tableau = Tableau(token_cache=self.token_cache)
+            if not sign_in(tableau, *server_site):
+                raise RuntimeError("Unable to sign in")
+            return tableau
+
+        self.tableaus, self.sign_in_errors = self._map(connect, self.server_sites)
+        for (server, site), error in sorted(self.sign_in_errors.items()):
+            logmsg("ERROR: Sign in to {0}/{1} failed: {2}".format(server, site, error))
+        logmsg("Signed in to {0} of {1} Tableau server sites".format(len(self.tableaus), len(self.server_sites)))
+        return len(self.tableaus)
+
+    def sign_in(self, name, password):
+        return self._sign_in(lambda tableau, server, site: tableau.sign_in(server, name, password, site))
+
+    def sign_in_site_admin(self):
+        return self._sign_in(lambda tableau, server, site: tableau.sign_in_site_admin(server, site))
+
+    def sign_in_user(self):
+        return self._sign_in(lambda tableau, server, site: tableau.sign_in_user(server, site))
+
+    def sign_out(self):
+        for tableau in self.tableaus.values():
+            tableau.sign_out()
+        self.tableaus = {}
+
+    def run(self, operation, *args, **kwargs):
+        """
+        Process: Runs an operation on every signed in server/site at once
+
+        :param operation: name of a Tableau method, or a function called as operation(tableau, *args, **kwargs)
+        :return: (results, errors): dictionaries keyed by (server, site). errors includes the pairs
+                 that could not be signed in to and those whose operation raised or returned None
+        """
+        def call(server_site):
+            tableau = self.tableaus[server_site]
+            if callable(operation):
+                result = operation(tableau, *args, **kwargs)
+            else:
+                result = getattr(tableau, operation)(*args, **kwargs)
+            if result is None:
+                raise RuntimeError("Operation returned no result, see the log for details")
+            return result
+
+        results, errors = self._map(call, list(self.tableaus))
+        errors.update(self.sign_in_errors)
+        for (server, site), error in sorted(errors.items()):
+            logmsg("ERROR: {0}/{1}: {2}".format(server, site, error))
+        return results, errors
+
+    def find_workbook_by_name(self, workbook_name):
+        """
+        Process: Finds a workbook by name on every server/site
+
+        :return: (results, errors). results only holds the pairs where the workbook exists
+        """
+        results, errors = self.run('find_workbook_by_name', workbook_name)
+        return {server_site: workbooks for server_site, workbooks in results.items() if workbooks}, errors
+
+    def refresh_extracts(self, workbook_names, **kwargs):
+        """
+        Process: Refreshes the named workbooks on every server/site where they exist
+
+        :param workbook_names: list of workbook names
+        :param kwargs: passed to Tableau.refresh_tableau_extracts
+        :return: (results, errors). results maps (server, site) to the refresh_tableau_extracts result
+        """
+        def refresh(tableau):
+            workbook_ids = []
+            for workbook_name in workbook_names:
+                workbooks = tableau.find_workbook_by_name(workbook_name)
+                if workbooks is None:
+                    return None
+                workbook_ids += [workbook['id'] for workbook in workbooks]
+            return tableau.refresh_tableau_extracts(workbook_ids, **kwargs) if workbook_ids else {}
+
+        return self.run(refresh)
+
+    def list_failing_jobs(self, job_filter=None):
+        """
+        Process: Lists the failed background jobs on every server/site
+
+        :param job_filter: additional query_jobs filter, e.g. 'jobType:eq:refresh_extracts'
+        :return: (results, errors). results maps (server, site) to a query_jobs dictionary
+        """
+        job_filter = 'status:eq:Failed' + (',' + job_filter if job_filter else '')
+        return self.run('query_jobs', filter=job_filter)
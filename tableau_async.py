@@ -0,0 +1,359 @@
+#!/bin/env python3
+
+import asyncio
+# Contains methods used to build and parse XML
+import xml.etree.ElementTree as ET
+import aiohttp  # Contains methods used to make asynchronous HTTP requests
+import re
+import time
+
+from cs_logging import logmsg
+from tableau import Tableau, FixedPolling, api_version, TABLEAU_XMLNS
+from tableau_models import Site, EMPTY_TS_REQUEST
+
+
+class AsyncTableau:
+    """
+    asyncio counterpart of the Tableau class.
+
+    Exposes the same methods as Tableau, but as coroutines on top of an aiohttp session
+    with a bounded connection pool, so one process can keep hundreds of job polls and
+    exports in flight without a thread per call. The XML parsing is shared with Tableau.
+
+    There is no __del__ sign out; use "async with AsyncTableau() as tableau:" or await close().
+    """
+
+    def __init__(self, max_connections=100):
+        """
+        Construct a new AsyncTableau object.
+
+        :param max_connections: maximum number of simultaneous connections to the server
+        """
+        self.xmlns = TABLEAU_XMLNS
+        self.server = ''
+        self.server_name = None
+        self.token = None
+        self.user = ''
+        self.passwd = ''
+        self.site_id = ''
+        self.site_name = None
+        self.my_user_id = ''
+        self.site_content_url = None
+        self.max_connections = max_connections
+        self.session = None # created on first request, inside the running event loop
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """
+        Sign out of Tableau and release the connection pool.
+        """
+        if self.token is not None:
+            await self.sign_out()
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+    async def _request(self, method, url, **kwargs):
+        """
+        Makes a request on the pooled session.
+
+        Returns the status code and the response body as bytes.
+        """
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, ssl=False)
+            self.session = aiohttp.ClientSession(connector=connector)
+        async with self.session.request(method, url, **kwargs) as server_response:
+            content = await server_response.read()
+            return server_response.status, content
+
+
+    def _handle_error(self, text):
+        """
+        Parses an error response for the error subcode and detail message
+        and then displays them.
+
+        Returns the error code and error message.
+        """
+        error_code, error_detail = Tableau._parse_error(text)
+        logmsg("ERROR: {0}: {1}".format(error_code, error_detail))
+        return error_code, error_detail
+
+
+    async def sign_in_user(self, server, site=""):
+        username, win_pass = Tableau._get_user_credentials()
+        if username is None:
+            return
+        return await self.sign_in(server, username, win_pass, site)
+
+
+    async def sign_in_site_admin(self, server, site=""):
+        username, win_pass = Tableau._get_site_admin_credentials(server)
+        return await self.sign_in(server, username, win_pass, site)
+
+
+    async def sign_in(self, server, name, password, site=""):
+        """
+        Signs in to the server specified server variable.
+
+        See Tableau.sign_in for the meaning of the arguments.
+
+        Returns True if the sign in succeeded, otherwise False.
+        """
+        self.server = server
+        self.server_name = re.sub('^https?://', '', server)
+        self.server_name = re.sub('/.*$', '', self.server_name)
+        url = server + '/'.join(api_version.split('/')[:3]) + "/auth/signin"
+        logmsg("Logging in to server: {0}".format(server))
+
+        # Builds the request
+        xml_payload_for_request = ET.Element('tsRequest')
+        credentials_element = ET.SubElement(xml_payload_for_request, 'credentials', name=name, password=password)
+        site_element = ET.SubElement(credentials_element, 'site', contentUrl=site)
+        xml_payload_for_request = ET.tostring(xml_payload_for_request)
+
+        # Makes the request to Tableau Server
+        logmsg("Connecting to Tableau server {0}/{1} as {2}".format(server, site, name))
+        try:
+            status_code, content = await self._request('POST', url, data=xml_payload_for_request)
+        except aiohttp.ClientSSLError as err:
+            logmsg("ERROR: SSLError: {0}".format(err))
+            return False
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            logmsg("ERROR: Unexpected error connecting to Tableau: {0}".format(err))
+            return False
+
+        text = content.decode('utf-8')
+        if status_code != 200:
+            if 400 <= status_code < 500:
+                self._handle_error(text)
+                return False
+            logmsg("ERROR: " + text)
+            return False
+
+        # Reads and parses the response to get the token and site ID
+        credentials = Tableau._parse_credentials(text)
+        self.token, self.site_id, self.site_content_url, self.user_id = \
+            credentials.token, credentials.site_id, credentials.site_content_url, credentials.user_id
+
+        # Query the site and get more details such as the name and site URL
+        site_data = await self.query_site(self.site_id)
+        if site_data is not None:
+            self.site_name = site_data.name
+
+        if self.site_name is not None:
+            logmsg("  Site Name: " + self.site_name)
+        return True
+
+
+    async def query_site(self, site_id):
+        """
+        Process: Returns information about the specified site
+
+        :param site_id: ID of the site
+        :return: Site, or None if the request fails
+        """
+        url = self.server + api_version + "{0}".format(site_id)
+
+        status_code, content = await self._request('GET', url, headers={'x-tableau-auth': self.token})
+
+        if status_code != 200:
+            logmsg("ERROR:\nServer Response: {}".format(content.decode('utf-8')))
+            return None
+
+        return Site.from_response(content)
+
+
+    async def sign_out(self):
+        """
+        Destroys the active session
+        """
+        if self.token is not None:
+            logmsg("Disconnecting from Tableau server " + self.server)
+            url = self.server + '/'.join(api_version.split('/')[:3]) + "/auth/signout"
+            try:
+                await self._request('POST', url, headers={'x-tableau-auth': self.token})
+            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                logmsg("ERROR: Failed to sign out: " + str(err))
+            self.token = None
+        return
+
+
+    async def _submit_refresh(self, workbook_id):
+        """
+        Process: Sends a single refresh request for a workbook extract
+
+        :param workbook_id: ID of workbook
+        :return: (status_code, text, job_id). job_id is None unless the server accepted the refresh (202)
+        """
+        url = self.server + api_version + "{0}/workbooks/{1}/refresh".format(self.site_id, workbook_id)
+
+        status_code, content = await self._request('POST', url, data=EMPTY_TS_REQUEST, headers={'x-tableau-auth': self.token})
+        text = content.decode('utf-8')
+        if status_code != 202:
+            return status_code, text, None
+        return status_code, text, Tableau._parse_job_id(text)
+
+
+    async def refresh_tableau_extract(self, workbook_id, max_retries=10, max_checks=600, polling=None):
+        """
+        Process: Refreshes an extract
+
+        :param workbook_id: ID of workbook
+        :param max_retries: number of 403/409 responses tolerated before giving up
+        :param max_checks: maximum number of status checks
+        :param polling: PollingStrategy deciding the wait between status checks and retries (default FixedPolling(), as Tableau.refresh_tableau_extract)
+        :return: refresh_job_response: dictionary of response attributes
+        """
+        polling = polling or FixedPolling()
+        logmsg("Initiating refresh for workbook_id: {}".format(workbook_id))
+
+        # Loop while process is awaiting completion of existing extract
+        i = 0
+        while True:
+            if i == max_retries:
+                logmsg("ERROR: max_retries of {} reached for workbook_id: {}".format(max_retries, workbook_id))
+                return None
+            status_code, text, job_id = await self._submit_refresh(workbook_id)
+            if status_code == 202:
+                break
+            elif status_code in [403, 409]: # Existing extract already in progress
+                logmsg("Refresh already in process for workbook_id: {}. Retrying refresh up to {} times".format(workbook_id, max_retries))
+                await asyncio.sleep(polling.retry_delay(i))
+                i += 1
+            else:
+                logmsg("ERROR:\nServer Response: {}".format(text))
+                return None
+
+        submitted = time.time()
+        refresh_job_response = None
+        # Use refresh_job_response to check whether job is complete
+        for i in range(1, max_checks + 1):
+            await asyncio.sleep(polling.next_delay(refresh_job_response, i - 1, time.time() - submitted))
+            refresh_job_response = await self.query_job(job_id)
+            if not refresh_job_response:
+                logmsg("ERROR: Unable to retrieve refresh job status for workbook id '{}'. Exiting...".format(workbook_id))
+                return None
+            progress = refresh_job_response['progress']
+            job_status = Tableau._job_status(refresh_job_response['finish_code'])
+
+            logmsg("Workbook {}: Current progress: {}%, Job status: {}, Status check: {} of {}".format(workbook_id, progress if progress != None else 0, job_status, i, max_checks))
+            if refresh_job_response['finish_code'] is not None: # successful := 0
+                return refresh_job_response
+            if polling.expired(time.time() - submitted):
+                logmsg("ERROR: Polling deadline of {}s reached for workbook id '{}'. Exiting...".format(polling.deadline, workbook_id))
+                return None
+
+        logmsg("ERROR: max_checks of {} reached for workbook_id: {}".format(max_checks, workbook_id))
+        return None
+
+
+    async def refresh_tableau_extracts(self, workbook_ids, max_concurrent=5, **kwargs):
+        """
+        Process: Refreshes the extracts of several workbooks at once
+
+        :param workbook_ids: list of workbook IDs
+        :param max_concurrent: maximum number of refresh jobs running at the same time
+        :param kwargs: passed to refresh_tableau_extract
+        :return: results: dictionary of workbook_id -> query_job response (None if the refresh failed)
+        """
+        workbook_ids = list(dict.fromkeys(workbook_ids))
+        semaphore = asyncio.Semaphore(max_concurrent)
+
+        async def refresh(workbook_id):
+            async with semaphore:
+                return await self.refresh_tableau_extract(workbook_id, **kwargs)
+
+        responses = await asyncio.gather(*(refresh(workbook_id) for workbook_id in workbook_ids))
+        return dict(zip(workbook_ids, responses))
+
+
+    async def query_job(self, job_id):
+        """
+        Process: Returns status information about an asynchronous process that is tracked using a job
+
+        :param job_id: ID of a job
+        :return: response_data: dictionary of response attributes
+        """
+        # URI Format for Query Job: /api/api-version/sites/site-id/jobs/job-id
+        url = self.server + api_version + "{0}/jobs/{1}".format(self.site_id, job_id)
+
+        status_code, content = await self._request('GET', url, headers={'x-tableau-auth': self.token})
+
+        # Fail out if server_response is something other than 200
+        if status_code != 200:
+            return None
+
+        return Tableau._parse_job(content)
+
+
+    async def cancel_job(self, job_id):
+        """
+        Process: Cancels a job if it exists
+
+        :param job_id: ID of a job
+        """
+        # URI Format for Query Job: /api/api-version/sites/site-id/jobs/job-id
+        url = self.server + api_version + "{0}/jobs/{1}".format(self.site_id, job_id)
+
+        status_code, content = await self._request('PUT', url, data=EMPTY_TS_REQUEST, headers={'x-tableau-auth': self.token})
+
+        logmsg(str(status_code))
+        logmsg(content.decode('utf-8'))
+
+        return
+
+
+    async def _export(self, url):
+        """
+        Downloads an exported view or workbook.
+
+        Returns the response content, or None if the request fails.
+        """
+        status_code, content = await self._request('GET', url, headers={'x-tableau-auth': self.token})
+
+        if status_code != 200:
+            logmsg("ERROR:\nServer Response: {}".format(content.decode('utf-8', 'replace')))
+            return None
+
+        return content
+
+
+    async def query_view_image(self, view_id):
+        """
+        Process: Extracts Tableau view to PNG
+
+        :param view_id
+        :return: PNG image of the provided view
+        """
+        url = self.server + api_version + "{0}/views/{1}/image".format(self.site_id, view_id)
+        logmsg("URI " + url)
+        return await self._export(url)
+
+
+    async def query_view_pdf(self, view_id, page_orientation, page_type, width, height):
+        """
+        Process: Extracts Tableau view to PDF
+
+        :param view_id, page_orientation, page_type, width, height
+        :return: PDF of the provided view
+        """
+        url = self.server + api_version + "{0}/views/{1}/pdf?orientation={2}&type={3}&vizWidth={4}&vizHeight={5}"\
+            .format(self.site_id, view_id, page_orientation, page_type, width, height)
+        return await self._export(url)
+
+
+    async def download_workbook_pdf(self, workbook_id, page_orientation, page_type):
+        """
+        Process: Extracts Tableau view to fullpdf
+
+        :param workbook_id, page_orientation, page_type
+        :return: PDF of the provided workbook
+        """
+        url = self.server + api_version + "{0}/workbooks/{1}/pdf?orientation={2}&type={3}".format(self.site_id, workbook_id, page_orientation, page_type)
+        return await self._export(url)
@@ -0,0 +1,198 @@
+#!/bin/env python3
+
+"""
+End-to-end performance benchmark of tableau.py against the local Tableau stand-in server.
+
+Every scenario runs in a fresh process against a fresh tableau_mock_server, and reports its
+wall time, the number of requests the server answered, the time the client spent sleeping in
+retry and polling loops, and the peak RSS of the client process:
+
+    sign_in         sign in and out --iterations times
+    refresh_single  refresh one workbook extract
+    refresh_batch   refresh every workbook with refresh_tableau_extracts
+    refresh_webhook refresh every workbook with refresh_tableau_extracts, completed by webhook
+                    events (polling only as the WEBHOOK_FALLBACK_INTERVAL fallback)
+    export_png      export every view as PNG with export_views
+    export_pdf      export every view as PDF with export_views
+    export_cached   export every view as PDF again through a warm RenderCache (the first,
+                    cache filling pass is not measured)
+
+    python tableau_benchmark.py --workbooks 20 --refresh-seconds 2 --poll-interval 0.5 --json results.json
+
+With --baseline, the run fails (exit code 1) when a scenario takes longer, makes more requests
+or uses more memory than the baseline results allow.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import requests  # Contains methods used to make HTTP requests
+
+# tableau.py reads the API version from the environment when it is imported
+os.environ.setdefault('CS_TABLEAU_API_VER', '/api/3.4/sites/')
+
+from tableau_mock_server import start_server
+
+SCENARIOS = ('sign_in', 'refresh_single', 'refresh_batch', 'refresh_webhook', 'export_png', 'export_pdf', 'export_cached')
+
+
+def run_scenario(scenario, server_url, workbook_ids, view_ids, args):
+    """
+    Runs one scenario with a new Tableau client. Called in a child process.
+
+    :return: dictionary of wall, requests, endpoints, sleep_seconds, peak_rss_kb and ok
+    """
+    import tableau
+    from tableau_webhooks import WebhookReceiver
+    from tableau_render_cache import RenderCache
+
+    def reset_stats():
+        requests.post(server_url + '/_stats/reset')
+
+    polling = tableau.FixedPolling(interval=args['poll_interval'], retry_interval=args['poll_interval'])
+    client = tableau.Tableau()
+    if scenario == 'sign_in':
+        reset_stats()
+        start = time.perf_counter()
+        ok = True
+        for i in range(args['iterations']):
+            ok = client.sign_in(server_url, 'benchmark', 'benchmark') and ok
+            client.sign_out()
+        wall = time.perf_counter() - start
+    else:
+        client.sign_in(server_url, 'benchmark', 'benchmark')
+        reset_stats()
+        start = time.perf_counter()
+        if scenario == 'refresh_single':
+            result = client.refresh_tableau_extract(workbook_ids[0], polling=polling)
+            ok = result is not None and result['finish_code'] == '0'
+        elif scenario == 'refresh_batch':
+            results = client.refresh_tableau_extracts(workbook_ids, max_concurrent=args['concurrency'], polling=polling)
+            ok = all(result is not None and result['finish_code'] == '0' for result in results.values())
+        elif scenario == 'refresh_webhook':
+            with WebhookReceiver(host='127.0.0.1') as receiver:
+                ok = receiver.register(client)
+                results = client.refresh_tableau_extracts(workbook_ids, max_concurrent=args['concurrency'], receiver=receiver)
+            ok = ok and all(result is not None and result['finish_code'] == '0' for result in results.values())
+        else:
+            export_format = 'PNG' if scenario == 'export_png' else 'PDF'
+            with tempfile.TemporaryDirectory() as export_dir:
+                manifest = [{'id': view_id, 'format': export_format, 'path': os.path.join(export_dir, '{0}.{1}'.format(view_id, export_format.lower()))}
+                            for view_id in view_ids]
+                if scenario == 'export_cached':
+                    client.render_cache = RenderCache(client, directory=os.path.join(export_dir, 'cache'))
+                    client.export_views(manifest, max_workers=args['concurrency'])
+                    reset_stats()
+                    start = time.perf_counter()
+                results = client.export_views(manifest, max_workers=args['concurrency'])
+                if client.render_cache is not None:
+                    client.render_cache.close()
+            ok = all(result['error'] is None for result in results)
+        wall = time.perf_counter() - start
+    endpoints = requests.get(server_url + '/_stats').json()
+    client.sign_out()
+
+    return {
+        'wall': wall,
+        'requests': sum(endpoints.values()),
+        'endpoints': endpoints,
+        'sleep_seconds': client.metrics.summary()['sleep_seconds'],
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'ok': ok,
+    }
+
+
+def _child(queue, *args):
+    queue.put(run_scenario(*args))
+
+
+def benchmark(scenario, args):
+    """
+    Starts a mock server sized by args and runs the scenario in a fresh process.
+    """
+    server = start_server(workbooks=args['workbooks'], views_per_workbook=args['views_per_workbook'],
+                          refresh_seconds=args['refresh_seconds'], conflicts=args['conflicts'], latency=args['latency'],
+                          image_size=args['image_size'], pdf_size=args['pdf_size'])
+    try:
+        server_url = 'http://127.0.0.1:{0}'.format(server.server_port)
+        context = multiprocessing.get_context('spawn')
+        queue = context.Queue()
+        process = context.Process(target=_child, args=(queue, scenario, server_url, list(server.mock.workbooks),
+                                                        list(server.mock.views), args))
+        process.start()
+        result = queue.get()
+        process.join()
+        return result
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def find_regressions(results, baseline, tolerance):
+    """
+    Compares results with baseline results of the same layout.
+
+    :param tolerance: allowed ratio over the baseline, e.g. 1.5 for 50% worse
+    :return: list of messages, one per regression
+    """
+    regressions = []
+    for scenario, result in results.items():
+        expected = baseline.get(scenario)
+        if not expected:
+            continue
+        for metric in ('wall', 'requests', 'peak_rss_kb'):
+            if result[metric] > expected[metric] * tolerance:
+                regressions.append('{0}: {1} {2:.6g} exceeds baseline {3:.6g} x {4}'.format(
+                    scenario, metric, result[metric], expected[metric], tolerance))
+        if expected.get('ok') and not result['ok']:
+            regressions.append('{0}: failed'.format(scenario))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark tableau.py against a local Tableau stand-in')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma separated scenarios')
+    parser.add_argument('--workbooks', type=int, default=20, help='number of workbooks (batch refresh size)')
+    parser.add_argument('--views-per-workbook', type=int, default=5, help='views per workbook (the exports cover every view)')
+    parser.add_argument('--refresh-seconds', type=float, default=2.0, help='seconds a mock extract refresh runs')
+    parser.add_argument('--conflicts', type=int, default=0, help='409 responses per workbook before a refresh is accepted')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every mock response')
+    parser.add_argument('--image-size', type=int, default=100 * 1024, help='bytes of a view image')
+    parser.add_argument('--pdf-size', type=int, default=1024 * 1024, help='bytes of a PDF export')
+    parser.add_argument('--poll-interval', type=float, default=0.5, help='seconds between job status checks and refresh retries')
+    parser.add_argument('--concurrency', type=int, default=5, help='concurrent refreshes and export workers')
+    parser.add_argument('--iterations', type=int, default=20, help='sign in and out cycles of the sign_in scenario')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='results file of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='allowed ratio over the baseline')
+    args = parser.parse_args()
+    settings = {name: value for name, value in vars(args).items() if name not in ('scenarios', 'json', 'baseline', 'tolerance')}
+
+    results = {}
+    print('{0:<16} {1:>10} {2:>10} {3:>10} {4:>12} {5:>4}'.format('scenario', 'wall s', 'requests', 'sleep s', 'peak RSS KB', 'ok'))
+    for scenario in args.scenarios.split(','):
+        result = results[scenario] = benchmark(scenario, settings)
+        print('{0:<16} {1:>10.3f} {2:>10} {3:>10.3f} {4:>12} {5:>4}'.format(
+            scenario, result['wall'], result['requests'], result['sleep_seconds'], result['peak_rss_kb'], 'yes' if result['ok'] else 'NO'))
+
+    if args.json:
+        with open(args.json, 'w') as output_file:
+            json.dump({'settings': settings, 'results': results}, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file)['results'], args.tolerance)
+        for regression in regressions:
+            print('REGRESSION: ' + regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
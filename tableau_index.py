@@ -0,0 +1,175 @@
+#!/bin/env python3
+
+import os
+import sqlite3
+import threading
+import time
+
+import requests  # Contains methods used to make HTTP requests
+
+from cs_logging import logmsg
+
+
+class TableauIndex:
+    """
+    Local SQLite index of the workbooks, views, datasources and projects of a Tableau site.
+
+    Resolves names to IDs without a REST call. Each sync only fetches the objects updated
+    since the previous one, so keeping the index current costs a few small list requests.
+    Rows are keyed by server and site, so one index file can hold several sites.
+
+    Attach it to a Tableau object (tableau.index = TableauIndex(tableau)) and the Tableau
+    methods that take a workbook_id or view_id also accept the workbook or view name.
+    """
+
+    # object type -> Tableau list method
+    OBJECT_TYPES = {
+        'projects': 'iter_projects',
+        'workbooks': 'iter_workbooks',
+        'views': 'iter_views',
+        'datasources': 'iter_datasources',
+    }
+
+    def __init__(self, tableau, path=None):
+        """
+        Construct a new TableauIndex object.
+
+        :param tableau: signed in Tableau object used to sync the index
+        :param path: SQLite file of the index (default ~/.tableau_index.sqlite)
+        """
+        self.tableau = tableau
+        self.path = path or os.path.join(os.path.expanduser('~'), '.tableau_index.sqlite')
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS objects (
+                server TEXT, site_id TEXT, object_type TEXT, id TEXT, name TEXT, content_url TEXT,
+                project_id TEXT, project_name TEXT, workbook_id TEXT, updated_at TEXT,
+                PRIMARY KEY (server, site_id, object_type, id));
+            CREATE INDEX IF NOT EXISTS objects_name ON objects (server, site_id, object_type, name COLLATE NOCASE);
+            CREATE TABLE IF NOT EXISTS tags (
+                server TEXT, site_id TEXT, object_type TEXT, id TEXT, tag TEXT,
+                PRIMARY KEY (server, site_id, object_type, id, tag));
+            CREATE INDEX IF NOT EXISTS tags_tag ON tags (server, site_id, object_type, tag COLLATE NOCASE);
+            CREATE TABLE IF NOT EXISTS sync_state (
+                server TEXT, site_id TEXT, object_type TEXT, last_updated_at TEXT, synced_at REAL,
+                PRIMARY KEY (server, site_id, object_type));
+        """)
+
+    def close(self):
+        self.connection.close()
+
+    def _site_key(self):
+        return self.tableau.server, self.tableau.site_id
+
+    def sync(self, full=False, page_size=1000):
+        """
+        Process: Brings the index up to date with the site
+
+        An incremental sync only requests objects whose updatedAt is at or after the newest
+        stamp seen by the previous sync. Deleted objects are only removed by a full sync.
+        Every object type is synced on its own, so a type that cannot be listed leaves its
+        rows as they were and the other types are still brought up to date.
+
+        :param full: refetch every object and drop the ones no longer on the site
+        :param page_size: number of objects requested per page
+        :return: dictionary of object type -> number of objects fetched, or None for the types that failed
+        """
+        server, site_id = self._site_key()
+        counts = {}
+        for object_type, list_method in self.OBJECT_TYPES.items():
+            with self._lock:
+                row = self.connection.execute("SELECT last_updated_at FROM sync_state WHERE server = ? AND site_id = ? AND object_type = ?",
+                                              (server, site_id, object_type)).fetchone()
+            last_updated_at = row[0] if row and not full else None
+            updated_filter = 'updatedAt:gte:{0}'.format(last_updated_at) if last_updated_at else None
+
+            start = time.time()
+            rows = []
+            tags = []
+            try:
+                for item in getattr(self.tableau, list_method)(filter=updated_filter, page_size=page_size):
+                    rows.append(self._row(server, site_id, object_type, item))
+                    tags += [(server, site_id, object_type, item['id'], tag['label']) for tag in item.get('tags', []) if tag.get('label')]
+            except requests.exceptions.RequestException as err:
+                logmsg("ERROR: Unable to sync {0} into the Tableau index: {1}".format(object_type, err))
+                counts[object_type] = None
+                continue
+
+            newest = max([row[9] for row in rows if row[9]] + ([last_updated_at] if last_updated_at else []), default=None)
+            with self._lock, self.connection:
+                if full:
+                    self.connection.execute("DELETE FROM objects WHERE server = ? AND site_id = ? AND object_type = ?", (server, site_id, object_type))
+                    self.connection.execute("DELETE FROM tags WHERE server = ? AND site_id = ? AND object_type = ?", (server, site_id, object_type))
+                else:
+                    self.connection.executemany("DELETE FROM tags WHERE server = ? AND site_id = ? AND object_type = ? AND id = ?",
+                                                [row[:4] for row in rows])
+                self.connection.executemany("INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self.connection.executemany("INSERT OR REPLACE INTO tags VALUES (?, ?, ?, ?, ?)", tags)
+                self.connection.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?, ?)", (server, site_id, object_type, newest, time.time()))
+            counts[object_type] = len(rows)
+            logmsg("Indexed {0} {1} in {2:.1f}s".format(len(rows), object_type, time.time() - start))
+        return counts
+
+    @staticmethod
+    def _row(server, site_id, object_type, item):
+        project = item.get('project', {})
+        workbook = item.get('workbook', {})
+        return (server, site_id, object_type, item['id'], item.get('name'), item.get('contentUrl'),
+                project.get('id'), project.get('name'), workbook.get('id'), item.get('updatedAt'))
+
+    def find(self, object_type, name=None, project=None, tag=None, workbook=None):
+        """
+        Process: Looks up indexed objects. All matches are case-insensitive
+
+        :param object_type: 'workbooks', 'views', 'datasources' or 'projects'
+        :param name: object name
+        :param project: project name
+        :param tag: tag label
+        :param workbook: workbook name (views only)
+        :return: list of dictionaries with id, name, content_url, project_id, project_name, workbook_id and updated_at
+        """
+        server, site_id = self._site_key()
+        sql = "SELECT o.id, o.name, o.content_url, o.project_id, o.project_name, o.workbook_id, o.updated_at FROM objects o"
+        where = ["o.server = ?", "o.site_id = ?", "o.object_type = ?"]
+        args = [server, site_id, object_type]
+        if name is not None:
+            where.append("o.name = ? COLLATE NOCASE")
+            args.append(name)
+        if project is not None:
+            # View list items only carry the project ID, so also match through the indexed projects
+            where.append("(o.project_name = ? COLLATE NOCASE OR o.project_id IN (SELECT p.id FROM objects p WHERE p.server = o.server"
+                         " AND p.site_id = o.site_id AND p.object_type = 'projects' AND p.name = ? COLLATE NOCASE))")
+            args += [project, project]
+        if tag is not None:
+            sql += " JOIN tags t ON t.server = o.server AND t.site_id = o.site_id AND t.object_type = o.object_type AND t.id = o.id"
+            where.append("t.tag = ? COLLATE NOCASE")
+            args.append(tag)
+        if workbook is not None:
+            sql += " JOIN objects w ON w.server = o.server AND w.site_id = o.site_id AND w.object_type = 'workbooks' AND w.id = o.workbook_id"
+            where.append("w.name = ? COLLATE NOCASE")
+            args.append(workbook)
+
+        with self._lock:
+            rows = self.connection.execute(sql + " WHERE " + " AND ".join(where), args).fetchall()
+        columns = ('id', 'name', 'content_url', 'project_id', 'project_name', 'workbook_id', 'updated_at')
+        return [dict(zip(columns, row)) for row in rows]
+
+    def _find_one(self, object_type, name, **kwargs):
+        matches = self.find(object_type, name=name, **kwargs)
+        if len(matches) > 1:
+            logmsg("ERROR: The name {0} matches {1} {2}, please specify a project or workbook".format(name, len(matches), object_type))
+            return None
+        return matches[0]['id'] if matches else None
+
+    def workbook_id(self, name, project=None):
+        return self._find_one('workbooks', name, project=project)
+
+    def view_id(self, name, workbook=None, project=None):
+        return self._find_one('views', name, workbook=workbook, project=project)
+
+    def datasource_id(self, name, project=None):
+        return self._find_one('datasources', name, project=project)
+
+    def project_id(self, name):
+        return self._find_one('projects', name)
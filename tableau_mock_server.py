@@ -0,0 +1,485 @@
+#!/bin/env python3
+
+"""
+Local stand-in for the Tableau Server REST API endpoints used by tableau.py.
+
+Serves one site with a generated set of workbooks and views and optional injected latency,
+so that tableau.py can be tested and benchmarked without a Tableau Server:
+
+    auth/signin, auth/signout, sites/{id},
+    workbooks, views, projects and datasources lists (honouring updatedAt:gte filters, so
+    tableau_index can sync against it), workbooks/{id}/refresh (409 while a refresh runs, or for the
+    first N submissions of every workbook), jobs/{id} with progress that advances with time,
+    the jobs list, job cancellation, views/{id}/image, views/{id}/pdf and workbooks/{id}/pdf
+    with configurable payload sizes, workbooks/{id} and views/{id}, and webhooks: the
+    WorkbookRefreshSucceeded webhooks created on the site are posted to when a refresh job
+    completes. The Metadata API (/api/metadata/graphql) answers the workbooks query with the
+    updatedAt and extract refresh time of a workbook.
+
+GET /_stats returns the number of requests served per endpoint and POST /_stats/reset clears them.
+
+    python tableau_mock_server.py --workbooks 50 --refresh-seconds 5 --latency 0.02 --port 8080
+"""
+
+import argparse
+import collections
+import json
+import re
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import quoteattr
+
+from tableau_webhooks import send_event, REFRESH_SUCCEEDED
+
+TS_RESPONSE = '<?xml version="1.0" encoding="UTF-8"?><tsResponse xmlns="http://tableau.com/api" ' \
+              'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" ' \
+              'xsi:schemaLocation="http://tableau.com/api http://tableau.com/api/ts-api-3.4.xsd">{0}</tsResponse>'
+
+# Payloads start with the real file signatures so clients sniffing the type are satisfied
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PDF_SIGNATURE = b'%PDF-1.4\n'
+
+WRITE_SIZE = 64 * 1024
+
+
+def _timestamp(seconds):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(seconds))
+
+
+def _attributes(**attributes):
+    return ' '.join('{0}={1}'.format(name, quoteattr(str(value))) for name, value in attributes.items() if value is not None)
+
+
+class MockTableau:
+    """
+    Content, jobs and request counters of the stand-in server.
+    """
+
+    def __init__(self, workbooks=10, views_per_workbook=5, refresh_seconds=2.0, conflicts=0, latency=0.0,
+                 image_size=100 * 1024, pdf_size=1024 * 1024, datasources=2):
+        """
+        Construct a new MockTableau object.
+
+        :param workbooks: number of workbooks on the site
+        :param views_per_workbook: number of views of every workbook
+        :param refresh_seconds: seconds an extract refresh job runs
+        :param conflicts: number of 409 responses every workbook returns before accepting a refresh
+        :param latency: seconds added to every response
+        :param image_size: bytes of a view image export
+        :param pdf_size: bytes of a view or workbook PDF export
+        :param datasources: number of published data sources on the site
+        """
+        self.refresh_seconds = refresh_seconds
+        self.conflicts = conflicts
+        self.latency = latency
+        self.image_size = image_size
+        self.pdf_size = pdf_size
+        self.lock = threading.Lock()
+        self.stats = collections.Counter()
+        self.tokens = set()
+        self.site = {'id': str(uuid.uuid4()), 'name': 'Default', 'contentUrl': ''}
+        self.project = {'id': str(uuid.uuid4()), 'name': 'Benchmarks'}
+        self.created = time.time()
+        created = _timestamp(self.created)
+        self.workbooks = collections.OrderedDict()
+        self.views = collections.OrderedDict()
+        for i in range(1, workbooks + 1):
+            workbook_id = str(uuid.uuid4())
+            self.workbooks[workbook_id] = {'id': workbook_id, 'name': 'Workbook {0}'.format(i), 'contentUrl': 'Workbook{0}'.format(i),
+                                           'createdAt': created, 'updatedAt': created}
+            for j in range(1, views_per_workbook + 1):
+                view_id = str(uuid.uuid4())
+                self.views[view_id] = {'id': view_id, 'name': 'View {0}'.format(j), 'contentUrl': 'Workbook{0}/sheets/View{1}'.format(i, j),
+                                       'workbook_id': workbook_id}
+        self.datasources = collections.OrderedDict()
+        for i in range(1, datasources + 1):
+            datasource_id = str(uuid.uuid4())
+            self.datasources[datasource_id] = {'id': datasource_id, 'name': 'Datasource {0}'.format(i), 'contentUrl': 'Datasource{0}'.format(i),
+                                               'type': 'hyper', 'createdAt': created, 'updatedAt': created}
+        self.jobs = collections.OrderedDict()
+        self.refresh_attempts = collections.Counter()
+        self.webhooks = collections.OrderedDict()
+
+    def count(self, endpoint):
+        with self.lock:
+            self.stats[endpoint] += 1
+
+    def job_state(self, job):
+        """
+        Returns (progress, finish_code, completed_at) of a job at the current time.
+        """
+        if job['cancelled_at'] is not None:
+            return job['progress'], 2, job['cancelled_at']
+        elapsed = time.time() - job['created']
+        if elapsed >= job['duration']:
+            return 100, 0, job['created'] + job['duration']
+        return int(100 * elapsed / job['duration']), None, None
+
+    def running_job(self, workbook_id):
+        for job in self.jobs.values():
+            if job['workbook_id'] == workbook_id and self.job_state(job)[1] is None:
+                return job
+        return None
+
+    def submit_refresh(self, workbook_id):
+        """
+        :return: the new job, or None if the refresh is rejected with a 409
+        """
+        with self.lock:
+            self.refresh_attempts[workbook_id] += 1
+            if self.refresh_attempts[workbook_id] <= self.conflicts or self.running_job(workbook_id) is not None:
+                return None
+            job = {'id': str(uuid.uuid4()), 'workbook_id': workbook_id, 'created': time.time(),
+                   'duration': self.refresh_seconds, 'cancelled_at': None, 'progress': 0}
+            self.jobs[job['id']] = job
+        timer = threading.Timer(job['duration'], self.complete, (job,))
+        timer.daemon = True
+        timer.start()
+        return job
+
+    def complete(self, job):
+        """
+        Posts the refresh succeeded event of a job to the webhooks of that event, unless it was cancelled.
+        """
+        with self.lock:
+            if job['cancelled_at'] is not None:
+                return
+            urls = [webhook['url'] for webhook in self.webhooks.values() if webhook['event'] == REFRESH_SUCCEEDED]
+        workbook = self.workbooks[job['workbook_id']]
+        for url in urls:
+            try:
+                send_event(url, REFRESH_SUCCEEDED, workbook['id'], workbook['name'], self.site['id'])
+            except Exception:
+                pass # Tableau drops events it cannot deliver
+
+    def extract_refreshed_at(self, workbook_id):
+        """
+        Returns the completion time of the latest successful refresh of a workbook. Every workbook
+        is published with an extract taken when the site was generated.
+        """
+        completed = [state[2] for state in (self.job_state(job) for job in self.jobs.values() if job['workbook_id'] == workbook_id) if state[1] == 0]
+        return max(completed, default=self.created)
+
+    def job_xml(self, job):
+        progress, finish_code, completed_at = self.job_state(job)
+        workbook = self.workbooks[job['workbook_id']]
+        return '<job {0}><extractRefreshJob><workbook {1}/></extractRefreshJob></job>'.format(
+            _attributes(id=job['id'], mode='Asynchronous', type='RefreshExtract', progress=progress,
+                        createdAt=_timestamp(job['created']), updatedAt=_timestamp(time.time()),
+                        completedAt=_timestamp(completed_at) if completed_at else None, finishCode=finish_code),
+            _attributes(id=workbook['id'], name=workbook['name']))
+
+    def background_job_xml(self, job):
+        progress, finish_code, completed_at = self.job_state(job)
+        status = {None: 'InProgress', 0: 'Success', 1: 'Failed', 2: 'Cancelled'}[finish_code]
+        return '<backgroundJob {0}/>'.format(_attributes(
+            id=job['id'], status=status, jobType='refresh_extracts', priority=50, createdAt=_timestamp(job['created']),
+            startedAt=_timestamp(job['created']), endedAt=_timestamp(completed_at) if completed_at else None))
+
+
+def _filtered(items, query):
+    """
+    Returns the items matching the field:gte:value conditions of the filter parameter.
+    Timestamps are compared as their ISO 8601 strings.
+    """
+    for condition in (query.get('filter') or '').split(','):
+        name, operator, value = (condition.split(':', 2) + ['', ''])[:3]
+        if operator == 'gte':
+            items = [item for item in items if (item.get(name) or '') >= value]
+    return items
+
+
+def _page(items, query):
+    """
+    Returns the items of the requested page and the pagination element.
+    """
+    page_size = int(query.get('pageSize', 100))
+    page_number = int(query.get('pageNumber', 1))
+    selected = items[(page_number - 1) * page_size:page_number * page_size]
+    pagination = '<pagination {0}/>'.format(_attributes(pageNumber=page_number, pageSize=page_size, totalAvailable=len(items)))
+    return selected, pagination
+
+
+class MockTableauHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True # keep-alive responses are two writes, avoid the delayed ACK stall
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body='', content_type='application/xml'):
+        payload = TS_RESPONSE.format(body).encode('utf-8') if body else b''
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_error(self, status, code, summary, detail):
+        self._send(status, '<error {0}><summary>{1}</summary><detail>{2}</detail></error>'.format(_attributes(code=code), summary, detail))
+
+    def _send_file(self, size, signature, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        self.wfile.write(signature[:size])
+        block = b'\0' * WRITE_SIZE
+        remaining = size - min(size, len(signature))
+        while remaining > 0:
+            self.wfile.write(block[:min(remaining, WRITE_SIZE)])
+            remaining -= WRITE_SIZE
+
+    def _route(self, method):
+        mock = self.server.mock
+        url = urlparse(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        path = re.sub(r'^/api/[\d.]+', '', url.path.rstrip('/'))
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        if url.path == '/_stats' and method == 'GET':
+            with mock.lock:
+                stats = dict(mock.stats)
+            payload = json.dumps(stats).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        if url.path == '/_stats/reset' and method == 'POST':
+            with mock.lock:
+                mock.stats.clear()
+            return self._send(204)
+
+        if mock.latency:
+            time.sleep(mock.latency)
+
+        if url.path == '/api/metadata/graphql' and method == 'POST':
+            mock.count('metadata')
+            if self.headers.get('x-tableau-auth') not in mock.tokens:
+                return self._send_error(401, '401002', 'Unauthorized Access', 'Invalid authentication credentials were provided.')
+            luid = (json.loads(body.decode('utf-8')).get('variables') or {}).get('luid')
+            workbooks = []
+            with mock.lock:
+                if luid in mock.workbooks:
+                    refreshed = mock.extract_refreshed_at(luid)
+                    workbooks.append({'updatedAt': mock.workbooks[luid]['updatedAt'], 'upstreamDatasources': [],
+                                      'embeddedDatasources': [{'extractLastRefreshTime': _timestamp(refreshed)}]})
+            payload = json.dumps({'data': {'workbooks': workbooks}}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        if path == '/auth/signin' and method == 'POST':
+            mock.count('signin')
+            token = uuid.uuid4().hex
+            with mock.lock:
+                mock.tokens.add(token)
+            return self._send(200, '<credentials {0}><site {1}/><user {2}/></credentials>'.format(
+                _attributes(token=token), _attributes(id=mock.site['id'], contentUrl=mock.site['contentUrl']),
+                _attributes(id=str(uuid.uuid5(uuid.NAMESPACE_DNS, 'benchmark')))))
+        token = self.headers.get('x-tableau-auth')
+        if path == '/auth/signout' and method == 'POST':
+            mock.count('signout')
+            with mock.lock:
+                mock.tokens.discard(token)
+            return self._send(204)
+        if token not in mock.tokens:
+            mock.count('unauthorized')
+            return self._send_error(401, '401002', 'Unauthorized Access', 'Invalid authentication credentials were provided.')
+
+        match = re.match(r'^/sites/([^/]+)(/.*)?$', path)
+        if not match or match.group(1) != mock.site['id']:
+            mock.count('not_found')
+            return self._send_error(404, '404000', 'Resource Not Found', 'Site {0} could not be found.'.format(match.group(1) if match else ''))
+        path = match.group(2) or ''
+
+        if path == '' and method == 'GET':
+            mock.count('site')
+            return self._send(200, '<site {0}/>'.format(_attributes(**mock.site)))
+
+        if path == '/workbooks' and method == 'GET':
+            mock.count('workbooks')
+            items, pagination = _page(_filtered(list(mock.workbooks.values()), query), query)
+            return self._send(200, pagination + '<workbooks>{0}</workbooks>'.format(''.join(
+                '<workbook {0}><project {1}/></workbook>'.format(_attributes(**workbook), _attributes(**mock.project)) for workbook in items)))
+        if path == '/views' and method == 'GET':
+            mock.count('views')
+            items, pagination = _page(list(mock.views.values()), query)
+            return self._send(200, pagination + '<views>{0}</views>'.format(''.join(
+                '<view {0}><workbook {1}/><project {2}/></view>'.format(
+                    _attributes(id=view['id'], name=view['name'], contentUrl=view['contentUrl']),
+                    _attributes(id=view['workbook_id']), _attributes(id=mock.project['id'])) for view in items)))
+        if path == '/projects' and method == 'GET':
+            mock.count('projects')
+            created = _timestamp(mock.created)
+            items, pagination = _page(_filtered([dict(mock.project, createdAt=created, updatedAt=created)], query), query)
+            return self._send(200, pagination + '<projects>{0}</projects>'.format(''.join(
+                '<project {0}/>'.format(_attributes(**project)) for project in items)))
+        if path == '/datasources' and method == 'GET':
+            mock.count('datasources')
+            items, pagination = _page(_filtered(list(mock.datasources.values()), query), query)
+            return self._send(200, pagination + '<datasources>{0}</datasources>'.format(''.join(
+                '<datasource {0}><project {1}/></datasource>'.format(_attributes(**datasource), _attributes(**mock.project)) for datasource in items)))
+
+        match = re.match(r'^/workbooks/([^/]+)$', path)
+        if match and method == 'GET':
+            workbook = mock.workbooks.get(match.group(1))
+            if workbook is None:
+                mock.count('not_found')
+                return self._send_error(404, '404006', 'Resource Not Found', 'Workbook {0} could not be found.'.format(match.group(1)))
+            mock.count('workbook')
+            return self._send(200, '<workbook {0}><project {1}/></workbook>'.format(_attributes(**workbook), _attributes(**mock.project)))
+        match = re.match(r'^/views/([^/]+)$', path)
+        if match and method == 'GET':
+            view = mock.views.get(match.group(1))
+            if view is None:
+                mock.count('not_found')
+                return self._send_error(404, '404011', 'Resource Not Found', 'View {0} could not be found.'.format(match.group(1)))
+            mock.count('view')
+            return self._send(200, '<view {0}><workbook {1}/><project {2}/></view>'.format(
+                _attributes(id=view['id'], name=view['name'], contentUrl=view['contentUrl']),
+                _attributes(id=view['workbook_id']), _attributes(id=mock.project['id'])))
+
+        match = re.match(r'^/workbooks/([^/]+)/(refresh|pdf)$', path)
+        if match and match.group(1) not in mock.workbooks:
+            mock.count('not_found')
+            return self._send_error(404, '404006', 'Resource Not Found', 'Workbook {0} could not be found.'.format(match.group(1)))
+        if match and match.group(2) == 'refresh' and method == 'POST':
+            mock.count('refresh')
+            job = mock.submit_refresh(match.group(1))
+            if job is None:
+                return self._send_error(409, '409093', 'Resource Conflict', 'Job for this workbook is already queued or running.')
+            with mock.lock:
+                return self._send(202, mock.job_xml(job))
+        if match and match.group(2) == 'pdf' and method == 'GET':
+            mock.count('workbook_pdf')
+            return self._send_file(mock.pdf_size, PDF_SIGNATURE, 'application/pdf')
+
+        if path == '/webhooks' and method == 'POST':
+            mock.count('create_webhook')
+            webhook = ET.fromstring(body).find('webhook')
+            source = webhook.find('webhook-source')
+            destination = webhook.find('webhook-destination/webhook-destination-http')
+            event = source[0].tag[len('webhook-source-event-'):] if source is not None and len(source) else ''
+            # webhook-source-event-workbook-refresh-succeeded -> WorkbookRefreshSucceeded
+            event = ''.join(word.capitalize() for word in event.split('-'))
+            webhook_id = str(uuid.uuid4())
+            with mock.lock:
+                mock.webhooks[webhook_id] = {'id': webhook_id, 'name': webhook.get('name'), 'event': event, 'url': destination.get('url')}
+            return self._send(201, '<webhook {0}><webhook-source>{1}</webhook-source><webhook-destination>'
+                              '<webhook-destination-http {2}/></webhook-destination></webhook>'.format(
+                                  _attributes(id=webhook_id, name=webhook.get('name')), ET.tostring(source[0]).decode('utf-8'),
+                                  _attributes(method='POST', url=destination.get('url'))))
+        match = re.match(r'^/webhooks/([^/]+)$', path)
+        if match and method == 'DELETE':
+            mock.count('delete_webhook')
+            with mock.lock:
+                if mock.webhooks.pop(match.group(1), None) is None:
+                    return self._send_error(404, '404043', 'Resource Not Found', 'Webhook {0} could not be found.'.format(match.group(1)))
+            return self._send(204)
+
+        if path == '/jobs' and method == 'GET':
+            mock.count('jobs')
+            with mock.lock:
+                # Newest first, like the server's default order and sort=createdAt:desc
+                jobs = list(reversed(mock.jobs.values()))
+                for condition in (query.get('filter') or '').split(','):
+                    if condition.startswith('createdAt:gte:'):
+                        jobs = [job for job in jobs if _timestamp(job['created']) >= condition[len('createdAt:gte:'):]]
+                items, pagination = _page(jobs, query)
+                return self._send(200, pagination + '<backgroundJobs>{0}</backgroundJobs>'.format(''.join(mock.background_job_xml(job) for job in items)))
+        match = re.match(r'^/jobs/([^/]+)$', path)
+        if match:
+            job = mock.jobs.get(match.group(1))
+            if job is None:
+                mock.count('not_found')
+                return self._send_error(404, '404005', 'Resource Not Found', 'Job {0} could not be found.'.format(match.group(1)))
+            with mock.lock:
+                if method == 'PUT':
+                    mock.stats['cancel_job'] += 1
+                    if job['cancelled_at'] is None and mock.job_state(job)[1] is None:
+                        job['progress'] = mock.job_state(job)[0]
+                        job['cancelled_at'] = time.time()
+                    return self._send(200, mock.job_xml(job))
+                mock.stats['job'] += 1
+                return self._send(200, mock.job_xml(job))
+
+        match = re.match(r'^/views/([^/]+)/(image|pdf)$', path)
+        if match and method == 'GET':
+            if match.group(1) not in mock.views:
+                mock.count('not_found')
+                return self._send_error(404, '404011', 'Resource Not Found', 'View {0} could not be found.'.format(match.group(1)))
+            if match.group(2) == 'image':
+                mock.count('view_image')
+                return self._send_file(mock.image_size, PNG_SIGNATURE, 'image/png')
+            mock.count('view_pdf')
+            return self._send_file(mock.pdf_size, PDF_SIGNATURE, 'application/pdf')
+
+        mock.count('not_found')
+        return self._send_error(404, '404000', 'Resource Not Found', 'Unknown endpoint {0} {1}'.format(method, self.path))
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_POST(self):
+        self._route('POST')
+
+    def do_PUT(self):
+        self._route('PUT')
+
+    def do_DELETE(self):
+        self._route('DELETE')
+
+
+def start_server(host='127.0.0.1', port=0, **kwargs):
+    """
+    Starts the stand-in server on a background thread.
+
+    :param kwargs: passed to MockTableau
+    :return: the running server. server.mock is its MockTableau, server.server_port its port.
+             Call server.shutdown() to stop it
+    """
+    server = ThreadingHTTPServer((host, port), MockTableauHandler)
+    server.daemon_threads = True
+    server.mock = MockTableau(**kwargs)
+    threading.Thread(target=server.serve_forever, name='tableau-mock', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Tableau REST API stand-in server')
+    parser.add_argument('--workbooks', type=int, default=10, help='number of workbooks on the site')
+    parser.add_argument('--views-per-workbook', type=int, default=5)
+    parser.add_argument('--refresh-seconds', type=float, default=2.0, help='seconds an extract refresh runs')
+    parser.add_argument('--conflicts', type=int, default=0, help='409 responses per workbook before a refresh is accepted')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--image-size', type=int, default=100 * 1024, help='bytes of a view image')
+    parser.add_argument('--pdf-size', type=int, default=1024 * 1024, help='bytes of a PDF export')
+    parser.add_argument('--datasources', type=int, default=2, help='number of published data sources')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+
+    server = start_server(args.host, args.port, workbooks=args.workbooks, views_per_workbook=args.views_per_workbook,
+                          refresh_seconds=args.refresh_seconds, conflicts=args.conflicts, latency=args.latency,
+                          image_size=args.image_size, pdf_size=args.pdf_size, datasources=args.datasources)
+    print('Mock Tableau serving site {0} on http://{1}:{2}'.format(server.mock.site['id'], args.host, server.server_port))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
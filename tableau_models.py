@@ -0,0 +1,158 @@
+#!/bin/env python3
+
+# Contains methods used to build and parse XML
+import xml.etree.ElementTree as ET
+
+# Qualified (Clark notation) names of the Tableau REST API elements, so lookups skip the
+# namespace prefix translation of find('t:...', namespaces=...)
+TABLEAU_NS = '{http://tableau.com/api}'
+TS_RESPONSE = TABLEAU_NS + 'tsResponse'
+CREDENTIALS = TABLEAU_NS + 'credentials'
+SITE = TABLEAU_NS + 'site'
+USER = TABLEAU_NS + 'user'
+JOB = TABLEAU_NS + 'job'
+WORKBOOK = TABLEAU_NS + 'workbook'
+PROJECT = TABLEAU_NS + 'project'
+FILE_UPLOAD = TABLEAU_NS + 'fileUpload'
+PAGINATION = TABLEAU_NS + 'pagination'
+WEBHOOK = TABLEAU_NS + 'webhook'
+ERROR = TABLEAU_NS + 'error'
+DETAIL = TABLEAU_NS + 'detail'
+SCHEMA_LOCATION = '{http://www.w3.org/2001/XMLSchema-instance}schemaLocation'
+
+# Body of the requests that need an empty tsRequest, serialized once
+EMPTY_TS_REQUEST = ET.tostring(ET.Element('tsRequest'))
+
+
+class Model(dict):
+    """
+    Base of the parsed Tableau responses: a plain dictionary holding only the keys that were
+    parsed, so it serializes, compares and can be updated like the dictionaries the parsers used
+    to return. FIELDS lists (attribute, key) pairs whose values can also be read as attributes
+    (None when the key was not parsed). The empty __slots__ only keeps instances from carrying
+    an attribute __dict__ next to the dictionary itself.
+    """
+    __slots__ = ()
+    FIELDS = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._ATTRIBUTES = {attribute: key for attribute, key in cls.FIELDS}
+
+    def __getattr__(self, attribute):
+        key = self._ATTRIBUTES.get(attribute)
+        if key is None:
+            raise AttributeError("'{0}' object has no attribute '{1}'".format(type(self).__name__, attribute))
+        return self.get(key)
+
+    def __repr__(self):
+        return '{0}({1})'.format(type(self).__name__, dict.__repr__(self))
+
+    def to_dict(self):
+        return dict(self)
+
+
+class Job(Model):
+    """
+    A background job, as returned by query_job and query_jobs.
+    finish_code is None while the job runs, then '0' (success), '1' (error) or '2' (cancelled).
+    """
+    FIELDS = (('id', 'id'), ('mode', 'mode'), ('type', 'type'), ('status', 'status'), ('progress', 'progress'),
+              ('created_at', 'created_at'), ('updated_at', 'updated_at'), ('completed_at', 'completed_at'),
+              ('finish_code', 'finish_code'), ('workbook_id', 'workbook_id'), ('name', 'name'),
+              ('schema_location', 'schema_location'))
+    __slots__ = ()
+
+    # backgroundJob status -> job finishCode
+    FINISH_CODES = {'Success': '0', 'Failed': '1', 'Cancelled': '2'}
+
+    @classmethod
+    def from_response(cls, xml_text):
+        """
+        Parses a Query Job response. The workbook is only looked up inside the job element.
+        A response without a job element gives an empty (falsy) Job.
+        """
+        xml_response = ET.fromstring(xml_text)
+        job = xml_response.find(JOB)
+        if job is None:
+            job = next(xml_response.iter(JOB), None)
+        if job is None:
+            return cls()
+        record = cls(schema_location=xml_response.get(SCHEMA_LOCATION),
+                     id=job.get('id'), mode=job.get('mode'), type=job.get('type'), progress=job.get('progress'),
+                     created_at=job.get('createdAt'), updated_at=job.get('updatedAt'), completed_at=job.get('completedAt'),
+                     finish_code=job.get('finishCode'))
+        workbook = next(job.iter(WORKBOOK), None)
+        if workbook is not None:
+            record.update(workbook_id=workbook.get('id'), name=workbook.get('name'))
+        return record
+
+    @classmethod
+    def from_background_job(cls, background_job):
+        """
+        Converts a backgroundJob of the job list (element or attribute dictionary).
+        """
+        finish_code = cls.FINISH_CODES.get(background_job.get('status'))
+        return cls(id=background_job.get('id'), mode=None, type=background_job.get('jobType'), status=background_job.get('status'),
+                   progress='100' if finish_code is not None else None,
+                   created_at=background_job.get('createdAt'), updated_at=background_job.get('startedAt'),
+                   completed_at=background_job.get('endedAt'), finish_code=finish_code)
+
+
+class Credentials(Model):
+    """
+    The credentials of a signin response.
+    """
+    FIELDS = (('token', 'token'), ('site_id', 'site_id'), ('site_content_url', 'site_content_url'), ('user_id', 'user_id'))
+    __slots__ = ()
+
+    @classmethod
+    def from_response(cls, xml_text):
+        credentials = ET.fromstring(xml_text).find(CREDENTIALS)
+        site = credentials.find(SITE)
+        user = credentials.find(USER)
+        return cls(token=credentials.get('token'), site_id=site.get('id'), site_content_url=site.get('contentUrl'),
+                   user_id=user.get('id') if user is not None else None)
+
+
+class Site(Model):
+    """
+    A site, as returned by query_site. Keys are the XML attribute names, so .attrib and
+    .get(attribute) answer like the site element query_site used to return.
+    """
+    FIELDS = (('id', 'id'), ('name', 'name'), ('content_url', 'contentUrl'), ('admin_mode', 'adminMode'),
+              ('state', 'state'), ('status_reason', 'statusReason'))
+    __slots__ = ()
+
+    @property
+    def attrib(self):
+        return self
+
+    @classmethod
+    def from_response(cls, xml_text):
+        """
+        :return: Site, or None if the response holds no site element
+        """
+        site = ET.fromstring(xml_text).find(SITE)
+        if site is None:
+            return None
+        return cls(site.attrib)
+
+
+class Workbook(Model):
+    """
+    A workbook element, such as the one returned by publish_workbook. Keys are the XML attribute
+    names, plus project_id and project_name.
+    """
+    FIELDS = (('id', 'id'), ('name', 'name'), ('content_url', 'contentUrl'), ('webpage_url', 'webpageUrl'),
+              ('show_tabs', 'showTabs'), ('size', 'size'), ('created_at', 'createdAt'), ('updated_at', 'updatedAt'),
+              ('project_id', 'project_id'), ('project_name', 'project_name'))
+    __slots__ = ()
+
+    @classmethod
+    def from_element(cls, element):
+        record = cls(element.attrib)
+        project = element.find(PROJECT)
+        if project is not None:
+            record.update(project_id=project.get('id'), project_name=project.get('name'))
+        return record
@@ -0,0 +1,240 @@
+#!/bin/env python3
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import requests  # Contains methods used to make HTTP requests
+
+from cs_logging import logmsg
+
+# Newest extract refresh of a workbook's embedded and published data sources
+EXTRACT_REFRESH_QUERY = """
+query workbookVersion($luid: String) {
+  workbooks(filter: {luid: $luid}) {
+    updatedAt
+    embeddedDatasources { extractLastRefreshTime }
+    upstreamDatasources { extractLastRefreshTime }
+  }
+}
+"""
+
+
+class RenderCache:
+    """
+    Local disk cache of rendered view images and view/workbook PDFs.
+
+    Entries are keyed by server, site, view or workbook ID, format, orientation, page type,
+    size and filters, and stored with the content version of the workbook they were rendered
+    from: its updatedAt plus the latest extract refresh of its data sources, read from the
+    Metadata API. An entry is only returned while the workbook still has that version, so an
+    unchanged export is read from disk instead of being rendered again. The version of a
+    workbook is looked up at most once every version_ttl seconds.
+
+    Only workbooks whose data sources are all extracts are cached: the data behind a live
+    connection changes without changing the workbook. Without the Metadata API live and
+    extract workbooks cannot be told apart, so nothing is cached.
+
+    The cache is bounded to max_bytes; the least recently used entries are evicted first.
+
+    Attach it to a Tableau object (tableau.render_cache = RenderCache(tableau)) and
+    query_view_image, query_view_pdf, download_workbook_pdf and export_views use it.
+    """
+
+    def __init__(self, tableau, directory=None, max_bytes=1024 ** 3, version_ttl=60):
+        """
+        Construct a new RenderCache object.
+
+        :param tableau: signed in Tableau object used to look up workbook versions
+        :param directory: cache directory (default ~/.tableau_render_cache)
+        :param max_bytes: total size of the cached exports
+        :param version_ttl: seconds a looked up workbook version is trusted without asking the server again
+        """
+        self.tableau = tableau
+        self.directory = directory or os.path.join(os.path.expanduser('~'), '.tableau_render_cache')
+        self.max_bytes = max_bytes
+        self.version_ttl = version_ttl
+        self.hits = 0
+        self.misses = 0
+        self._versions = {} # workbook_id -> (version, looked up at)
+        self._metadata_api = True
+        self._lock = threading.Lock()
+        # Exports can hold confidential data, keep them private like the token cache
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        os.chmod(self.directory, 0o700)
+        self.connection = sqlite3.connect(os.path.join(self.directory, 'index.sqlite'), check_same_thread=False)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, file TEXT, size INTEGER, version TEXT, last_used REAL);
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+            CREATE TABLE IF NOT EXISTS views (
+                server TEXT, site_id TEXT, id TEXT, workbook_id TEXT, PRIMARY KEY (server, site_id, id));
+        """)
+
+    def close(self):
+        self.connection.close()
+
+    def key(self, kind, object_id, orientation=None, page_type=None, width=None, height=None, filters=None):
+        """
+        Returns the cache key of an export.
+
+        :param kind: 'view_image', 'view_pdf' or 'workbook_pdf'
+        """
+        parts = [self.tableau.server, self.tableau.site_id, kind, object_id, orientation, page_type, width, height,
+                 sorted((str(name), str(value)) for name, value in (filters or {}).items())]
+        return hashlib.sha256(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+
+    def _view_workbook(self, view_id):
+        """
+        Returns the ID of the workbook of a view. Views never move between workbooks, so the
+        answer is kept in the cache index.
+        """
+        server, site_id = self.tableau.server, self.tableau.site_id
+        with self._lock:
+            row = self.connection.execute("SELECT workbook_id FROM views WHERE server = ? AND site_id = ? AND id = ?",
+                                          (server, site_id, view_id)).fetchone()
+        if row:
+            return row[0]
+        view = self.tableau.query_view(view_id)
+        if view is None or not view.get('workbook_id'):
+            return None
+        with self._lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO views VALUES (?, ?, ?, ?)", (server, site_id, view_id, view['workbook_id']))
+        return view['workbook_id']
+
+    def _lookup_version(self, workbook_id):
+        """
+        Returns updatedAt|latest extract refresh of a workbook, or None if it cannot be cached
+        (live connections, unknown workbook, failed query or no Metadata API). Caching is only
+        switched off for good when the Metadata API itself is missing or disabled (404, 401, 403).
+        """
+        if not self._metadata_api:
+            return None
+        try:
+            result = self.tableau.query_metadata(EXTRACT_REFRESH_QUERY, {'luid': workbook_id}, raise_for_status=True)
+        except requests.exceptions.HTTPError as err:
+            if err.response is not None and err.response.status_code in (401, 403, 404):
+                logmsg("Metadata API unavailable, exports are not cached")
+                self._metadata_api = False
+            return None
+        except requests.exceptions.RequestException:
+            return None
+        if result is None: # GraphQL errors, only this lookup is affected
+            return None
+        workbooks = result.get('workbooks') or []
+        if not workbooks or not workbooks[0].get('updatedAt'):
+            return None
+        datasources = (workbooks[0].get('embeddedDatasources') or []) + (workbooks[0].get('upstreamDatasources') or [])
+        refresh_times = [datasource.get('extractLastRefreshTime') for datasource in datasources]
+        # A data source without an extract refresh time is a live connection
+        if not refresh_times or not all(refresh_times):
+            return None
+        return '{0}|{1}'.format(workbooks[0]['updatedAt'], max(refresh_times))
+
+    def version(self, kind, object_id):
+        """
+        Returns the content version of the workbook an export is rendered from, or None if it
+        cannot be looked up (the export is then neither read from nor written to the cache).
+        """
+        workbook_id = object_id if kind == 'workbook_pdf' else self._view_workbook(object_id)
+        if workbook_id is None:
+            return None
+        with self._lock:
+            cached = self._versions.get(workbook_id)
+        if cached is not None and time.time() - cached[1] < self.version_ttl:
+            return cached[0]
+        version = self._lookup_version(workbook_id)
+        if version is not None:
+            with self._lock:
+                self._versions[workbook_id] = (version, time.time())
+        return version
+
+    def get_path(self, key, version):
+        """
+        Returns the file of a cached export of the given version, or None.
+        """
+        with self._lock, self.connection:
+            row = self.connection.execute("SELECT file, version FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] != version or not os.path.exists(row[0]):
+                self.misses += 1
+                return None
+            self.connection.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+        return row[0]
+
+    def get(self, key, version):
+        """
+        Returns the content of a cached export of the given version, or None.
+        """
+        path = self.get_path(key, version)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as cached_file:
+                return cached_file.read()
+        except OSError: # evicted by another process in the meantime
+            return None
+
+    def put(self, key, version, content=None, source_path=None):
+        """
+        Stores an export, given either its content or the file it was saved to, then evicts
+        least recently used entries until the cache fits in max_bytes.
+        """
+        size = len(content) if content is not None else os.path.getsize(source_path)
+        if size > self.max_bytes:
+            return
+        path = os.path.join(self.directory, key)
+        temp_file = "{0}.{1}.{2}.tmp".format(path, os.getpid(), threading.get_ident())
+        try:
+            file_descriptor = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(file_descriptor, 'wb') as cache_file:
+                if content is not None:
+                    cache_file.write(content)
+                else:
+                    with open(source_path, 'rb') as source_file:
+                        while True:
+                            chunk = source_file.read(1024 * 1024)
+                            if not chunk:
+                                break
+                            cache_file.write(chunk)
+            os.replace(temp_file, path)
+        except OSError as err:
+            logmsg("WARNING: Unable to write render cache: {}".format(err))
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            return
+
+        with self._lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", (key, path, size, version, time.time()))
+            total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            evicted = []
+            for old_key, old_path, old_size in self.connection.execute("SELECT key, file, size FROM entries WHERE key != ? ORDER BY last_used", (key,)):
+                if total <= self.max_bytes:
+                    break
+                evicted.append((old_key, old_path))
+                total -= old_size
+            self.connection.executemany("DELETE FROM entries WHERE key = ?", [(old_key,) for old_key, old_path in evicted])
+        for old_key, old_path in evicted:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    def clear(self):
+        """
+        Removes every cached export
+        """
+        with self._lock, self.connection:
+            paths = [row[0] for row in self.connection.execute("SELECT file FROM entries")]
+            self.connection.execute("DELETE FROM entries")
+            self._versions.clear()
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
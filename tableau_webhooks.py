@@ -0,0 +1,231 @@
+#!/bin/env python3
+
+import json
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests  # Contains methods used to make HTTP requests
+
+from cs_logging import logmsg
+
+# Webhook events signalling the end of a workbook extract refresh
+REFRESH_SUCCEEDED = 'WorkbookRefreshSucceeded'
+REFRESH_FAILED = 'WorkbookRefreshFailed'
+REFRESH_EVENTS = (REFRESH_SUCCEEDED, REFRESH_FAILED)
+
+# Seconds between the fallback query_job checks of a refresh waiting on webhook events
+WEBHOOK_FALLBACK_INTERVAL = 900
+
+
+class WebhookReceiver:
+    """
+    Local HTTP endpoint receiving Tableau webhook events.
+
+    register() creates webhooks on a site that post to this receiver. Every event that arrives
+    wakes the threads blocked in wait() for its resource, and is passed to the callbacks added
+    with add_callback(). Pass the receiver to Tableau.refresh_tableau_extract(s) and a refresh
+    completes as soon as its event arrives; query_job is then only checked every
+    WEBHOOK_FALLBACK_INTERVAL seconds in case an event is lost.
+
+    Tableau does not sign webhook requests, so the URL path holds a random secret and posts to
+    any other path are rejected.
+
+        with WebhookReceiver(public_url='https://batchhost.example.com:8443') as receiver:
+            receiver.register(tableau)
+            tableau.refresh_tableau_extract(workbook_id, receiver=receiver)
+    """
+
+    def __init__(self, host='0.0.0.0', port=0, public_url=None, max_events=1000):
+        """
+        Construct a new WebhookReceiver object.
+
+        :param host, port: address to listen on (port 0 picks a free port)
+        :param public_url: scheme, host and port under which Tableau Server reaches this receiver,
+                           e.g. behind a TLS terminating proxy (default http://<hostname>:<port>)
+        :param max_events: number of received events kept for late waiters
+        """
+        self.host = host
+        self.port = port
+        self.public_url = public_url
+        self.max_events = max_events
+        self.path = '/tableau-webhook/' + secrets.token_urlsafe(16)
+        self.events = [] # received events, oldest first
+        self.webhooks = [] # (tableau, webhook_id) created by register()
+        self._callbacks = []
+        self._condition = threading.Condition()
+        self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    @property
+    def url(self):
+        """
+        URL the webhooks post to
+        """
+        base_url = self.public_url or 'http://{0}:{1}'.format(self.host if self.host not in ('', '0.0.0.0') else _hostname(), self.port)
+        return base_url.rstrip('/') + self.path
+
+    def start(self):
+        """
+        Starts listening on a background thread
+        """
+        if self._server is not None:
+            return
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                if self.path != receiver.path:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                try:
+                    event = json.loads(body.decode('utf-8'))
+                except ValueError:
+                    self.send_response(400)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                # Answer first, Tableau does not need to wait for the callbacks
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                receiver.receive(event)
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_port
+        threading.Thread(target=self._server.serve_forever, name='tableau-webhooks', daemon=True).start()
+        logmsg("Listening for Tableau webhook events on port {0}".format(self.port))
+
+    def stop(self):
+        """
+        Deletes the registered webhooks and stops listening
+        """
+        self.unregister()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def register(self, tableau, events=REFRESH_EVENTS, name=None):
+        """
+        Process: Creates a webhook on the signed in site of tableau for each event, posting to this receiver
+
+        :param tableau: signed in Tableau object
+        :param events: webhook event names, by default the refresh succeeded and failed events
+        :param name: prefix of the webhook names (default tableau-py-<port>)
+        :return: True if every webhook was created
+        """
+        ok = True
+        for event in events:
+            webhook_name = '{0}-{1}'.format(name or 'tableau-py-{0}'.format(self.port), event)
+            webhook = tableau.create_webhook(webhook_name, event, self.url)
+            if webhook is None:
+                ok = False
+            else:
+                self.webhooks.append((tableau, webhook['id']))
+        return ok
+
+    def unregister(self):
+        """
+        Process: Deletes the webhooks created by register()
+        """
+        while self.webhooks:
+            tableau, webhook_id = self.webhooks.pop()
+            try:
+                tableau.delete_webhook(webhook_id)
+            except requests.exceptions.RequestException as err:
+                logmsg("ERROR: Unable to delete webhook {0}: {1}".format(webhook_id, err))
+
+    def add_callback(self, callback):
+        """
+        Calls callback(event) on every event received, on the receiver's request thread.
+        The event is the webhook payload (resource, event_type, resource_name, resource_luid,
+        site_luid, created_at) plus received_at, the local time it arrived.
+        """
+        self._callbacks.append(callback)
+
+    def receive(self, event):
+        """
+        Records an event and wakes the waiting threads. Called for every webhook request.
+        """
+        logmsg("Received Tableau webhook event {0} for {1}".format(event.get('event_type'), event.get('resource_name') or event.get('resource_luid')))
+        with self._condition:
+            # Strictly increasing, so waiters passing the last event back as since miss none
+            received_at = max(time.time(), self.events[-1]['received_at'] + 1e-6) if self.events else time.time()
+            event = dict(event, received_at=received_at)
+            self.events.append(event)
+            del self.events[:-self.max_events]
+            self._condition.notify_all()
+        for callback in list(self._callbacks):
+            try:
+                callback(event)
+            except Exception as err: # a failing callback must not stop the others
+                logmsg("ERROR: Tableau webhook callback failed: {0}".format(err))
+
+    def wait(self, resource_luids, since=0, timeout=None, events=REFRESH_EVENTS):
+        """
+        Process: Blocks until an event for one of the resources arrives
+
+        :param resource_luids: ID or collection of IDs of the resources (workbooks for refresh events)
+        :param since: only return events received after this time.time() value
+        :param timeout: seconds to wait at most (None waits indefinitely)
+        :param events: event names to wait for
+        :return: the first matching event received after since, or None if the timeout expires
+        """
+        if isinstance(resource_luids, str):
+            resource_luids = (resource_luids,)
+        resource_luids = set(resource_luids)
+        deadline = time.time() + timeout if timeout is not None else None
+
+        def find():
+            for event in self.events:
+                if event['received_at'] > since and event.get('resource_luid') in resource_luids and event.get('event_type') in events:
+                    return event
+            return None
+
+        with self._condition:
+            event = find()
+            while event is None:
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+                event = find()
+            return event
+
+
+def _hostname():
+    import socket
+    return socket.getfqdn()
+
+
+def send_event(url, event_type, resource_luid, resource_name='', site_luid='', resource='WORKBOOK'):
+    """
+    Process: Posts a webhook event the way Tableau Server does, to test receivers offline
+
+    :return: status code of the receiver's response
+    """
+    payload = {
+        'resource': resource,
+        'event_type': event_type,
+        'resource_name': resource_name,
+        'site_luid': site_luid,
+        'resource_luid': resource_luid,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+    return requests.post(url, json=payload, timeout=30).status_code